@@ -0,0 +1,128 @@
+"""Calendar sync throughput for a backlog of unsynced time entries.
+
+Seeds a throwaway SQLite database with one user's unsynced entries and
+pushes them to an in-memory Calendar API (``sync.tests.fake_gcal``), first
+with one ``sync_entries_batch`` call per entry (what one Django-Q task per
+entry does) and then with a single ``drain_unsynced_entries`` run. A last
+run edits every entry again and drains it into the same calendar, where
+the stored event ids and etags let each write skip the iCalUID lookup.
+Reports entries/s, HTTP round trips and database queries for each.
+
+    python benchmarks/bench_calendar_drain.py [entries]
+"""
+
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import warnings
+from datetime import timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+os.environ["DJANGO_DATA_DIR"] = tempfile.mkdtemp(prefix="bench_drain_")
+os.environ.setdefault("DJANGO_DEBUG", "False")
+
+import django  # noqa: E402
+
+django.setup()
+warnings.filterwarnings("ignore", message="No directory at")
+for name in ("sync", "django-q", "django_q"):
+    logging.getLogger(name).setLevel(logging.CRITICAL)
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from sync.models import (  # noqa: E402
+    ColorResolver, EntityColorMapping, TogglProject, TogglTag, TogglTimeEntry, TogglWorkspace,
+)
+from sync.tasks import drain_unsynced_entries, sync_entries_batch  # noqa: E402
+from sync.tests.fake_gcal import FakeCalendarAPI  # noqa: E402
+
+
+def _setup(entries):
+    call_command("migrate", verbosity=0)
+    user = User.objects.create_user("bench")
+    user.credentials.gauth_credentials_json = json.dumps({
+        "token": "t", "refresh_token": "r", "client_id": "c", "client_secret": "s",
+        "expiry": (timezone.now() + timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    })
+    user.credentials.save()
+    ws = TogglWorkspace.objects.create(user=user, toggl_id=1, name="WS")
+    for i in range(10):
+        TogglProject.objects.create(user=user, toggl_id=10 + i, workspace=ws, name=f"Project {i}")
+        TogglTag.objects.create(user=user, toggl_id=20 + i, workspace=ws, name=f"tag{i}")
+    EntityColorMapping.objects.create(
+        user=user, entity_type="project", entity_id=10,
+        entity_name="Project 0", color_name="Banana", process_order=1,
+    )
+
+    start = timezone.now() - timedelta(days=30)
+    TogglTimeEntry.objects.bulk_create([
+        TogglTimeEntry(
+            user=user, toggl_id=1000 + i, description=f"Task {i}",
+            start_time=start + timedelta(hours=i), end_time=start + timedelta(hours=i, minutes=45),
+            project_id=10 + i % 10, tag_ids=[20 + i % 10],
+        )
+        for i in range(entries)
+    ])
+    return user
+
+
+def _run(label, user, fn, api=None):
+    if api is None:
+        api = FakeCalendarAPI()
+        creds = user.credentials
+        creds.google_calendar_id = api.add_calendar()
+        creds.save()
+        TogglTimeEntry.objects.filter(user=user).update(
+            synced=False, google_event_id="", google_event_etag=""
+        )
+    else:
+        # Edit everything already in ``api``; stored event ids are kept
+        TogglTimeEntry.objects.filter(user=user).update(synced=False, description="Edited")
+        api.http_calls = 0
+    ColorResolver.invalidate(user.id)
+
+    queries = []
+
+    def count_query(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    with patch("sync.services.gcal.build_calendar_service", api.build_service), \
+            connection.execute_wrapper(count_query):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+
+    count = TogglTimeEntry.objects.filter(user=user, synced=True).count()
+    print(
+        f"{label:<24} {count:5d} synced  {count / elapsed:8.0f} entries/s  "
+        f"{api.http_calls:5d} HTTP calls  {len(queries):6d} queries"
+    )
+    return elapsed, api
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    user = _setup(entries)
+    ids = list(TogglTimeEntry.objects.filter(user=user).values_list("toggl_id", flat=True))
+    print(f"{entries} unsynced entries")
+
+    before, _ = _run(
+        "task per entry", user, lambda: [sync_entries_batch(user.id, [i]) for i in ids]
+    )
+    after, api = _run("drain_unsynced_entries", user, lambda: drain_unsynced_entries(user.id))
+    _run("drain, stored event ids", user, lambda: drain_unsynced_entries(user.id), api=api)
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Live-update latency for small users while one user runs a big backfill.
+
+Simulates one Django-Q worker on a virtual clock. User 1 starts a
+5,000-entry backfill drain and an apply-colors fan-out (one task per
+entry); meanwhile small users send live timer updates at random. Job costs
+are modelled on ``bench_calendar_drain.py`` (about 4 ms per entry in a
+batched drain, one Calendar round trip per color task).
+
+``fifo`` is the single Django-Q queue: the backfill is one task and every
+task runs in arrival order. ``fair`` feeds the same workload through the
+real ``sync.dispatch`` queue (DispatchJob rows in a throwaway SQLite
+database, ``claim_next_job`` picking the order), with the backfill drained
+in ``SYNC_DRAIN_BATCH`` slices. Reports live-update latency for the small
+users and when the big user's work finished.
+
+    python benchmarks/bench_fair_dispatch.py [small_users] [updates_per_user]
+"""
+
+import heapq
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import warnings
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+os.environ["DJANGO_DATA_DIR"] = tempfile.mkdtemp(prefix="bench_dispatch_")
+os.environ.setdefault("DJANGO_DEBUG", "False")
+
+import django  # noqa: E402
+
+django.setup()
+warnings.filterwarnings("ignore", message="No directory at")
+for name in ("sync", "django-q", "django_q"):
+    logging.getLogger(name).setLevel(logging.CRITICAL)
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+
+from sync.dispatch import BULK, LIVE, claim_next_job, dispatch, dispatch_many  # noqa: E402
+from sync.models import DispatchJob  # noqa: E402
+
+BACKFILL_ENTRIES = 5000
+COLOR_TASKS = 2000
+PER_ENTRY = 0.004
+COLOR_COST = 0.15
+LIVE_COST = 0.12
+BIG_USER = 1
+
+
+def _workload(small_users, updates_per_user, seed=7):
+    """[(arrival, user id, kind)] sorted by arrival; the big user starts at 0."""
+    rng = random.Random(seed)
+    arrivals = [(0.0, BIG_USER, "backfill"), (0.0, BIG_USER, "colors")]
+    horizon = 300.0
+    for user_id in range(2, small_users + 2):
+        for _ in range(updates_per_user):
+            arrivals.append((rng.uniform(0, horizon), user_id, "live"))
+    return sorted(arrivals)
+
+
+def _fifo(workload):
+    # One queue in arrival order, the backfill as a single task
+    tasks = []
+    for arrival, user_id, kind in workload:
+        if kind == "backfill":
+            tasks.append((arrival, user_id, kind, BACKFILL_ENTRIES * PER_ENTRY))
+        elif kind == "colors":
+            tasks.extend((arrival, user_id, kind, COLOR_COST) for _ in range(COLOR_TASKS))
+        else:
+            tasks.append((arrival, user_id, kind, LIVE_COST))
+    heap = [
+        (arrival, i, user_id, kind, cost)
+        for i, (arrival, user_id, kind, cost) in enumerate(tasks)
+    ]
+    heapq.heapify(heap)
+
+    clock = 0.0
+    latencies = []
+    big_done = 0.0
+    while heap:
+        arrival, _, user_id, kind, cost = heapq.heappop(heap)
+        clock = max(clock, arrival) + cost
+        if kind == "live":
+            latencies.append(clock - arrival)
+        else:
+            big_done = clock
+    return latencies, big_done
+
+
+def _fair(workload):
+    DispatchJob.objects.all().delete()
+    batch = settings.SYNC_DRAIN_BATCH
+    pending = list(workload)
+    clock = 0.0
+    latencies = []
+    big_done = 0.0
+
+    while pending or DispatchJob.objects.exists():
+        while pending and pending[0][0] <= clock:
+            arrival, user_id, kind = pending.pop(0)
+            if kind == "backfill":
+                dispatch("backfill", BACKFILL_ENTRIES, user_id=user_id, lane=BULK)
+            elif kind == "colors":
+                dispatch_many("colors", ((i,) for i in range(COLOR_TASKS)), user_id=user_id)
+            else:
+                dispatch("live", arrival, user_id=user_id, lane=LIVE)
+
+        job = claim_next_job()
+        if job is None:
+            clock = pending[0][0]
+            continue
+
+        if job.func == "backfill":
+            remaining = job.args[0]
+            clock += min(remaining, batch) * PER_ENTRY
+            if remaining > batch:
+                # What drain_unsynced_entries does after each slice
+                dispatch("backfill", remaining - batch, user_id=job.user_id, lane=BULK)
+            else:
+                big_done = max(big_done, clock)
+        elif job.func == "colors":
+            clock += COLOR_COST
+            big_done = max(big_done, clock)
+        else:
+            clock += LIVE_COST
+            latencies.append(clock - job.args[0])
+        job.delete()
+    return latencies, big_done
+
+
+def _report(label, latencies, big_done):
+    latencies.sort()
+    p50 = statistics.median(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{label:<5} small users: p50 {p50:7.2f} s  p99 {p99:7.2f} s  max {latencies[-1]:7.2f} s"
+        f"   big user done at {big_done:6.1f} s"
+    )
+
+
+def main():
+    small_users = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    updates = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    call_command("migrate", verbosity=0)
+    for user_id in range(1, small_users + 2):
+        User.objects.create(id=user_id, username=f"user{user_id}")
+
+    workload = _workload(small_users, updates)
+    print(
+        f"1 user: {BACKFILL_ENTRIES}-entry backfill + {COLOR_TASKS} color tasks; "
+        f"{small_users} users x {updates} live updates over 5 minutes; 1 worker"
+    )
+    _report("fifo", *_fifo(workload))
+    with patch("sync.dispatch.async_task"):
+        _report("fair", *_fair(workload))
+
+
+if __name__ == "__main__":
+    main()
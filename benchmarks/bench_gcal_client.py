@@ -0,0 +1,58 @@
+"""Per-task Google Calendar client construction cost.
+
+Compares building the Calendar client with ``discovery.build`` (reads and
+parses the bundled discovery document every time) against
+``build_calendar_service`` (document parsed once per process).
+
+    python benchmarks/bench_gcal_client.py [iterations]
+"""
+
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+import django  # noqa: E402
+
+django.setup()
+logging.getLogger("googleapiclient.discovery_cache").setLevel(logging.ERROR)
+
+from google.oauth2.credentials import Credentials  # noqa: E402
+from googleapiclient.discovery import build  # noqa: E402
+
+from sync.services.gcal import build_calendar_service  # noqa: E402
+
+
+def _time(label, fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / iterations * 1000:8.3f} ms/task")
+    return elapsed
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    creds = Credentials(token="bench", refresh_token="bench", client_id="x",
+                        client_secret="y", token_uri="https://oauth2.googleapis.com/token")
+
+    before = _time(
+        "discovery.build()",
+        lambda: build("calendar", "v3", credentials=creds),
+        iterations,
+    )
+    after = _time(
+        "build_calendar_service()",
+        lambda: build_calendar_service(creds),
+        iterations,
+    )
+    print(f"speedup: {before / after:.1f}x over {iterations} tasks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Webhook writes against a SQLite file while the worker syncs entries.
+
+Runs the same workload twice, each in a fresh process and database: once
+with SQLite defaults (rollback journal, synchronous=FULL, deferred
+transactions) and once with the tuned settings from ``config/settings.py``
+(WAL, synchronous=NORMAL, mmap, larger cache, BEGIN IMMEDIATE).
+
+The workload is several threads posting inline-mode webhooks through the
+Django test client, while another thread keeps draining the user's
+unsynced entries to an in-memory Calendar API, as the qcluster worker does.
+Reports webhook latency, failed requests and entries synced by the worker.
+
+    python benchmarks/bench_sqlite_tuning.py [requests] [threads]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+PROFILES = {
+    "untuned": {
+        "SQLITE_JOURNAL_MODE": "DELETE",
+        "SQLITE_SYNCHRONOUS": "FULL",
+        "SQLITE_MMAP_SIZE": "0",
+        "SQLITE_CACHE_SIZE": "-2000",
+        "SQLITE_TRANSACTION_MODE": "",
+    },
+    "tuned": {},
+}
+
+
+def _child(profile, requests, threads):
+    import logging
+    import statistics
+    import threading
+    import time
+    import warnings
+    from datetime import timedelta
+    from unittest.mock import patch
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+    import django
+
+    django.setup()
+    warnings.filterwarnings("ignore", message="No directory at")
+    for name in ("sync", "django-q", "django_q", "django.request"):
+        logging.getLogger(name).setLevel(logging.CRITICAL)
+
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test import Client, override_settings
+    from django.utils import timezone
+
+    from sync.models import TogglProject, TogglTimeEntry, TogglWorkspace
+    from sync.tasks import drain_unsynced_entries
+    from sync.tests.fake_gcal import FakeCalendarAPI
+
+    call_command("migrate", verbosity=0)
+    user = User.objects.create_user("bench")
+    user.credentials.gauth_credentials_json = json.dumps({
+        "token": "t", "refresh_token": "r", "client_id": "c", "client_secret": "s",
+        "expiry": (timezone.now() + timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    })
+    api = FakeCalendarAPI()
+    user.credentials.google_calendar_id = api.add_calendar()
+    user.credentials.save()
+    ws = TogglWorkspace.objects.create(user=user, toggl_id=1, name="WS", webhook_token="bench-token")
+    TogglProject.objects.create(user=user, toggl_id=10, workspace=ws, name="Project")
+
+    latencies = []
+    failures = []
+    synced = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+    done = threading.Event()
+
+    def body(entry_id):
+        return json.dumps({
+            "payload": {
+                "id": entry_id, "description": "Work", "project_id": 10, "tag_ids": [],
+                "start": "2026-02-27T10:00:00Z", "stop": "2026-02-27T11:00:00Z",
+            },
+            "metadata": {"action": "updated"},
+            "created_at": "2026-02-27T11:00:01Z",
+        })
+
+    def webhooks():
+        client = Client(raise_request_exception=False)
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            start = time.perf_counter()
+            resp = client.post(
+                "/webhook/toggl/bench-token/", body(1000 + i), content_type="application/json"
+            )
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed * 1000)
+                if resp.status_code != 200:
+                    failures.append(resp.status_code)
+        connection.close()
+
+    def worker():
+        while not done.is_set():
+            try:
+                synced.append(drain_unsynced_entries(user.id, batch_size=100))
+            except Exception:
+                synced.append(0)
+            time.sleep(0.05)
+        connection.close()
+
+    with override_settings(WEBHOOK_INGEST_MODE="inline", ALLOWED_HOSTS=["*"]), \
+            patch("sync.services.gcal.build_calendar_service", api.build_service):
+        drainer = threading.Thread(target=worker)
+        drainer.start()
+        pool = [threading.Thread(target=webhooks) for _ in range(threads)]
+        started = time.perf_counter()
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        wall = time.perf_counter() - started
+        done.set()
+        drainer.join()
+
+    latencies.sort()
+    p50 = statistics.median(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    entries = TogglTimeEntry.objects.count()
+    print(
+        f"{profile:<8} p50 {p50:7.2f} ms  p99 {p99:8.2f} ms  {requests / wall:6.0f} req/s  "
+        f"{len(failures):4d} failed  worker synced {sum(synced)}/{entries}"
+    )
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--profile":
+        _child(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+        return
+
+    requests = sys.argv[1] if len(sys.argv) > 1 else "1000"
+    threads = sys.argv[2] if len(sys.argv) > 2 else "8"
+    print(f"{requests} webhooks, {threads} concurrent clients, 1 draining worker")
+    for profile, overrides in PROFILES.items():
+        env = {
+            **os.environ,
+            **overrides,
+            "DJANGO_DATA_DIR": tempfile.mkdtemp(prefix=f"bench_sqlite_{profile}_"),
+            "DJANGO_DEBUG": "False",
+        }
+        subprocess.run(
+            [sys.executable, __file__, "--profile", profile, requests, threads],
+            env=env, check=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Connection setup cost of Toggl metadata calls.
+
+Runs sequential ``get_workspaces`` calls, each through a new ``TogglService``
+as the tasks and admin actions do, against a local keep-alive stub server.
+Compares a fresh session per service (the old behaviour, emulated by dropping
+the pool before each call) with the process-wide pooled session, and counts
+the TCP connections the server accepted.
+
+    python benchmarks/bench_toggl_sessions.py [calls]
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.test import override_settings  # noqa: E402
+
+from sync.services.toggl import TogglService, close_sessions  # noqa: E402
+from sync.tests.stub_toggl import StubToggl  # noqa: E402
+
+
+def _run(label, calls, fresh_session):
+    server = StubToggl.start()
+    close_sessions()
+    try:
+        with override_settings(TOGGL_API_ENDPOINT=server.url, TOGGL_RATE_LIMIT=0):
+            start = time.perf_counter()
+            for _ in range(calls):
+                if fresh_session:
+                    close_sessions()
+                TogglService("bench-token").get_workspaces()
+            elapsed = time.perf_counter() - start
+    finally:
+        close_sessions()
+        server.stop()
+    print(
+        f"{label:<24} {server.connections:4d} connections  "
+        f"{elapsed / calls * 1000:7.3f} ms/call"
+    )
+    return server.connections, elapsed
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    before, before_time = _run("session per service", calls, fresh_session=True)
+    after, after_time = _run("pooled session", calls, fresh_session=False)
+    print(
+        f"{before - after} fewer connection setups over {calls} calls "
+        f"({before_time / after_time:.1f}x faster on loopback, no TLS)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Webhook view latency under concurrent load, inline vs. inbox ingestion.
+
+Posts time-entry webhooks through the Django test client from several
+threads against a throwaway SQLite database and reports p50/p99 latency for
+``WEBHOOK_INGEST_MODE=inline`` (parse, dedupe check, upsert and enqueue in the
+request) and ``inbox`` (one insert into the webhook inbox).
+
+    python benchmarks/bench_webhook_ingest.py [requests] [threads]
+"""
+
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+os.environ["DJANGO_DATA_DIR"] = tempfile.mkdtemp(prefix="bench_webhook_")
+os.environ.setdefault("DJANGO_DEBUG", "False")
+
+import django  # noqa: E402
+
+django.setup()
+warnings.filterwarnings("ignore", message="No directory at")
+for name in ("sync", "django-q", "django_q", "django.request"):
+    logging.getLogger(name).setLevel(logging.CRITICAL)
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+
+from sync.models import TogglProject, TogglTag, TogglWorkspace  # noqa: E402
+
+
+def _setup():
+    call_command("migrate", verbosity=0)
+    user = User.objects.create_user("bench")
+    ws = TogglWorkspace.objects.create(user=user, toggl_id=1, name="WS", webhook_token="bench-token")
+    TogglProject.objects.create(user=user, toggl_id=10, workspace=ws, name="Project")
+    TogglTag.objects.create(user=user, toggl_id=20, workspace=ws, name="tag")
+
+
+def _body(entry_id):
+    return json.dumps({
+        "payload": {
+            "id": entry_id, "description": "Work", "project_id": 10, "tag_ids": [20],
+            "start": "2026-02-27T10:00:00Z", "stop": "2026-02-27T11:00:00Z",
+        },
+        "metadata": {"action": "updated"},
+        "created_at": "2026-02-27T11:00:01Z",
+    })
+
+
+def _run(mode, requests, threads):
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        client = Client(raise_request_exception=False)
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            body = _body(1000 + i % 200)
+            start = time.perf_counter()
+            resp = client.post("/webhook/toggl/bench-token/", body, content_type="application/json")
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed * 1000)
+                if resp.status_code != 200:
+                    failures.append(resp.status_code)
+        connection.close()
+
+    with override_settings(WEBHOOK_INGEST_MODE=mode, ALLOWED_HOSTS=["*"]):
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        started = time.perf_counter()
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        wall = time.perf_counter() - started
+
+    latencies.sort()
+    p50 = statistics.median(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{mode:<8} p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  "
+        f"{requests / wall:7.0f} req/s  {len(failures)} failed"
+    )
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    _setup()
+    print(f"{requests} webhooks, {threads} concurrent clients")
+    _run("inline", requests, threads)
+    _run("inbox", requests, threads)
+
+
+if __name__ == "__main__":
+    main()
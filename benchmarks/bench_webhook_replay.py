@@ -0,0 +1,106 @@
+"""Replaying a webhook backlog: one event at a time vs. bulk ingestion.
+
+Builds a JSON-lines backlog of time-entry events for one user (creates,
+later updates and redeliveries, as Toggl resends after an outage) and
+applies it to a throwaway SQLite database twice: once through
+``handle_time_entry_event`` per event (what posting each to the webhook view
+does) and once through ``ingest_webhook_events``. Reports entries/s and
+database queries for each.
+
+    python benchmarks/bench_webhook_replay.py [events]
+"""
+
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+os.environ["DJANGO_DATA_DIR"] = tempfile.mkdtemp(prefix="bench_replay_")
+os.environ.setdefault("DJANGO_DEBUG", "False")
+
+import django  # noqa: E402
+
+django.setup()
+warnings.filterwarnings("ignore", message="No directory at")
+for name in ("sync", "django-q", "django_q"):
+    logging.getLogger(name).setLevel(logging.CRITICAL)
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+
+from sync.models import TogglTimeEntry  # noqa: E402
+from sync.tasks import ingest_webhook_events  # noqa: E402
+from sync.webhooks import handle_time_entry_event  # noqa: E402
+
+
+def _backlog(events):
+    """Creates for events // 2 entries, then updates, with 10% redelivered."""
+    base = datetime(2026, 2, 1, tzinfo=dt_timezone.utc)
+    entries = max(1, events // 2)
+    backlog = []
+    for i in range(events):
+        entry_id = 1000 + i % entries
+        action = "created" if i < entries else "updated"
+        at = base + timedelta(minutes=i)
+        payload = {
+            "event_id": i,
+            "payload": {
+                "id": entry_id, "description": f"Task {i}", "at": at.isoformat(),
+                "start": (base + timedelta(hours=i % entries)).isoformat(),
+                "stop": (base + timedelta(hours=i % entries, minutes=45)).isoformat(),
+                "project_id": None, "tag_ids": [],
+            },
+            "metadata": {"action": action},
+        }
+        backlog.append(payload)
+        if i % 10 == 0:
+            backlog.append(payload)
+    return backlog
+
+
+def _run(user, fn):
+    TogglTimeEntry.objects.filter(user=user).delete()
+    queries = []
+
+    def count_query(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    with patch("sync.dispatch.async_task"), connection.execute_wrapper(count_query):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+    return elapsed, len(queries), TogglTimeEntry.objects.filter(user=user).count()
+
+
+def main():
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    call_command("migrate", verbosity=0)
+    user = User.objects.create_user("bench")
+    backlog = _backlog(events)
+    raw = "\n".join(json.dumps(event) for event in backlog)
+    print(f"{len(backlog)} events ({events} distinct) for {events // 2} entries")
+
+    results = [
+        _run(user, lambda: [handle_time_entry_event(user, e) for e in backlog]),
+        _run(user, lambda: ingest_webhook_events(user, raw)),
+    ]
+    for label, (elapsed, queries, rows) in zip(("per event", "bulk ingest"), results):
+        print(
+            f"{label:<12} {rows:5d} entries stored  {len(backlog) / elapsed:8.0f} entries/s  "
+            f"{queries:6d} queries"
+        )
+    print(f"speedup: {results[0][0] / results[1][0]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Database queries per webhook request, with and without the token cache.
+
+Posts inbox-mode time-entry webhooks through the Django test client against
+a throwaway SQLite database, once with ``WEBHOOK_TOKEN_CACHE_SIZE=0`` (every
+request looks its workspace up by token) and once with the default cache.
+Counts every query the requests run and reports queries per request and
+req/s. Inbox wake-ups are suppressed so only the view's own queries count.
+
+    python benchmarks/bench_webhook_tokens.py [requests]
+"""
+
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+os.environ["DJANGO_DATA_DIR"] = tempfile.mkdtemp(prefix="bench_tokens_")
+os.environ.setdefault("DJANGO_DEBUG", "False")
+
+import django  # noqa: E402
+
+django.setup()
+warnings.filterwarnings("ignore", message="No directory at")
+for name in ("sync", "django-q", "django_q", "django.request"):
+    logging.getLogger(name).setLevel(logging.CRITICAL)
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+
+from sync.models import TogglWorkspace, WebhookInboxItem  # noqa: E402
+from sync.webhooks import WebhookTokenCache  # noqa: E402
+
+
+def _setup():
+    call_command("migrate", verbosity=0)
+    user = User.objects.create_user("bench")
+    TogglWorkspace.objects.create(
+        user=user, toggl_id=1, name="WS", webhook_token="bench-token", webhook_secret="",
+    )
+
+
+def _body(entry_id):
+    return json.dumps({
+        "payload": {
+            "id": entry_id, "description": "Work", "project_id": 10, "tag_ids": [20],
+            "start": "2026-02-27T10:00:00Z", "stop": "2026-02-27T11:00:00Z",
+        },
+        "metadata": {"action": "updated"},
+        "created_at": "2026-02-27T11:00:01Z",
+    })
+
+
+def _run(label, requests, cache_size):
+    WebhookTokenCache.invalidate()
+    WebhookInboxItem.objects.all().delete()
+    client = Client()
+    queries = []
+
+    def count_query(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    with override_settings(
+        WEBHOOK_INGEST_MODE="inbox", WEBHOOK_TOKEN_CACHE_SIZE=cache_size, ALLOWED_HOSTS=["*"],
+    ), patch("sync.webhooks.async_task"), connection.execute_wrapper(count_query):
+        start = time.perf_counter()
+        for i in range(requests):
+            resp = client.post(
+                "/webhook/toggl/bench-token/", _body(1000 + i), content_type="application/json"
+            )
+            assert resp.status_code == 200, resp.status_code
+        elapsed = time.perf_counter() - start
+
+    print(
+        f"{label:<14} {len(queries):6d} queries  {len(queries) / requests:4.2f} per request  "
+        f"{requests / elapsed:6.0f} req/s"
+    )
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    _setup()
+    print(f"{requests} inbox webhooks")
+    _run("no token cache", requests, 0)
+    _run("token cache", requests, settings.WEBHOOK_TOKEN_CACHE_SIZE)
+
+
+if __name__ == "__main__":
+    main()
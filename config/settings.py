@@ -77,16 +77,70 @@ TEMPLATES = [
 WSGI_APPLICATION = "config.wsgi.application"
 
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": DATA_DIR / "db.sqlite3",
-        "OPTIONS": {
-            "timeout": 30,
-        },
-    }
+# SQLite is shared by the gunicorn threads and the qcluster process. WAL lets
+# readers run alongside the one writer, synchronous=NORMAL only syncs at WAL
+# checkpoints, and IMMEDIATE transactions take the write lock when they begin,
+# so waiting writers queue on the busy timeout instead of failing with
+# "database is locked" when a read transaction tries to upgrade.
+# An empty value leaves the SQLite default in place.
+SQLITE_TIMEOUT = float(os.getenv("SQLITE_TIMEOUT", "30"))
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))
+# Negative values are KiB, positive values are pages
+SQLITE_CACHE_SIZE = os.getenv("SQLITE_CACHE_SIZE", "-32000")
+SQLITE_TRANSACTION_MODE = os.getenv("SQLITE_TRANSACTION_MODE", "IMMEDIATE")
+
+SQLITE_PRAGMAS = {
+    "journal_mode": SQLITE_JOURNAL_MODE,
+    "synchronous": SQLITE_SYNCHRONOUS,
+    "mmap_size": SQLITE_MMAP_SIZE,
+    "cache_size": SQLITE_CACHE_SIZE,
 }
 
+# "sqlite" (single host, default) or "postgresql" for multi-user deployments
+DATABASE_ENGINE = os.getenv("DATABASE_ENGINE", "sqlite").lower()
+
+if DATABASE_ENGINE in ("postgres", "postgresql"):
+    DATABASE_ENGINE = "postgresql"
+    # psycopg connection pool per process; 0 keeps persistent connections
+    # via CONN_MAX_AGE instead (Django does not allow both)
+    POSTGRES_POOL_SIZE = int(os.getenv("POSTGRES_POOL_SIZE", "0"))
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv("POSTGRES_DB", "togglsync"),
+            "USER": os.getenv("POSTGRES_USER", "togglsync"),
+            "PASSWORD": os.getenv("POSTGRES_PASSWORD", ""),
+            "HOST": os.getenv("POSTGRES_HOST", "localhost"),
+            "PORT": os.getenv("POSTGRES_PORT", "5432"),
+            "CONN_MAX_AGE": 0 if POSTGRES_POOL_SIZE else int(os.getenv("DB_CONN_MAX_AGE", "60")),
+            "CONN_HEALTH_CHECKS": True,
+            # PgBouncer in transaction mode cannot keep server-side cursors open
+            "DISABLE_SERVER_SIDE_CURSORS": os.getenv("POSTGRES_PGBOUNCER", "False").lower()
+            in ("true", "1", "yes"),
+            "OPTIONS": (
+                {"pool": {"min_size": 1, "max_size": POSTGRES_POOL_SIZE}}
+                if POSTGRES_POOL_SIZE else {}
+            ),
+        }
+    }
+else:
+    DATABASE_ENGINE = "sqlite"
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": DATA_DIR / "db.sqlite3",
+            "OPTIONS": {
+                "timeout": SQLITE_TIMEOUT,
+                "transaction_mode": SQLITE_TRANSACTION_MODE or None,
+                "init_command": ";".join(
+                    f"PRAGMA {name}={value}" for name, value in SQLITE_PRAGMAS.items() if value
+                ),
+            },
+        }
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -131,6 +185,27 @@ LOGIN_REDIRECT_URL = "/admin/"
 
 TOGGL_API_ENDPOINT = "https://api.track.toggl.com/api/v9"
 TOGGL_WEBHOOK_API_ENDPOINT = "https://api.track.toggl.com/webhooks/api/v1"
+# Parallel Toggl requests per API token during metadata sync; they still
+# share the token's rate-limit bucket below, so beyond the burst the pool
+# only overlaps slow responses
+TOGGL_MAX_CONCURRENCY = int(os.getenv("TOGGL_MAX_CONCURRENCY", "4"))
+# Client-side token bucket per API token (Toggl asks for ~1 request/second);
+# 0 disables local rate limiting
+TOGGL_RATE_LIMIT = float(os.getenv("TOGGL_RATE_LIMIT", "1"))
+TOGGL_RATE_BURST = int(os.getenv("TOGGL_RATE_BURST", "4"))
+TOGGL_CONNECT_TIMEOUT = float(os.getenv("TOGGL_CONNECT_TIMEOUT", "5"))
+TOGGL_READ_TIMEOUT = float(os.getenv("TOGGL_READ_TIMEOUT", "30"))
+# Retries for 429 (any method) and 5xx/network errors (idempotent methods)
+TOGGL_MAX_RETRIES = int(os.getenv("TOGGL_MAX_RETRIES", "4"))
+TOGGL_RETRY_BASE_DELAY = float(os.getenv("TOGGL_RETRY_BASE_DELAY", "1"))
+# Longest single backoff; the wait happens inside a Django-Q task, so keep
+# it well below Q_CLUSTER["timeout"]
+TOGGL_RETRY_MAX_DELAY = float(os.getenv("TOGGL_RETRY_MAX_DELAY", "10"))
+# Time-entry backfill: history read on first run, date window per request,
+# and minutes between scheduled catch-up runs
+TOGGL_BACKFILL_DAYS = int(os.getenv("TOGGL_BACKFILL_DAYS", "90"))
+TOGGL_BACKFILL_WINDOW_DAYS = int(os.getenv("TOGGL_BACKFILL_WINDOW_DAYS", "30"))
+TOGGL_BACKFILL_INTERVAL = int(os.getenv("TOGGL_BACKFILL_INTERVAL", "60"))
 
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
@@ -142,6 +217,10 @@ GOOGLE_CALENDAR_SCOPES = [
     "https://www.googleapis.com/auth/calendar.app.created",
 ]
 
+# Refresh Google access tokens this many seconds before they expire, so a
+# long batch sync does not run into an expired token halfway through
+GOOGLE_TOKEN_REFRESH_MARGIN = int(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN", "300"))
+
 
 LOGGING = {
     "version": 1,
@@ -193,12 +272,50 @@ LOGGING = {
 }
 
 
+# The ORM broker keeps the task queue in the same database. SQLite has one
+# writer, so more workers only add lock waits there.
 Q_CLUSTER = {
     "name": "togglsync",
-    "workers": 1,
+    "workers": int(os.getenv("Q_WORKERS", "4" if DATABASE_ENGINE == "postgresql" else "1")),
     "timeout": 60,
     "retry": 120,
     "orm": "default",
 }
 
+# "inline" parses and upserts inside the webhook request; "inbox" stores the
+# raw body and returns, leaving the work to the drain_webhook_inbox task
+WEBHOOK_INGEST_MODE = os.getenv("WEBHOOK_INGEST_MODE", "inline")
+# Seconds between drain tasks queued by webhook requests (per process)
+WEBHOOK_INBOX_WAKE_INTERVAL = float(os.getenv("WEBHOOK_INBOX_WAKE_INTERVAL", "1"))
+WEBHOOK_INBOX_BATCH = int(os.getenv("WEBHOOK_INBOX_BATCH", "200"))
+# Seconds one drain task runs before handing over (below Q_CLUSTER timeout),
+# and runs before a failing inbox item is left as a dead letter
+WEBHOOK_INBOX_TIME_BUDGET = float(os.getenv("WEBHOOK_INBOX_TIME_BUDGET", "40"))
+WEBHOOK_INBOX_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_INBOX_MAX_ATTEMPTS", "3"))
+WEBHOOK_INBOX_RETENTION_DAYS = int(os.getenv("WEBHOOK_INBOX_RETENTION_DAYS", "7"))
+# Webhook token -> workspace routes kept per process, and for how many
+# seconds; saves in this process invalidate immediately, others after the TTL
+WEBHOOK_TOKEN_CACHE_SIZE = int(os.getenv("WEBHOOK_TOKEN_CACHE_SIZE", "1024"))
+WEBHOOK_TOKEN_CACHE_TTL = float(os.getenv("WEBHOOK_TOKEN_CACHE_TTL", "60"))
+# Largest body accepted by the bulk webhook endpoint (bytes)
+WEBHOOK_BULK_MAX_BYTES = int(os.getenv("WEBHOOK_BULK_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# Minimum seconds between calendar syncs of one entry: the first edit syncs
+# right away, further edits within the window collapse into one follow-up
+SYNC_COALESCE_WINDOW = float(os.getenv("SYNC_COALESCE_WINDOW", "5"))
+
+# Fair-share dispatch (sync.dispatch): seconds one dispatcher task runs jobs
+# before handing over (below Q_CLUSTER timeout), seconds between dispatcher
+# wake-ups per process, drain pages a job pushes before yielding to other
+# users, and runs before a failing job is given up
+DISPATCH_TIME_BUDGET = float(os.getenv("DISPATCH_TIME_BUDGET", "40"))
+DISPATCH_WAKE_INTERVAL = float(os.getenv("DISPATCH_WAKE_INTERVAL", "1"))
+DISPATCH_SLICE_BATCHES = int(os.getenv("DISPATCH_SLICE_BATCHES", "1"))
+DISPATCH_MAX_ATTEMPTS = int(os.getenv("DISPATCH_MAX_ATTEMPTS", "3"))
+
+# Unsynced entries pushed per batched calendar write while draining a user
+SYNC_DRAIN_BATCH = int(os.getenv("SYNC_DRAIN_BATCH", "500"))
+
 SYNC_VALIDATE_INTERVAL = int(os.getenv("SYNC_VALIDATE_INTERVAL", "10"))
+# Entries per user looked up in Google on each validation run (rotating)
+SYNC_VALIDATE_WINDOW = int(os.getenv("SYNC_VALIDATE_WINDOW", "200"))
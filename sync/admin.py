@@ -7,13 +7,13 @@ from django.contrib import admin, messages
 from django.db.models import Max
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
-from django_q.tasks import async_task
 from google.oauth2.credentials import Credentials
 
 from .models import (
-    UserCredentials, EntityColorMapping, TogglTimeEntry,
+    UserCredentials, EntityColorMapping, TogglTimeEntry, ColorResolver,
     TogglOrganization, TogglProject, TogglTag, TogglWorkspace,
 )
+from .dispatch import BULK, dispatch, dispatch_many
 from .services import TogglAPIError, TogglService
 from .tasks import sync_toggl_metadata_for_user
 
@@ -326,35 +326,29 @@ class ColorMappingAdmin(UserScopedAdmin):
     def apply_mappings(self, request, queryset):
         user = request.user
 
-        all_mappings = EntityColorMapping.objects.filter(user=user).order_by(
-            "-process_order"
-        )
-
-        if not all_mappings.exists():
+        if not EntityColorMapping.objects.filter(user=user).exists():
             messages.warning(request, "No mappings configured")
             return
 
-        total_tasks = 0
+        resolver = ColorResolver.for_user(user)
+        entries = TogglTimeEntry.objects.filter(
+            user=user, synced=True, pending_deletion=False
+        ).values_list("id", "project_id", "tag_ids")
 
-        for mapping in all_mappings:
-            matching_entries = mapping.find_matching_entries()
-
-            if not matching_entries.exists():
-                continue
+        def colored():
+            for entry_id, project_id, tag_ids in entries.iterator(chunk_size=1000):
+                color_id = resolver.resolve(project_id, tag_ids)
+                if color_id:
+                    yield entry_id, color_id
 
-            for entry in matching_entries:
-                async_task(
-                    "sync.tasks.apply_color_to_entry",
-                    entry.id,
-                    mapping.get_color_id(),
-                    task_name=f"apply_color_{entry.id}",
-                )
-                total_tasks += 1
+        # Bulk lane: a big fan-out must not delay other users' live syncs
+        total_tasks = dispatch_many(
+            "sync.tasks.apply_color_to_entry", colored(), user_id=user.id, lane=BULK
+        )
 
         messages.success(
             request,
-            f"Scheduled {total_tasks} tasks to apply color mappings. "
-            f"High priority (high process_order) mappings will apply last.",
+            f"Scheduled {total_tasks} tasks to apply color mappings.",
         )
 
     def get_form(self, request, obj=None, **kwargs):
@@ -638,6 +632,7 @@ class EntryAdmin(UserScopedAdmin):
     readonly_fields = [
         "toggl_id",
         "gcal_event_id",
+        "google_event_id",
         "description",
         "start_time",
         "end_time",
@@ -654,17 +649,16 @@ class EntryAdmin(UserScopedAdmin):
 
     @admin.action(description="Sync selected entries to Google Calendar")
     def sync_to_google_calendar(self, request, queryset):
-        count = 0
-        for entry in queryset.filter(user=request.user):
-            async_task(
-                "sync.tasks.process_time_entry_event",
-                entry.user_id,
-                entry.toggl_id,
-                task_name=f"manual_sync_{entry.toggl_id}",
+        entry_ids = list(
+            queryset.filter(user=request.user).values_list("toggl_id", flat=True)
+        )
+        if entry_ids:
+            dispatch(
+                "sync.tasks.sync_entries_batch", request.user.id, entry_ids,
+                user_id=request.user.id, lane=BULK,
             )
-            count += 1
 
-        messages.info(request, f"Queued {count} entries for sync.")
+        messages.info(request, f"Queued {len(entry_ids)} entries for sync.")
 
     def short_description(self, obj):
         desc = obj.description or "(no description)"
@@ -23,12 +23,41 @@ class SyncConfig(AppConfig):
             Schedule.objects.update_or_create(
                 name="validate_synced_events",
                 defaults={
-                    "func": "sync.tasks.validate_synced_events",
+                    "func": "sync.tasks.queue_event_validation",
                     "schedule_type": Schedule.MINUTES,
                     "minutes": getattr(settings, 'SYNC_VALIDATE_INTERVAL', 10),
                 },
             )
 
+            Schedule.objects.update_or_create(
+                name="backfill_time_entries",
+                defaults={
+                    "func": "sync.tasks.queue_time_entry_backfill",
+                    "schedule_type": Schedule.MINUTES,
+                    "minutes": getattr(settings, 'TOGGL_BACKFILL_INTERVAL', 60),
+                },
+            )
+
+            # Safety net for inbox items whose drain task was never queued
+            Schedule.objects.update_or_create(
+                name="drain_webhook_inbox",
+                defaults={
+                    "func": "sync.tasks.drain_webhook_inbox",
+                    "schedule_type": Schedule.MINUTES,
+                    "minutes": 1,
+                },
+            )
+
+            # Safety net for dispatch jobs whose dispatcher was never queued
+            Schedule.objects.update_or_create(
+                name="run_dispatcher",
+                defaults={
+                    "func": "sync.dispatch.run_dispatcher",
+                    "schedule_type": Schedule.MINUTES,
+                    "minutes": 1,
+                },
+            )
+
             # Clean up old schedules
             Schedule.objects.filter(name="process_unsynced_entries").delete()
 
@@ -0,0 +1,215 @@
+"""Time-entry backfill: pull entries from the Toggl API into TogglTimeEntry.
+
+Webhooks only deliver changes while the service is up. The backfill seeds
+history by start-date windows and, once a high-water mark is recorded on
+``UserCredentials.toggl_entries_synced_at``, catches up with ``since`` so
+later runs only fetch entries modified after the previous one.
+"""
+
+import logging
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Case, Q, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import TogglTimeEntry
+from .services import TogglService
+from .utils import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+# Toggl only honours ``since`` up to about three months back
+SINCE_MAX_AGE = timedelta(days=89)
+# Re-read a little before the mark to cover clock skew and in-flight writes
+SINCE_OVERLAP = timedelta(minutes=5)
+
+ENTRY_FIELDS = ["description", "start_time", "end_time", "project_id", "tag_ids"]
+
+
+def _rfc3339(dt) -> str:
+    return dt.astimezone(dt_timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class BackfillStats:
+    def __init__(self):
+        self.fetched = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.deleted = 0
+
+    def __str__(self):
+        return (
+            f"{self.fetched} fetched, {self.created} created, {self.updated} updated, "
+            f"{self.unchanged} unchanged, {self.deleted} deleted"
+        )
+
+
+class TimeEntryBackfill:
+    """Fetch a user's time entries and upsert them in bulk."""
+
+    def __init__(self, user, toggl: TogglService):
+        self.user = user
+        self.toggl = toggl
+        self.stats = BackfillStats()
+        # toggl ids whose calendar event needs a (re)sync
+        self.changed_ids = []
+
+    def run(self, days: int | None = None, full: bool = False) -> BackfillStats:
+        """Catch up from the high-water mark, or backfill ``days`` of history.
+
+        ``full`` ignores the mark. Without a usable mark the last
+        ``days`` (default TOGGL_BACKFILL_DAYS) are read in date windows.
+        """
+        creds = self.user.credentials
+        started_at = timezone.now()
+        mark = None if full else creds.toggl_entries_synced_at
+
+        if mark and started_at - mark < SINCE_MAX_AGE:
+            since = int((mark - SINCE_OVERLAP).timestamp())
+            self.apply(self.toggl.get_time_entries(since=since))
+        else:
+            days = days or settings.TOGGL_BACKFILL_DAYS
+            start = mark - SINCE_OVERLAP if mark else started_at - timedelta(days=days)
+            self.backfill_range(start, started_at)
+
+        creds.toggl_entries_synced_at = started_at
+        creds.save(update_fields=["toggl_entries_synced_at"])
+        return self.stats
+
+    def backfill_range(self, start, end):
+        """Read entries started in [start, end) one date window at a time."""
+        window = timedelta(days=settings.TOGGL_BACKFILL_WINDOW_DAYS)
+        window_start = start
+        while window_start < end:
+            window_end = min(window_start + window, end)
+            entries = self.toggl.get_time_entries(
+                start_date=_rfc3339(window_start), end_date=_rfc3339(window_end)
+            )
+            self.apply(entries)
+            window_start = window_end
+
+    def apply(self, entries: list[dict]):
+        """Upsert one page of API entries; deleted ones are flagged for removal."""
+        self.stats.fetched += len(entries)
+        live = {}
+        versions = {}
+        deleted = set()
+        for entry in entries:
+            if entry.get("server_deleted_at"):
+                deleted.add(entry["id"])
+                continue
+            if not entry.get("start"):
+                continue
+            live[entry["id"]] = {
+                "description": entry.get("description") or "",
+                "start_time": parse_datetime(entry.get("start")),
+                "end_time": parse_datetime(entry.get("stop")),
+                "project_id": entry.get("project_id"),
+                "tag_ids": entry.get("tag_ids") or [],
+            }
+            versions[entry["id"]] = parse_datetime(entry.get("at"))
+
+        existing = {
+            toggl_id: (values, pending_deletion, version)
+            for toggl_id, pending_deletion, version, *values in TogglTimeEntry.objects.filter(
+                user=self.user, toggl_id__in=live.keys() | deleted
+            ).values_list("toggl_id", "pending_deletion", "toggl_updated_at", *ENTRY_FIELDS)
+        }
+
+        created = {}
+        updated = {}
+        for toggl_id, fields in live.items():
+            current = existing.get(toggl_id)
+            version = versions[toggl_id]
+            row = {**fields, "toggl_updated_at": version}
+            if current is None:
+                created[toggl_id] = row
+            elif current[2] and version and current[2] > version:
+                # A webhook already stored a newer state than this page
+                self.stats.unchanged += 1
+            elif current[1] or current[0] != [fields[f] for f in ENTRY_FIELDS]:
+                updated[toggl_id] = row
+            else:
+                self.stats.unchanged += 1
+
+        gone = [
+            toggl_id for toggl_id in deleted
+            if toggl_id in existing and not existing[toggl_id][1]
+        ]
+
+        with transaction.atomic():
+            if created:
+                TogglTimeEntry.objects.bulk_create(
+                    [
+                        TogglTimeEntry(
+                            user=self.user, toggl_id=toggl_id, synced=False,
+                            pending_deletion=False, **row,
+                        )
+                        for toggl_id, row in created.items()
+                    ],
+                    ignore_conflicts=True,
+                )
+                # A webhook may have created some of them since the read above
+                stored = dict(TogglTimeEntry.objects.filter(
+                    user=self.user, toggl_id__in=created
+                ).order_by().values_list("toggl_id", "toggl_updated_at"))
+                raced = [t for t, row in created.items() if stored.get(t) != row["toggl_updated_at"]]
+                for toggl_id in raced:
+                    updated[toggl_id] = created.pop(toggl_id)
+            written = self._update_unless_newer(updated)
+            if gone:
+                self.stats.deleted += TogglTimeEntry.objects.filter(
+                    user=self.user, toggl_id__in=gone
+                ).update(pending_deletion=True, synced=False, updated_at=timezone.now())
+
+        self.stats.created += len(created)
+        self.stats.updated += len(written)
+        self.stats.unchanged += len(updated) - len(written)
+        self.changed_ids.extend(created)
+        self.changed_ids.extend(t for t in updated if t in written)
+        self.changed_ids.extend(gone)
+
+    def _update_unless_newer(self, rows: dict) -> set:
+        """Write existing ``rows`` ({toggl_id: fields}) in one guarded UPDATE.
+
+        The version check is part of the UPDATE, so a webhook that stored a
+        newer state after the page was read keeps it. Rows without a
+        version are written unconditionally. Returns the toggl ids written.
+        """
+        if not rows:
+            return set()
+
+        def per_row(name):
+            # Built like QuerySet.bulk_update's CASE, cast where the backend needs it
+            field = TogglTimeEntry._meta.get_field(name)
+            case = Case(
+                *(
+                    When(toggl_id=toggl_id, then=Value(row[name], output_field=field))
+                    for toggl_id, row in rows.items()
+                ),
+                output_field=field,
+            )
+            if connections[TogglTimeEntry.objects.db].features.requires_casted_case_in_updates:
+                case = Cast(case, output_field=field)
+            return case
+
+        unversioned = [t for t, row in rows.items() if row["toggl_updated_at"] is None]
+        TogglTimeEntry.objects.filter(user=self.user, toggl_id__in=rows).filter(
+            Q(toggl_updated_at__isnull=True)
+            | Q(toggl_updated_at__lte=per_row("toggl_updated_at"))
+            | Q(toggl_id__in=unversioned)
+        ).update(
+            **{name: per_row(name) for name in ENTRY_FIELDS + ["toggl_updated_at"]},
+            synced=False, pending_deletion=False, updated_at=timezone.now(),
+        )
+        stored = TogglTimeEntry.objects.filter(
+            user=self.user, toggl_id__in=rows
+        ).order_by().values_list("toggl_id", "toggl_updated_at")
+        return {
+            toggl_id for toggl_id, version in stored
+            if rows[toggl_id]["toggl_updated_at"] in (None, version)
+        }
@@ -0,0 +1,199 @@
+"""Fair-share dispatch of per-user background work.
+
+Django-Q's ORM broker is a single FIFO queue, so one user's backfill drain
+or a color fan-out of thousands of tasks sits in front of everyone else's
+live timer updates. Per-user work is stored as ``DispatchJob`` rows instead,
+in one of two lanes, and ``run_dispatcher`` (itself a Django-Q task) runs
+them in turn: due live jobs before bulk jobs, and within a lane round-robin
+over user ids, each user's jobs oldest first. Long jobs run in slices and
+dispatch their remainder (see ``tasks.drain_unsynced_entries``), so a big
+user gives up the worker after every slice.
+"""
+
+import itertools
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django_q.models import Schedule
+from django_q.tasks import async_task
+
+from .models import DispatchJob
+from .utils import Waker
+
+logger = logging.getLogger(__name__)
+
+LIVE = DispatchJob.Lane.LIVE
+BULK = DispatchJob.Lane.BULK
+
+# Failed jobs are retried after RETRY_DELAY * attempts; jobs out of
+# attempts are kept this long for inspection
+RETRY_DELAY = timedelta(seconds=30)
+FAILED_RETENTION = timedelta(days=7)
+
+# One-off Django-Q schedule that starts a dispatcher when a deferred job is due
+DUE_SCHEDULE = "run_dispatcher_due"
+
+# lane -> user id this process served last
+_last_served = {}
+
+
+
+def dispatch(func: str, *args, user_id: int, lane=LIVE, run_after=None) -> DispatchJob:
+    """Queue ``func(*args)`` as work of ``user_id``; args must be JSON-serializable."""
+    now = timezone.now()
+    job = DispatchJob.objects.create(
+        user_id=user_id, lane=lane, func=func, args=list(args), run_after=run_after or now,
+    )
+    if job.run_after > now:
+        # Deferred: wake up when it is due instead of waiting for the scheduler
+        _dispatcher_waker.wake_at(job.run_after)
+    else:
+        wake_dispatcher()
+    return job
+
+
+def dispatch_many(func: str, args_iter, user_id: int, lane=BULK, batch_size: int = 1000) -> int:
+    """Queue one job per args tuple (a fan-out) with bulk inserts; returns the count."""
+    now = timezone.now()
+    jobs = (
+        DispatchJob(user_id=user_id, lane=lane, func=func, args=list(args), run_after=now)
+        for args in args_iter
+    )
+    queued = 0
+    while batch := list(itertools.islice(jobs, batch_size)):
+        DispatchJob.objects.bulk_create(batch)
+        queued += len(batch)
+    if queued:
+        wake_dispatcher()
+    return queued
+
+
+def _queue_dispatcher():
+    async_task("sync.dispatch.run_dispatcher", task_name="run_dispatcher")
+
+
+_dispatcher_waker = Waker(_queue_dispatcher, "DISPATCH_WAKE_INTERVAL")
+
+
+def wake_dispatcher(force: bool = False):
+    """Queue a dispatcher run, at most once per DISPATCH_WAKE_INTERVAL per process.
+
+    A suppressed wake-up queues one more run at the end of the interval, so
+    a job dispatched after the running dispatcher's last claim is not left
+    for the safety-net schedule.
+    """
+    _dispatcher_waker.wake(force=force)
+
+
+def _runnable(now):
+    # Claims older than the cluster's retry window belong to a lost worker
+    lost = now - timedelta(seconds=settings.Q_CLUSTER["retry"])
+    return DispatchJob.objects.filter(attempts__lt=settings.DISPATCH_MAX_ATTEMPTS).filter(
+        Q(claimed_at__isnull=True) | Q(claimed_at__lt=lost)
+    )
+
+
+def claim_next_job() -> DispatchJob | None:
+    """Claim the next job: live lane first, then the next user id in turn."""
+    now = timezone.now()
+    for lane in (LIVE, BULK):
+        while True:
+            ready = _runnable(now).filter(lane=lane, run_after__lte=now).order_by("user_id", "id")
+            job = (
+                ready.filter(user_id__gt=_last_served.get(lane, 0)).first()
+                or ready.first()
+            )
+            if job is None:
+                break
+            claimed = DispatchJob.objects.filter(
+                id=job.id, claimed_at=job.claimed_at, attempts=job.attempts
+            ).update(claimed_at=now, attempts=F("attempts") + 1)
+            if claimed:
+                _last_served[lane] = job.user_id
+                job.claimed_at = now
+                job.attempts += 1
+                return job
+            # Another dispatcher claimed it first; look again
+    return None
+
+
+def run_job(job: DispatchJob) -> bool:
+    """Run a claimed job; failures are released for a later retry."""
+    try:
+        import_string(job.func)(*job.args)
+    except Exception as e:
+        logger.exception(f"Dispatch job {job.id} ({job.func}) failed: {e}")
+        DispatchJob.objects.filter(id=job.id).update(
+            error=str(e), claimed_at=None,
+            run_after=timezone.now() + RETRY_DELAY * job.attempts,
+        )
+        return False
+    DispatchJob.objects.filter(id=job.id).delete()
+    return True
+
+
+def _schedule_next_due():
+    """Arm a wake-up for the earliest deferred job, if any.
+
+    A timer in this process queues the dispatcher on time; the one-off
+    schedule is the fallback for when the process goes away first.
+    """
+    now = timezone.now()
+    next_due = _runnable(now).filter(run_after__gt=now).order_by("run_after").values_list(
+        "run_after", flat=True
+    ).first()
+    if next_due is None:
+        return
+    _dispatcher_waker.wake_at(next_due)
+    Schedule.objects.update_or_create(
+        name=DUE_SCHEDULE,
+        defaults={
+            "func": "sync.dispatch.run_dispatcher",
+            "schedule_type": Schedule.ONCE,
+            "repeats": -1,
+            "next_run": next_due,
+        },
+    )
+
+
+def run_dispatcher(budget: float | None = None) -> int:
+    """Run due jobs in fair order until none is left or the time budget is spent.
+
+    Jobs that are not due yet (coalesced live syncs, retries) are never
+    waited for, so the worker is free in between; a timer (with a one-off
+    schedule as fallback) starts a dispatcher once the earliest is due. Jobs themselves may
+    still wait briefly: Toggl rate limiting and backoff (at most
+    TOGGL_RETRY_MAX_DELAY per retry) and a Google token refresh held by
+    another worker (at most its lease) sleep inside the job. If due work is left when
+    the budget runs out, a fresh dispatcher is queued so this task stays
+    under the cluster timeout. Returns how many jobs ran.
+    """
+    budget = settings.DISPATCH_TIME_BUDGET if budget is None else budget
+    deadline = time.monotonic() + budget
+    ran = 0
+
+    while time.monotonic() < deadline:
+        job = claim_next_job()
+        if job is None:
+            break
+        run_job(job)
+        ran += 1
+    else:
+        now = timezone.now()
+        if _runnable(now).filter(run_after__lte=now).exists():
+            wake_dispatcher(force=True)
+    _schedule_next_due()
+
+    DispatchJob.objects.filter(
+        attempts__gte=settings.DISPATCH_MAX_ATTEMPTS,
+        created_at__lt=timezone.now() - FAILED_RETENTION,
+    ).delete()
+
+    if ran:
+        logger.info(f"Dispatcher ran {ran} jobs")
+    return ran
@@ -0,0 +1,49 @@
+"""Management command to backfill Toggl time entries for a user."""
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from sync.services import TogglAPIError
+from sync.tasks import backfill_user_entries
+
+
+class Command(BaseCommand):
+    help = 'Fetch time entries from the Toggl API (catch-up since the last run, or history)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            required=True,
+            help='Username to backfill time entries for',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Days of history to read when there is no previous run '
+                 '(default: TOGGL_BACKFILL_DAYS)',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Ignore the last run and re-read --days of history',
+        )
+
+    def handle(self, *args, **options):
+        username = options['user']
+        try:
+            user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f'User not found: {username}')
+
+        if not user.credentials.toggl_api_token:
+            raise CommandError(
+                f'Toggl API token is required. Configure it for user {username} in the admin'
+            )
+
+        try:
+            stats = backfill_user_entries(user, days=options['days'], full=options['full'])
+        except TogglAPIError as e:
+            raise CommandError(f'Failed to backfill time entries: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'Backfill completed for {username}: {stats}'))
@@ -0,0 +1,48 @@
+"""Management command to apply a file of Toggl webhook events in bulk."""
+
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from sync.tasks import ingest_webhook_events
+
+
+class Command(BaseCommand):
+    help = 'Apply Toggl webhook events from a JSON array or JSON-lines file (e.g. a resent backlog)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            type=str,
+            help='File of webhook payloads or {"body", "signature"} envelopes; - reads stdin',
+        )
+        parser.add_argument(
+            '--user',
+            type=str,
+            required=True,
+            help='Username the events belong to',
+        )
+
+    def handle(self, *args, **options):
+        username = options['user']
+        try:
+            user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f'User not found: {username}')
+
+        path = options['path']
+        try:
+            if path == '-':
+                raw = sys.stdin.read()
+            else:
+                with open(path, encoding='utf-8') as f:
+                    raw = f.read()
+        except OSError as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+
+        # Envelopes are checked against the secrets of all the user's workspaces
+        secrets = list(user.toggl_workspaces.values_list('webhook_secret', flat=True))
+        stats = ingest_webhook_events(user, raw, secrets)
+
+        self.stdout.write(self.style.SUCCESS(f'Ingested webhook events for {username}: {stats}'))
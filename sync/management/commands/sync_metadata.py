@@ -1,18 +1,10 @@
 """Management command to sync Toggl metadata (projects, tags, workspaces, orgs)."""
 
-import secrets
-
 from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 
-from sync.models import (
-    UserCredentials,
-    TogglOrganization,
-    TogglProject,
-    TogglTag,
-    TogglWorkspace,
-)
+from sync.metadata import MetadataSync
 from sync.services import TogglAPIError, TogglService
 
 
@@ -52,132 +44,27 @@ class Command(BaseCommand):
             )
 
         toggl = TogglService(api_token)
-        self.user = user
+        engine = MetadataSync(user, toggl)
 
         try:
-            self.sync_organizations(toggl)
-            self.sync_workspaces(toggl)
-            self.sync_projects_and_tags(toggl)
+            self.stdout.write('Syncing organizations...')
+            self.stdout.write(f'  Organizations: {engine.sync_organizations()}')
+            self.stdout.write('Syncing workspaces...')
+            self.stdout.write(f'  Workspaces: {engine.sync_workspaces()}')
+            self.stdout.write('Syncing projects and tags...')
+            engine.sync_projects_and_tags()
         except TogglAPIError as e:
             raise CommandError(f'Failed to sync metadata: {e}')
 
+        for ws_id, kind, error in engine.errors:
+            self.stdout.write(
+                self.style.WARNING(f'  Failed to sync {kind} for workspace {ws_id}: {error}')
+            )
+        self.stdout.write(f'  Projects: {engine.stats["projects"]}')
+        self.stdout.write(f'  Tags: {engine.stats["tags"]}')
+
         # Update last sync time
         creds.last_toggl_metadata_sync = timezone.now()
         creds.save(update_fields=['last_toggl_metadata_sync'])
 
         self.stdout.write(self.style.SUCCESS(f'Metadata sync completed for {username}'))
-
-    def sync_organizations(self, toggl: TogglService):
-        """Sync organizations from Toggl."""
-        self.stdout.write('Syncing organizations...')
-
-        orgs = toggl.get_organizations()
-        count = 0
-
-        for org in orgs:
-            TogglOrganization.objects.update_or_create(
-                user=self.user,
-                toggl_id=org['id'],
-                defaults={'name': org['name']},
-            )
-            count += 1
-
-        self.stdout.write(f'  Synced {count} organizations')
-
-    def sync_workspaces(self, toggl: TogglService):
-        """Sync workspaces from Toggl."""
-        self.stdout.write('Syncing workspaces...')
-
-        workspaces = toggl.get_workspaces()
-        count = 0
-
-        for ws in workspaces:
-            # Look up organization object if organization_id is provided
-            org = None
-            if ws.get('organization_id'):
-                org = TogglOrganization.objects.filter(
-                    user=self.user, toggl_id=ws['organization_id']
-                ).first()
-
-            workspace, created = TogglWorkspace.objects.update_or_create(
-                user=self.user,
-                toggl_id=ws['id'],
-                defaults={
-                    'name': ws['name'],
-                    'organization': org,
-                },
-            )
-            # Generate webhook token for new workspaces
-            if not workspace.webhook_token:
-                workspace.webhook_token = secrets.token_urlsafe(32)
-                workspace.save(update_fields=['webhook_token'])
-            count += 1
-
-        self.stdout.write(f'  Synced {count} workspaces')
-
-    def sync_projects_and_tags(self, toggl: TogglService):
-        """Sync projects and tags for each workspace."""
-        workspaces = TogglWorkspace.objects.filter(user=self.user)
-
-        for workspace in workspaces:
-            self.stdout.write(f'Syncing data for workspace: {workspace.name}')
-
-            # Sync projects
-            self.sync_projects(toggl, workspace)
-
-            # Sync tags
-            self.sync_tags(toggl, workspace)
-
-    def sync_projects(self, toggl: TogglService, workspace: TogglWorkspace):
-        """Sync projects for a workspace."""
-        try:
-            projects = toggl.get_projects(workspace.toggl_id)
-        except TogglAPIError as e:
-            self.stdout.write(
-                self.style.WARNING(f'  Failed to sync projects: {e}')
-            )
-            return
-
-        count = 0
-        for project in projects:
-            TogglProject.objects.update_or_create(
-                user=self.user,
-                toggl_id=project['id'],
-                defaults={
-                    'workspace': workspace,
-                    'name': project['name'],
-                    'color': project.get('color'),
-                    'active': project.get('active', True),
-                },
-            )
-            count += 1
-
-        self.stdout.write(f'  Synced {count} projects')
-
-    def sync_tags(self, toggl: TogglService, workspace: TogglWorkspace):
-        """Sync tags for a workspace."""
-        try:
-            tags = toggl.get_tags(workspace.toggl_id)
-        except TogglAPIError as e:
-            self.stdout.write(
-                self.style.WARNING(f'  Failed to sync tags: {e}')
-            )
-            return
-
-        if not tags:
-            self.stdout.write('  No tags found')
-            return
-
-        count = 0
-        for tag in tags:
-            TogglTag.objects.update_or_create(
-                user=self.user,
-                toggl_id=tag['id'],
-                defaults={
-                    'workspace': workspace,
-                    'name': tag['name'],
-                },
-            )
-            count += 1
-
-        self.stdout.write(f'  Synced {count} tags')
@@ -0,0 +1,323 @@
+"""Toggl metadata sync: diff API payloads against stored rows and bulk upsert.
+
+Each entity type costs one read, one ``bulk_create(update_conflicts=True)``
+for new and changed rows, and one delete for rows that vanished from Toggl,
+instead of an ``update_or_create`` round-trip per row.
+"""
+
+import logging
+import re
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import (
+    ColorResolver, TogglOrganization, TogglProject, TogglTag, TogglWorkspace, WebhookInboxItem,
+)
+from .services import TogglAPIError, TogglService
+from .webhooks import WebhookTokenCache
+
+logger = logging.getLogger(__name__)
+
+# Per API token, shared by all syncs in this process, so concurrent admin
+# requests for the same token together stay within TOGGL_MAX_CONCURRENCY
+_slots_lock = threading.Lock()
+_slots_by_token = {}
+
+
+def _token_slots(api_token: str) -> threading.BoundedSemaphore:
+    with _slots_lock:
+        if api_token not in _slots_by_token:
+            _slots_by_token[api_token] = threading.BoundedSemaphore(
+                settings.TOGGL_MAX_CONCURRENCY
+            )
+        return _slots_by_token[api_token]
+
+
+class SyncStats:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.deleted = 0
+
+    @property
+    def total(self) -> int:
+        """Rows present in Toggl after the sync."""
+        return self.created + self.updated + self.unchanged
+
+    def __str__(self):
+        return (
+            f"{self.created} created, {self.updated} updated, "
+            f"{self.unchanged} unchanged, {self.deleted} deleted"
+        )
+
+
+class MetadataSync:
+    """Mirror a user's Toggl organizations, workspaces, projects and tags."""
+
+    def __init__(self, user, toggl: TogglService):
+        self.user = user
+        self.toggl = toggl
+        self.stats = {
+            "organizations": SyncStats(),
+            "workspaces": SyncStats(),
+            "projects": SyncStats(),
+            "tags": SyncStats(),
+        }
+        # (workspace toggl_id, kind, error) for per-workspace fetch failures
+        self.errors = []
+
+    def run(self) -> dict[str, SyncStats]:
+        """Sync everything. TogglAPIError from org/workspace listing propagates."""
+        self.sync_organizations()
+        self.sync_workspaces()
+        self.sync_projects_and_tags()
+        return self.stats
+
+    def sync_organizations(self) -> SyncStats:
+        orgs = self.toggl.get_organizations()
+        stats = self.stats["organizations"]
+        if orgs is None:
+            self._listed_null("organizations")
+            return stats
+        rows = {org["id"]: {"name": org["name"]} for org in orgs}
+        with transaction.atomic():
+            self._upsert(TogglOrganization, rows, stats)
+            vanished = TogglOrganization.objects.filter(user=self.user).exclude(
+                toggl_id__in=rows
+            )
+            # Workspace.organization is DO_NOTHING, detach before deleting
+            TogglWorkspace.objects.filter(organization__in=vanished).update(
+                organization=None
+            )
+            stats.deleted = vanished.delete()[0]
+        # The upsert writes rows without save(), so no signal drops the routes
+        # or the resolvers' project -> organization chains
+        WebhookTokenCache.invalidate(user_id=self.user.id)
+        ColorResolver.invalidate(self.user.id)
+        return stats
+
+    def sync_workspaces(self) -> SyncStats:
+        workspaces = self.toggl.get_workspaces()
+        stats = self.stats["workspaces"]
+        if workspaces is None:
+            self._listed_null("workspaces")
+            return stats
+        org_pks = dict(
+            TogglOrganization.objects.filter(user=self.user).values_list("toggl_id", "id")
+        )
+        rows = {
+            ws["id"]: {
+                "name": ws["name"],
+                "organization_id": org_pks.get(ws.get("organization_id")),
+            }
+            for ws in workspaces
+        }
+        with transaction.atomic():
+            self._upsert(
+                TogglWorkspace, rows, stats,
+                # Only new rows get a token; update_fields leaves existing ones alone
+                create_defaults=lambda: {"webhook_token": secrets.token_urlsafe(32)},
+            )
+            for ws in TogglWorkspace.objects.filter(user=self.user, webhook_token__isnull=True):
+                ws.webhook_token = secrets.token_urlsafe(32)
+                ws.save(update_fields=["webhook_token"])
+
+            vanished = TogglWorkspace.objects.filter(user=self.user).exclude(
+                toggl_id__in=rows
+            )
+            # Projects and tags reference workspaces with DO_NOTHING
+            TogglProject.objects.filter(workspace__in=vanished).delete()
+            TogglTag.objects.filter(workspace__in=vanished).delete()
+            self._log_dropped_inbox_items(vanished)
+            stats.deleted = vanished.delete()[0]
+        # The upsert writes rows without save(), so no signal drops the routes
+        WebhookTokenCache.invalidate(user_id=self.user.id)
+        ColorResolver.invalidate(self.user.id)
+        return stats
+
+    def sync_projects_and_tags(self, include_webhooks: bool = False, prune: bool = True):
+        """Fetch every workspace's projects and tags, then upsert each kind once.
+
+        With ``include_webhooks`` the webhook subscriptions are fetched in the
+        same stage, left in ``self.webhooks`` ({workspace: list}), and ours
+        are stored on their workspaces in the same transaction as the
+        projects and tags. Without ``prune`` rows missing from the listings
+        are kept (upsert only).
+        """
+        workspaces = list(TogglWorkspace.objects.filter(user=self.user))
+        kinds = ["projects", "tags"] + (["webhooks"] if include_webhooks else [])
+        fetched = self._fetch_concurrently(workspaces, kinds)
+
+        project_rows = {}
+        tag_rows = {}
+        fetched_projects = []
+        fetched_tags = []
+        self.webhooks = {}
+        self.webhooks_found = 0
+
+        for ws in workspaces:
+            projects, tags = fetched[ws.id, "projects"], fetched[ws.id, "tags"]
+            if isinstance(projects, TogglAPIError):
+                self._fetch_failed(ws, "projects", projects)
+            elif projects is not None:
+                for project in projects:
+                    project_rows[project["id"]] = {
+                        "workspace_id": ws.id,
+                        "name": project["name"],
+                        "color": project.get("color"),
+                        "active": project.get("active", True),
+                    }
+                fetched_projects.append(ws.id)
+
+            if isinstance(tags, TogglAPIError):
+                self._fetch_failed(ws, "tags", tags)
+            elif tags is not None:
+                for tag in tags:
+                    tag_rows[tag["id"]] = {"workspace_id": ws.id, "name": tag["name"]}
+                fetched_tags.append(ws.id)
+
+            if include_webhooks:
+                webhooks = fetched[ws.id, "webhooks"]
+                if isinstance(webhooks, TogglAPIError):
+                    logger.debug(f"Could not fetch webhooks for workspace {ws.toggl_id}: {webhooks}")
+                else:
+                    self.webhooks[ws] = webhooks or []
+
+        with transaction.atomic():
+            self._upsert(TogglProject, project_rows, self.stats["projects"])
+            self._upsert(TogglTag, tag_rows, self.stats["tags"])
+            if prune:
+                # Only prune workspaces whose listing succeeded and was not null
+                self.stats["projects"].deleted = TogglProject.objects.filter(
+                    user=self.user, workspace_id__in=fetched_projects
+                ).exclude(toggl_id__in=project_rows).delete()[0]
+                self.stats["tags"].deleted = TogglTag.objects.filter(
+                    user=self.user, workspace_id__in=fetched_tags
+                ).exclude(toggl_id__in=tag_rows).delete()[0]
+            if include_webhooks:
+                self.webhooks_found = self._apply_webhooks()
+
+        # bulk_create and queryset deletes skip the invalidation signals
+        ColorResolver.invalidate(self.user.id)
+
+    def _apply_webhooks(self) -> int:
+        """Store the subscriptions pointing at WEBHOOK_DOMAIN on their workspaces."""
+        found = 0
+        webhook_domain = settings.WEBHOOK_DOMAIN
+        for ws, webhooks in self.webhooks.items():
+            for webhook in webhooks:
+                callback_url = webhook.get("url_callback", "")
+                if not webhook_domain or webhook_domain not in callback_url:
+                    continue
+                match = re.search(r"/webhook/toggl/([^/]+)/?", callback_url)
+                if not match:
+                    continue
+                ws.webhook_token = match.group(1)
+                ws.webhook_subscription_id = webhook.get("subscription_id")
+                ws.webhook_secret = webhook.get("secret")
+                ws.webhook_enabled = webhook.get("enabled", False)
+                ws.save()
+                found += 1
+                logger.info(
+                    f"Found existing webhook for workspace {ws.name}: "
+                    f"subscription_id={ws.webhook_subscription_id}"
+                )
+        return found
+
+    def _fetch_concurrently(self, workspaces, kinds) -> dict:
+        """Run the per-workspace listings on a bounded pool (HTTP only, no ORM).
+
+        Every request still takes a token from the API token's rate-limit
+        bucket (TOGGL_RATE_LIMIT, TOGGL_RATE_BURST): with the defaults the
+        first four go out together and the rest are paced at one per
+        second, so the pool mainly overlaps slow responses. Raise the
+        bucket only as far as Toggl's quota for the token allows.
+
+        Returns {(workspace pk, kind): payload | TogglAPIError}.
+        """
+        fetchers = {
+            "projects": self.toggl.get_projects,
+            "tags": self.toggl.get_tags,
+            "webhooks": self.toggl.list_webhooks,
+        }
+        slots = _token_slots(self.toggl.api_token)
+
+        def fetch(ws, kind):
+            with slots:
+                try:
+                    return fetchers[kind](ws.toggl_id)
+                except TogglAPIError as e:
+                    return e
+
+        jobs = [(ws, kind) for ws in workspaces for kind in kinds]
+        if not jobs:
+            return {}
+        workers = min(settings.TOGGL_MAX_CONCURRENCY, len(jobs))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {(ws.id, kind): pool.submit(fetch, ws, kind) for ws, kind in jobs}
+        return {key: future.result() for key, future in futures.items()}
+
+    def _log_dropped_inbox_items(self, vanished):
+        # Inbox items cascade with their workspace; say so instead of losing them quietly
+        pending = WebhookInboxItem.objects.filter(
+            workspace__in=vanished, processed_at__isnull=True
+        ).values_list("workspace__toggl_id", "id")
+        dropped = {}
+        for ws_toggl_id, item_id in pending:
+            dropped.setdefault(ws_toggl_id, []).append(item_id)
+        for ws_toggl_id, item_ids in dropped.items():
+            logger.warning(
+                f"Workspace {ws_toggl_id} of {self.user.username} vanished from Toggl, "
+                f"dropping {len(item_ids)} unprocessed webhook inbox items: {item_ids}"
+            )
+
+    def _listed_null(self, kind: str):
+        # Toggl answers null for empty lists; pruning on that would delete
+        # everything below (workspaces, projects, tags, webhook tokens)
+        logger.warning(f"Toggl listed no {kind} for {self.user.username}, keeping stored rows")
+
+    def _fetch_failed(self, ws, kind: str, error: TogglAPIError):
+        self.errors.append((ws.toggl_id, kind, error))
+        logger.warning(
+            f"Failed to sync {kind} for workspace {ws.toggl_id} "
+            f"(user: {self.user.username}): {error}"
+        )
+
+    def _upsert(self, model, rows: dict, stats: SyncStats, create_defaults=None):
+        """Write new and changed ``rows`` ({toggl_id: fields}) in one statement."""
+        if not rows:
+            return
+        fields = list(next(iter(rows.values())))
+        existing = {
+            toggl_id: values
+            for toggl_id, *values in model.objects.filter(user=self.user).values_list(
+                "toggl_id", *fields
+            )
+        }
+
+        changed = []
+        for toggl_id, values in rows.items():
+            current = existing.get(toggl_id)
+            if current is None:
+                stats.created += 1
+                extra = create_defaults() if create_defaults else {}
+            elif current != [values[f] for f in fields]:
+                stats.updated += 1
+                extra = {}
+            else:
+                stats.unchanged += 1
+                continue
+            changed.append(model(user=self.user, toggl_id=toggl_id, **values, **extra))
+
+        if changed:
+            model.objects.bulk_create(
+                changed,
+                update_conflicts=True,
+                unique_fields=["user", "toggl_id"],
+                update_fields=fields + ["updated_at"],
+            )
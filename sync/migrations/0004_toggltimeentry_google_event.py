@@ -0,0 +1,38 @@
+# Generated by Django 6.0.2 on 2026-10-18 22:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0003_entitycolormapping'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='toggltimeentry',
+            name='google_event_etag',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='toggltimeentry',
+            name='google_event_id',
+            field=models.CharField(blank=True, default='', max_length=1024),
+        ),
+        migrations.AlterField(
+            model_name='usercredentials',
+            name='gauth_credentials_json',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AlterField(
+            model_name='usercredentials',
+            name='google_calendar_id',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='usercredentials',
+            name='toggl_api_token',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 22:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0004_toggltimeentry_google_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercredentials',
+            name='google_sync_token',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 22:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0005_usercredentials_google_sync_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercredentials',
+            name='validation_cursor',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0006_usercredentials_validation_cursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercredentials',
+            name='toggl_entries_synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0.2 on 2026-10-18 22:54
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0007_usercredentials_toggl_entries_synced_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookInboxItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('body', models.TextField()),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('workspace', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_items', to='sync.togglworkspace')),
+            ],
+            options={
+                'verbose_name': 'Webhook Inbox Item',
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['id'], name='webhook_inbox_pending')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 23:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0009_pendingentrysync_syncmetric'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercredentials',
+            name='gauth_refresh_lease',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.2 on 2026-10-18 23:40
+
+from django.db import migrations
+
+INDEX_NAME = "sync_entry_tag_ids_gin"
+
+
+def create_gin_index(apps, schema_editor):
+    # jsonb containment (tag_ids__contains) only has an index type on PostgreSQL
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    table = apps.get_model("sync", "TogglTimeEntry")._meta.db_table
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} "
+        f"ON {schema_editor.quote_name(table)} USING gin (tag_ids jsonb_path_ops)"
+    )
+
+
+def drop_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sync", "0010_usercredentials_gauth_refresh_lease"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_gin_index, drop_gin_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 23:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0011_toggltimeentry_tag_ids_gin'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='toggltimeentry',
+            name='toggl_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='toggltimeentry',
+            name='webhook_event_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-19 00:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0013_dispatchjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookinboxitem',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='webhookinboxitem',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import time
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -9,8 +11,16 @@ class UserCredentials(models.Model):
     )
     toggl_api_token = models.CharField(max_length=255, blank=True, default="")
     gauth_credentials_json = models.TextField(blank=True, default="")
+    # Set while one worker refreshes the Google token; others wait for it
+    gauth_refresh_lease = models.DateTimeField(null=True, blank=True)
     google_calendar_id = models.CharField(max_length=255, blank=True, default="")
+    # events.list nextSyncToken for the Toggl calendar, used by validation
+    google_sync_token = models.CharField(max_length=255, blank=True, default="")
+    # Last TogglTimeEntry id checked by the rotating validation window
+    validation_cursor = models.BigIntegerField(default=0)
     timezone = models.CharField(max_length=50, default="UTC")
+    # High-water mark of the time-entry backfill; next run fetches since then
+    toggl_entries_synced_at = models.DateTimeField(null=True, blank=True)
     last_toggl_metadata_sync = models.DateTimeField(null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -146,6 +156,16 @@ class TogglTimeEntry(models.Model):
     synced = models.BooleanField(default=False)
     pending_deletion = models.BooleanField(default=False)
 
+    # Google event resource, remembered after the first write so later
+    # updates can address it directly instead of looking it up by iCalUID
+    google_event_id = models.CharField(max_length=1024, blank=True, default="")
+    google_event_etag = models.CharField(max_length=255, blank=True, default="")
+
+    # Toggl's "at" for the state stored here and the webhook event that
+    # wrote it; redelivered or older webhook events are dropped against them
+    toggl_updated_at = models.DateTimeField(null=True, blank=True)
+    webhook_event_id = models.BigIntegerField(null=True, blank=True)
+
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -162,22 +182,21 @@ class TogglTimeEntry(models.Model):
     def gcal_event_id(self) -> str:
         return "toggl" + str(self.toggl_id)
 
-    def get_gcal_data(self, color_id: str | None = None) -> dict:
-        """Build dict for Google Calendar event creation/update."""
+    def get_gcal_data(
+        self, color_id: str | None = None, metadata: "EntryMetadata | None" = None
+    ) -> dict:
+        """Build dict for Google Calendar event creation/update.
+
+        Pass an ``EntryMetadata`` covering this entry to avoid per-entry
+        project/tag queries when building many events.
+        """
         from datetime import timedelta
 
-        project_name = None
-        if self.project_id:
-            project = TogglProject.objects.filter(
-                user=self.user, toggl_id=self.project_id
-            ).first()
-            if project:
-                project_name = project.name
+        if metadata is None:
+            metadata = EntryMetadata(self.user_id, [self])
 
-        tag_names = []
-        if self.tag_ids:
-            tags = TogglTag.objects.filter(user=self.user, toggl_id__in=self.tag_ids)
-            tag_names = [t.name for t in tags]
+        project_name = metadata.project_names.get(self.project_id)
+        tag_names = metadata.tag_names_for(self.tag_ids)
 
         desc_lines = [f"Toggl Entry: {self.toggl_id}"]
         if project_name:
@@ -208,6 +227,163 @@ class TogglTimeEntry(models.Model):
         return f'Entry {self.id}: {self.description[:50] or "(no description)"} ({status})'
 
 
+class EntryMetadata:
+    """Project and tag names referenced by a set of entries, loaded up front.
+
+    Costs at most two queries regardless of how many entries it covers.
+    """
+
+    def __init__(self, user_id: int, entries):
+        self.user_id = user_id
+        self.project_ids = set()
+        self.tag_ids = set()
+        for entry in entries:
+            if entry.project_id:
+                self.project_ids.add(entry.project_id)
+            self.tag_ids.update(entry.tag_ids or ())
+        self.reload()
+
+    def reload(self):
+        self.project_names = {}
+        self.tag_names = {}
+        if self.project_ids:
+            self.project_names = dict(
+                TogglProject.objects.filter(
+                    user_id=self.user_id, toggl_id__in=self.project_ids
+                ).values_list("toggl_id", "name")
+            )
+        if self.tag_ids:
+            self.tag_names = dict(
+                TogglTag.objects.filter(
+                    user_id=self.user_id, toggl_id__in=self.tag_ids
+                ).values_list("toggl_id", "name")
+            )
+
+    @property
+    def missing(self) -> bool:
+        """True if any referenced project or tag is not stored locally."""
+        return bool(
+            self.project_ids - self.project_names.keys()
+            or self.tag_ids - self.tag_names.keys()
+        )
+
+    def tag_names_for(self, tag_ids) -> list[str]:
+        # Sorted by name, as TogglTag.Meta.ordering returned them
+        return sorted(self.tag_names[t] for t in tag_ids or () if t in self.tag_names)
+
+
+class WebhookInboxItem(models.Model):
+    """Raw webhook body, stored by the view and parsed later by a consumer.
+
+    A drain leases items with ``claimed_at`` and sets ``processed_at`` only
+    once an item was handled; items out of ``attempts`` stay unprocessed
+    with their ``error`` (see tasks.drain_webhook_inbox).
+    """
+
+    workspace = models.ForeignKey(
+        TogglWorkspace, on_delete=models.CASCADE, related_name="inbox_items"
+    )
+    body = models.TextField()
+    received_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+
+    class Meta:
+        verbose_name = "Webhook Inbox Item"
+        ordering = ["id"]
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(processed_at__isnull=True),
+                name="webhook_inbox_pending",
+            ),
+        ]
+
+    def __str__(self):
+        status = "processed" if self.processed_at else "pending"
+        return f"Webhook {self.id} for workspace {self.workspace_id} ({status})"
+
+
+class PendingEntrySync(models.Model):
+    """Per-entry sync coalescing state: waiting requests and the next allowed start."""
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="pending_syncs"
+    )
+    toggl_id = models.BigIntegerField()
+    due_at = models.DateTimeField()
+    requests = models.IntegerField(default=1)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Pending Entry Sync"
+        unique_together = ["user", "toggl_id"]
+
+    def __str__(self):
+        return f"Entry {self.toggl_id} due {self.due_at} ({self.requests} requests)"
+
+
+class DispatchJob(models.Model):
+    """Per-user background work waiting for its fair turn (see sync.dispatch)."""
+
+    class Lane(models.IntegerChoices):
+        LIVE = (0, "Live")
+        BULK = (1, "Bulk")
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="dispatch_jobs"
+    )
+    lane = models.PositiveSmallIntegerField(choices=Lane.choices, default=Lane.LIVE)
+    func = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    run_after = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Dispatch Job"
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["lane", "user", "id"], name="dispatch_job_turn"),
+        ]
+
+    def __str__(self):
+        return f"{self.func}{tuple(self.args)} for user {self.user_id} ({self.get_lane_display()})"
+
+
+class SyncMetric(models.Model):
+    """Process-independent counter, e.g. coalesced vs. executed sync tasks."""
+
+    name = models.CharField(max_length=100, primary_key=True)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Sync Metric"
+        ordering = ["name"]
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+    @classmethod
+    def incr(cls, name: str, amount: int = 1):
+        updated = cls.objects.filter(name=name).update(
+            value=models.F("value") + amount, updated_at=timezone.now()
+        )
+        if not updated:
+            _, created = cls.objects.get_or_create(name=name, defaults={"value": amount})
+            if not created:
+                cls.objects.filter(name=name).update(value=models.F("value") + amount)
+
+    @classmethod
+    def snapshot(cls) -> dict[str, int]:
+        return dict(cls.objects.values_list("name", "value"))
+
+
 class EntityColorMapping(models.Model):
     class EntityType(models.TextChoices):
         TAG = ("tag", "Tag")
@@ -303,50 +479,91 @@ class EntityColorMapping(models.Model):
 
     @classmethod
     def resolve_color(cls, user, project_id=None, tag_ids=None) -> str | None:
-        if tag_ids:
-            mapping = (
-                cls.objects.filter(
-                    user=user,
-                    entity_type=cls.EntityType.TAG,
-                    entity_id__in=tag_ids,
-                )
-                .order_by("process_order")
-                .first()
+        return ColorResolver.for_user(user).resolve(project_id, tag_ids)
+
+    def __str__(self):
+        return f"{self.entity_type}: {self.entity_name} -> {self.color_name}"
+
+
+class ColorResolver:
+    """All color mappings of a user, compiled into dicts for query-free lookups.
+
+    Resolvers are cached per process and dropped when mappings, projects or
+    workspaces change (see sync.signals). CACHE_TTL bounds how long changes
+    made in another process (web vs. worker) can go unnoticed.
+    """
+
+    CACHE_TTL = 60
+    _cache = {}
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.built_at = time.monotonic()
+
+        # entity toggl_id -> color id; tags keep process_order for ranking
+        self.tag_colors = {}
+        self.project_colors = {}
+        self.workspace_colors = {}
+        self.organization_colors = {}
+
+        colors_by_type = {
+            EntityColorMapping.EntityType.PROJECT: self.project_colors,
+            EntityColorMapping.EntityType.WORKSPACE: self.workspace_colors,
+            EntityColorMapping.EntityType.ORGANIZATION: self.organization_colors,
+        }
+        mappings = EntityColorMapping.objects.filter(user_id=user_id).values_list(
+            "entity_type", "entity_id", "color_name", "process_order"
+        )
+        for entity_type, entity_id, color_name, process_order in mappings:
+            color_id = EntityColorMapping.COLOR_ID_MAP[color_name]
+            if entity_type == EntityColorMapping.EntityType.TAG:
+                self.tag_colors[entity_id] = (process_order, color_id)
+            elif entity_type in colors_by_type:
+                colors_by_type[entity_type][entity_id] = color_id
+
+        # project toggl_id -> (workspace toggl_id, organization toggl_id)
+        self.project_chain = {
+            project_id: (workspace_id, organization_id)
+            for project_id, workspace_id, organization_id in TogglProject.objects.filter(
+                user_id=user_id
+            ).values_list(
+                "toggl_id", "workspace__toggl_id", "workspace__organization__toggl_id"
             )
-            if mapping:
-                return mapping.get_color_id()
+        }
+
+    @classmethod
+    def for_user(cls, user) -> "ColorResolver":
+        user_id = getattr(user, "pk", user)
+        resolver = cls._cache.get(user_id)
+        if resolver is None or time.monotonic() - resolver.built_at > cls.CACHE_TTL:
+            resolver = cls(user_id)
+            cls._cache[user_id] = resolver
+        return resolver
+
+    @classmethod
+    def invalidate(cls, user_id: int | None = None):
+        if user_id is None:
+            cls._cache.clear()
+        else:
+            cls._cache.pop(user_id, None)
+
+    def resolve(self, project_id=None, tag_ids=None) -> str | None:
+        """Tag > project > workspace > organization, as resolve_color."""
+        if tag_ids:
+            matches = [self.tag_colors[t] for t in tag_ids if t in self.tag_colors]
+            if matches:
+                return min(matches)[1]
 
         if project_id:
-            mapping = cls.objects.filter(
-                user=user,
-                entity_type=cls.EntityType.PROJECT,
-                entity_id=project_id,
-            ).first()
-            if mapping:
-                return mapping.get_color_id()
-
-            project = TogglProject.objects.filter(
-                user=user, toggl_id=project_id
-            ).first()
-            if project:
-                mapping = cls.objects.filter(
-                    user=user,
-                    entity_type=cls.EntityType.WORKSPACE,
-                    entity_id=project.workspace.toggl_id,
-                ).first()
-                if mapping:
-                    return mapping.get_color_id()
-
-                if project.workspace.organization_id:
-                    mapping = cls.objects.filter(
-                        user=user,
-                        entity_type=cls.EntityType.ORGANIZATION,
-                        entity_id=project.workspace.organization.toggl_id,
-                    ).first()
-                    if mapping:
-                        return mapping.get_color_id()
+            if project_id in self.project_colors:
+                return self.project_colors[project_id]
 
-        return None
+            workspace_id, organization_id = self.project_chain.get(
+                project_id, (None, None)
+            )
+            if workspace_id in self.workspace_colors:
+                return self.workspace_colors[workspace_id]
+            if organization_id in self.organization_colors:
+                return self.organization_colors[organization_id]
 
-    def __str__(self):
-        return f"{self.entity_type}: {self.entity_name} -> {self.color_name}"
+        return None
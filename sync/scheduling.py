@@ -0,0 +1,93 @@
+"""Coalescing of per-entry calendar sync tasks.
+
+Each entry has at most one ``PendingEntrySync`` row. ``requests`` counts
+the requests waiting for a sync (0 once one was claimed) and ``due_at`` is
+the earliest time the next sync may start, SYNC_COALESCE_WINDOW after the
+previous one. The first request for an idle entry dispatches a live job
+right away; requests while that job is queued only bump the count, and the
+first request after it started queues one follow-up for ``due_at``. A timer
+for it is armed in the dispatching process (see dispatch.dispatch), so
+follow-ups do not wait for the scheduler either. A burst of edits thus
+costs one immediate sync plus at most one per window.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
+
+from .dispatch import dispatch
+from .models import PendingEntrySync, SyncMetric
+
+logger = logging.getLogger(__name__)
+
+COALESCED = "entry_sync_coalesced"
+EXECUTED = "entry_sync_executed"
+
+
+def request_entry_sync(user_id: int, toggl_id: int) -> bool:
+    """Ask for a calendar sync of one entry; returns False if coalesced."""
+    now = timezone.now()
+    pending = PendingEntrySync.objects.filter(user_id=user_id, toggl_id=toggl_id)
+
+    # A queued sync will pick this request up too
+    if pending.filter(requests__gt=0).update(requests=models.F("requests") + 1):
+        return _coalesced(user_id, toggl_id)
+
+    idle = pending.first()
+    if idle is None:
+        try:
+            with transaction.atomic():
+                PendingEntrySync.objects.create(
+                    user_id=user_id, toggl_id=toggl_id, due_at=now
+                )
+        except IntegrityError:
+            # Another request created it between our update and insert
+            pending.update(requests=models.F("requests") + 1)
+            return _coalesced(user_id, toggl_id)
+        run_after = now
+    elif pending.filter(id=idle.id, requests=0).update(requests=1):
+        # Synced recently: follow up once the window since that sync is over
+        run_after = max(idle.due_at, now)
+    else:
+        pending.update(requests=models.F("requests") + 1)
+        return _coalesced(user_id, toggl_id)
+
+    dispatch(
+        "sync.tasks.run_entry_sync", user_id, toggl_id, user_id=user_id, run_after=run_after,
+    )
+    return True
+
+
+def _coalesced(user_id: int, toggl_id: int) -> bool:
+    # Counted in claim_entry_sync, off the webhook request path
+    logger.debug(f"Coalesced sync request for entry {toggl_id} (user {user_id})")
+    return False
+
+
+def claim_entry_sync(user_id: int, toggl_id: int) -> PendingEntrySync | None:
+    """Take the entry's waiting requests and return its row as it was.
+
+    The row is kept with ``requests`` at 0 and ``due_at`` one window ahead,
+    so requests arriving during or right after this sync queue a single
+    follow-up. The requests beyond the first are counted as coalesced
+    here rather than when they arrive. Returns None if another task
+    already claimed the requests.
+    """
+    now = timezone.now()
+    pending = PendingEntrySync.objects.filter(user_id=user_id, toggl_id=toggl_id)
+    row = pending.filter(requests__gt=0).first()
+    if row is None:
+        return None
+    window = timedelta(seconds=settings.SYNC_COALESCE_WINDOW)
+    if not pending.filter(requests__gt=0).update(requests=0, due_at=now + window):
+        return None
+
+    # Rows of entries that stayed quiet for a whole window are not needed anymore
+    PendingEntrySync.objects.filter(user_id=user_id, requests=0, due_at__lt=now).delete()
+    SyncMetric.incr(EXECUTED)
+    if row.requests > 1:
+        SyncMetric.incr(COALESCED, row.requests - 1)
+    return row
@@ -1,4 +1,4 @@
-from .gcal import GoogleCalendarError, GoogleCalendarService
+from .gcal import CredentialCache, GoogleCalendarError, GoogleCalendarService
 from .toggl import TogglAPIError, TogglService
 
 __all__ = [
@@ -6,4 +6,5 @@ __all__ = [
     'TogglAPIError',
     'GoogleCalendarService',
     'GoogleCalendarError',
+    'CredentialCache',
 ]
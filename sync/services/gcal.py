@@ -1,13 +1,18 @@
+import functools
 import json
 import logging
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.db.models import Q
+from django.utils import timezone
 from google.auth.exceptions import RefreshError
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from googleapiclient.errors import HttpError
 
 from sync.models import UserCredentials
@@ -19,13 +24,65 @@ class GoogleCalendarError(Exception):
     pass
 
 
+@functools.cache
+def _calendar_discovery_document() -> dict:
+    """Parse the bundled Calendar v3 discovery document once per process."""
+    return json.loads(get_static_doc("calendar", "v3"))
+
+
+def build_calendar_service(credentials: Credentials):
+    """Return an authorized Calendar client without re-reading discovery."""
+    return build_from_document(
+        _calendar_discovery_document(), credentials=credentials
+    )
+
+
+class CredentialCache:
+    """Parsed Google credentials per user, shared by the tasks of a process.
+
+    Entries are keyed by user and remember the ``gauth_credentials_json``
+    they were parsed from: as long as the stored JSON is unchanged the same
+    Credentials object (and the access token it refreshed) is reused. A
+    token refreshed in another process changes the JSON, so the next
+    lookup picks it up instead of refreshing again.
+    """
+
+    _cache = {}
+
+    @classmethod
+    def load(cls, user_id: int, source: str, scopes) -> Credentials:
+        cached = cls._cache.get(user_id)
+        if cached is not None and cached[0] == source:
+            return cached[1]
+        credentials = Credentials.from_authorized_user_info(json.loads(source), scopes)
+        cls._cache[user_id] = (source, credentials)
+        return credentials
+
+    @classmethod
+    def store(cls, user_id: int, source: str, credentials: Credentials):
+        cls._cache[user_id] = (source, credentials)
+
+    @classmethod
+    def invalidate(cls, user_id: int | None = None):
+        if user_id is None:
+            cls._cache.clear()
+        else:
+            cls._cache.pop(user_id, None)
+
+
 class GoogleCalendarService:
+    # Calendar API accepts at most 50 calls per batch request
+    BATCH_SIZE = 50
+    # One worker refreshes a user's token at a time; others poll for the result
+    REFRESH_LEASE = timedelta(seconds=30)
+    REFRESH_POLL_INTERVAL = 0.2
+
     def __init__(self, user: User):
         self.user = user
         self.scopes = settings.GOOGLE_CALENDAR_SCOPES
         self.credentials = self._load_from_user(user)
         self._refresh_maybe()
-        self.service = build("calendar", "v3", credentials=self.credentials)
+        self.service = build_calendar_service(self.credentials)
         self.timezone = self._get_user_creds().timezone
 
     def _get_user_creds(self) -> UserCredentials:
@@ -33,18 +90,38 @@ class GoogleCalendarService:
 
     def _load_from_user(self, user: User):
         user_creds = self._get_user_creds()
-        return Credentials.from_authorized_user_info(
-            json.loads(user_creds.gauth_credentials_json), self.scopes
+        return CredentialCache.load(
+            user.pk, user_creds.gauth_credentials_json, self.scopes
         )
 
     def _refresh_maybe(self):
-        if not self.credentials.expired:
+        if not self._needs_refresh(self.credentials):
+            return
+
+        user_creds = self._get_user_creds()
+        rows = UserCredentials.objects.filter(pk=user_creds.pk)
+        while True:
+            # Another worker may have refreshed the token already
+            if self._adopt_stored_token(rows):
+                return
+            now = timezone.now()
+            claimed = rows.filter(
+                Q(gauth_refresh_lease__isnull=True) | Q(gauth_refresh_lease__lt=now)
+            ).update(gauth_refresh_lease=now + self.REFRESH_LEASE)
+            if claimed:
+                break
+            time.sleep(self.REFRESH_POLL_INTERVAL)
+
+        # It may also have finished between our check and the claim
+        if self._adopt_stored_token(rows):
+            rows.update(gauth_refresh_lease=None)
             return
 
         logger.info(f"Refreshing expired Google credentials for {self.user.username}")
         try:
             self.credentials.refresh(Request())
         except RefreshError as e:
+            rows.update(gauth_refresh_lease=None)
             logger.error(
                 f"Google OAuth refresh failed for {self.user.username}: {e}. "
                 f"Could be revoked token or transient network issue. "
@@ -53,14 +130,57 @@ class GoogleCalendarService:
             raise GoogleCalendarError(
                 f"Google OAuth refresh failed for {self.user.username}: {e}"
             ) from e
+        except Exception:
+            rows.update(gauth_refresh_lease=None)
+            raise
 
-        user_creds = self._get_user_creds()
         user_creds.gauth_credentials_json = self.credentials.to_json()
-        user_creds.save(update_fields=["gauth_credentials_json", "updated_at"])
+        user_creds.gauth_refresh_lease = None
+        user_creds.save(update_fields=[
+            "gauth_credentials_json", "gauth_refresh_lease", "updated_at",
+        ])
+        CredentialCache.store(
+            self.user.pk, user_creds.gauth_credentials_json, self.credentials
+        )
+
+    def _needs_refresh(self, credentials) -> bool:
+        """Expired, or expiring within GOOGLE_TOKEN_REFRESH_MARGIN seconds."""
+        if credentials.expired:
+            return True
+        if credentials.expiry is None:
+            return False
+        margin = timedelta(seconds=settings.GOOGLE_TOKEN_REFRESH_MARGIN)
+        # google-auth keeps expiry as naive UTC
+        return credentials.expiry - margin <= timezone.now().replace(tzinfo=None)
+
+    def _adopt_stored_token(self, rows) -> bool:
+        """Use the stored token if another worker refreshed it since we loaded."""
+        user_creds = self._get_user_creds()
+        stored = rows.values_list("gauth_credentials_json", flat=True).first()
+        if not stored:
+            raise GoogleCalendarError(
+                f"Google Calendar not connected for {self.user.username}"
+            )
+        if stored == user_creds.gauth_credentials_json:
+            return False
+        fresh = Credentials.from_authorized_user_info(json.loads(stored), self.scopes)
+        if self._needs_refresh(fresh):
+            return False
+
+        # Update in place: the API client holds a reference to these credentials
+        self.credentials.token = fresh.token
+        self.credentials.expiry = fresh.expiry
+        user_creds.gauth_credentials_json = stored
+        CredentialCache.store(self.user.pk, stored, self.credentials)
+        logger.debug(f"Reusing Google token refreshed by another worker for {self.user.username}")
+        return True
 
     def ensure_toggl_calendar(self) -> str:
-        """Return Toggl calendar ID, creating one if needed."""
-        self.user.refresh_from_db()
+        """Return Toggl calendar ID, creating one if needed.
+
+        Uses the credentials row loaded with the user; tasks load it fresh,
+        so a calendar reset from the web process is seen by the next task.
+        """
         user_creds = self._get_user_creds()
 
         if not user_creds.is_connected:
@@ -86,14 +206,16 @@ class GoogleCalendarService:
         calendar_id = cal["id"]
         user_creds = self._get_user_creds()
         user_creds.google_calendar_id = calendar_id
-        user_creds.save(update_fields=["google_calendar_id", "updated_at"])
+        user_creds.google_sync_token = ""
+        user_creds.save(
+            update_fields=["google_calendar_id", "google_sync_token", "updated_at"]
+        )
         logger.info(f"Created Toggl calendar {calendar_id} for {self.user.username}")
 
         return calendar_id
 
-    def create_event(
+    def _event_body(
         self,
-        calendar_id: str,
         summary: str,
         start: datetime,
         end: datetime,
@@ -101,7 +223,6 @@ class GoogleCalendarService:
         event_id: str | None = None,
         color_id: str | None = None,
     ) -> dict:
-        self._refresh_maybe()
         event_body = {
             "summary": summary,
             "description": description,
@@ -119,6 +240,49 @@ class GoogleCalendarService:
             event_body["iCalUID"] = event_id
         if color_id:
             event_body["colorId"] = color_id
+        return event_body
+
+    def _apply_event_fields(
+        self,
+        event: dict,
+        summary: str | None = None,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        description: str | None = None,
+        color_id: str | None = None,
+    ) -> dict:
+        if summary is not None:
+            event["summary"] = summary
+        if description is not None:
+            event["description"] = description
+        if start is not None:
+            event["start"] = {
+                "dateTime": start.isoformat(),
+                "timeZone": self.timezone,
+            }
+        if end is not None:
+            event["end"] = {
+                "dateTime": end.isoformat(),
+                "timeZone": self.timezone,
+            }
+        if color_id is not None:
+            event["colorId"] = color_id
+        return event
+
+    def create_event(
+        self,
+        calendar_id: str,
+        summary: str,
+        start: datetime,
+        end: datetime,
+        description: str = "",
+        event_id: str | None = None,
+        color_id: str | None = None,
+    ) -> dict:
+        self._refresh_maybe()
+        event_body = self._event_body(
+            summary, start, end, description, event_id, color_id
+        )
 
         try:
             return (
@@ -155,38 +319,68 @@ class GoogleCalendarService:
         description: str | None = None,
         color_id: str | None = None,
     ) -> dict:
+        """Send only the given fields with events.patch; others are kept."""
         self._refresh_maybe()
         try:
-            event = (
-                self.service.events()
-                .get(calendarId=calendar_id, eventId=event_id)
-                .execute()
-            )
+            return self._patch_request(
+                calendar_id, event_id, summary, start, end, description, color_id
+            ).execute()
+        except HttpError as e:
+            raise GoogleCalendarError(f"Failed to update event: {e}") from e
 
-            if summary is not None:
-                event["summary"] = summary
-            if description is not None:
-                event["description"] = description
-            if start is not None:
-                event["start"] = {
-                    "dateTime": start.isoformat(),
-                    "timeZone": self.timezone,
-                }
-            if end is not None:
-                event["end"] = {
-                    "dateTime": end.isoformat(),
-                    "timeZone": self.timezone,
-                }
-            if color_id is not None:
-                event["colorId"] = color_id
+    def _patch_request(
+        self,
+        calendar_id: str,
+        event_id: str,
+        summary: str | None = None,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        description: str | None = None,
+        color_id: str | None = None,
+        etag: str | None = None,
+    ):
+        body = self._apply_event_fields(
+            {}, summary, start, end, description, color_id
+        )
+        request = self.service.events().patch(
+            calendarId=calendar_id, eventId=event_id, body=body
+        )
+        if etag:
+            request.headers["If-Match"] = etag
+        return request
 
-            return (
-                self.service.events()
-                .update(calendarId=calendar_id, eventId=event_id, body=event)
-                .execute()
-            )
+    def patch_event(
+        self,
+        calendar_id: str,
+        event_id: str,
+        etag: str | None = None,
+        summary: str | None = None,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        description: str | None = None,
+        color_id: str | None = None,
+    ) -> dict | None:
+        """Patch an event by ID in a single call.
+
+        With ``etag`` the write only applies if the event is unchanged
+        (If-Match). Returns None if the event is gone or the etag is stale.
+        """
+        self._refresh_maybe()
+        request = self._patch_request(
+            calendar_id, event_id, summary, start, end, description, color_id,
+            etag=etag,
+        )
+
+        try:
+            return request.execute()
         except HttpError as e:
-            raise GoogleCalendarError(f"Failed to update event: {e}") from e
+            if e.resp.status in (404, 410, 412):
+                logger.debug(
+                    f"Event {event_id} not patched ({e.resp.status}), "
+                    f"stored reference is stale"
+                )
+                return None
+            raise GoogleCalendarError(f"Failed to patch event: {e}") from e
 
     def delete_event(self, calendar_id: str, event_id: str) -> None:
         self._refresh_maybe()
@@ -218,3 +412,182 @@ class GoogleCalendarService:
             return items[0] if items else None
         except HttpError as e:
             raise GoogleCalendarError(f"Failed to find event: {e}") from e
+
+    def iter_event_changes(self, calendar_id: str, sync_token: str = ""):
+        """Yield (events, next_sync_token) per events.list page.
+
+        With ``sync_token`` only events changed since it was issued are
+        listed; without one (or once Google expires it with 410) the whole
+        calendar is. ``next_sync_token`` is only set on the last page.
+        Deleted events are included with status "cancelled".
+        """
+        page_token = None
+
+        while True:
+            self._refresh_maybe()
+            params = {
+                "calendarId": calendar_id,
+                "showDeleted": True,
+                "maxResults": 2500,
+            }
+            if sync_token:
+                params["syncToken"] = sync_token
+            if page_token:
+                params["pageToken"] = page_token
+
+            try:
+                result = self.service.events().list(**params).execute()
+            except HttpError as e:
+                if e.resp.status == 410 and sync_token and not page_token:
+                    logger.info(
+                        f"Sync token expired for {self.user.username}, "
+                        f"listing full calendar"
+                    )
+                    yield from self.iter_event_changes(calendar_id)
+                    return
+                raise GoogleCalendarError(f"Failed to list events: {e}") from e
+
+            page_token = result.get("nextPageToken")
+            yield result.get("items", []), result.get("nextSyncToken", "")
+            if not page_token:
+                return
+
+    def find_events_by_ical_uids(self, calendar_id: str, ical_uids: dict) -> dict:
+        """Batched find_event_by_ical_uid for {key: iCalUID}.
+
+        Returns {key: event or None}, or {key: GoogleCalendarError}.
+        """
+        events = self.service.events()
+        lookups = self._execute_batch({
+            key: events.list(calendarId=calendar_id, iCalUID=uid, showDeleted=True)
+            for key, uid in ical_uids.items()
+        })
+
+        results = {}
+        for key, found in lookups.items():
+            if isinstance(found, HttpError):
+                results[key] = GoogleCalendarError(f"Failed to find event: {found}")
+            else:
+                items = found.get("items", [])
+                results[key] = items[0] if items else None
+        return results
+
+    def _execute_batch(self, requests: dict) -> dict:
+        """Run {key: HttpRequest} through the batch endpoint.
+
+        Returns {key: response} where a failed operation maps to its HttpError.
+        """
+        results = {}
+        keys_by_id = {str(key): key for key in requests}
+
+        def callback(request_id, response, exception):
+            results[keys_by_id[request_id]] = exception or response
+
+        items = list(requests.items())
+        for i in range(0, len(items), self.BATCH_SIZE):
+            self._refresh_maybe()
+            batch = self.service.new_batch_http_request(callback=callback)
+            for key, request in items[i:i + self.BATCH_SIZE]:
+                batch.add(request, request_id=str(key))
+            try:
+                batch.execute()
+            except HttpError as e:
+                raise GoogleCalendarError(f"Batch request failed: {e}") from e
+
+        return results
+
+    def sync_events_batch(
+        self,
+        calendar_id: str,
+        upserts: dict | None = None,
+        deletes: dict | None = None,
+        known: dict | None = None,
+    ) -> dict:
+        """Create/update and delete events using batched requests.
+
+        ``upserts`` maps a caller key to ``TogglTimeEntry.get_gcal_data()``
+        output, ``deletes`` maps a caller key to an iCalUID, and ``known``
+        maps a caller key to its stored (event id, etag). Known events are
+        patched or deleted by id with If-Match in one batch pass. The rest,
+        and known ones that came back 404/410/412, are looked up in one
+        batch pass and written in another; those updates only patch the
+        fields that differ from the stored event.
+
+        Returns {key: event} for operations that succeeded (``{}`` for
+        deletes) and {key: GoogleCalendarError} for those that failed.
+        """
+        upserts = upserts or {}
+        deletes = deletes or {}
+        events = self.service.events()
+
+        direct = {}
+        for key, (event_id, etag) in (known or {}).items():
+            if key in deletes:
+                request = events.delete(calendarId=calendar_id, eventId=event_id)
+            elif key in upserts:
+                data = dict(upserts[key])
+                data.pop("event_id")
+                request = events.patch(
+                    calendarId=calendar_id, eventId=event_id,
+                    body=self._apply_event_fields({}, **data),
+                )
+            else:
+                continue
+            if etag:
+                request.headers["If-Match"] = etag
+            direct[key] = request
+
+        results = {}
+        for key, response in self._execute_batch(direct).items():
+            if not isinstance(response, HttpError):
+                results[key] = response or {}
+            elif response.resp.status not in (404, 410, 412):
+                results[key] = GoogleCalendarError(f"Failed to sync event: {response}")
+            # else: the stored reference is stale, look the event up below
+
+        ical_uids = {
+            key: data["event_id"] for key, data in upserts.items() if key not in results
+        }
+        ical_uids.update({key: uid for key, uid in deletes.items() if key not in results})
+
+        writes = {}
+        for key, existing in self.find_events_by_ical_uids(calendar_id, ical_uids).items():
+            if isinstance(existing, GoogleCalendarError):
+                results[key] = existing
+                continue
+
+            if key in deletes:
+                if existing:
+                    writes[key] = events.delete(
+                        calendarId=calendar_id, eventId=existing["id"]
+                    )
+                else:
+                    results[key] = {}
+            elif existing:
+                data = dict(upserts[key])
+                data.pop("event_id")
+                wanted = self._apply_event_fields({}, **data)
+                changed = {
+                    field: value for field, value in wanted.items()
+                    if existing.get(field) != value
+                }
+                if not changed:
+                    results[key] = existing
+                    continue
+                writes[key] = events.patch(
+                    calendarId=calendar_id, eventId=existing["id"], body=changed
+                )
+            else:
+                writes[key] = events.insert(
+                    calendarId=calendar_id, body=self._event_body(**upserts[key])
+                )
+
+        for key, response in self._execute_batch(writes).items():
+            if not isinstance(response, HttpError):
+                results[key] = response or {}
+            elif key in deletes and response.resp.status in (404, 410):
+                results[key] = {}
+            else:
+                results[key] = GoogleCalendarError(f"Failed to sync event: {response}")
+
+        return results
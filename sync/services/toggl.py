@@ -1,39 +1,200 @@
 import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
 
 import requests
 from django.conf import settings
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
 
 class TogglAPIError(Exception):
-    pass
+    def __init__(self, message: str, status_code: int | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TokenBucket:
+    """Thread-safe token bucket; ``acquire`` blocks until a token is free."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, returning the seconds spent waiting for it."""
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            # Negative balance reserves a future slot for this caller
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+_buckets_lock = threading.Lock()
+_buckets = {}
+
+
+def _bucket_for(api_token: str) -> TokenBucket:
+    """One bucket per API token and process, as Toggl meters per token."""
+    with _buckets_lock:
+        if api_token not in _buckets:
+            _buckets[api_token] = TokenBucket(
+                settings.TOGGL_RATE_LIMIT, settings.TOGGL_RATE_BURST
+            )
+        return _buckets[api_token]
+
+
+_sessions_lock = threading.Lock()
+_sessions = {}
+
+
+def _session_for(api_token: str) -> requests.Session:
+    """Process-wide keep-alive session per API token.
+
+    Created lazily, so forked Django-Q workers each build their own pool
+    instead of sharing sockets with the parent.
+    """
+    with _sessions_lock:
+        session = _sessions.get(api_token)
+        if session is None:
+            session = requests.Session()
+            session.auth = (api_token, "api_token")
+            session.headers.update({"Content-Type": "application/json"})
+            # Retries are handled in TogglService._request
+            adapter = HTTPAdapter(
+                pool_connections=2,
+                pool_maxsize=settings.TOGGL_MAX_CONCURRENCY,
+                max_retries=0,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[api_token] = session
+        return session
+
+
+def close_sessions():
+    """Drop pooled sessions, e.g. after a token was rotated."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def _retry_after(response) -> float | None:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
 
 
 class TogglService:
+    # 429 means the request was not processed, so it is safe to retry for any
+    # method; 5xx and network errors are only retried for idempotent ones
+    THROTTLED = 429
+    RETRY_STATUSES = {500, 502, 503, 504}
+    IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE"}
+
     def __init__(self, api_token: str):
         self.api_token = api_token
-        self.session = requests.Session()
-        self.session.auth = (self.api_token, "api_token")
-        self.session.headers.update({"Content-Type": "application/json"})
+        self.session = _session_for(api_token)
+        self.bucket = _bucket_for(api_token)
+        self.stats = {"requests": 0, "retries": 0, "throttled_seconds": 0.0}
+        # One service is shared by the metadata sync's fetch threads
+        self._stats_lock = threading.Lock()
+
+    def _count(self, stat: str, value=1):
+        with self._stats_lock:
+            self.stats[stat] += value
 
     def _request(self, method: str, url: str, **kwargs):
-        try:
-            response = self.session.request(method, url, **kwargs)
-            response.raise_for_status()
+        kwargs.setdefault(
+            "timeout", (settings.TOGGL_CONNECT_TIMEOUT, settings.TOGGL_READ_TIMEOUT)
+        )
+        max_retries = settings.TOGGL_MAX_RETRIES
+        idempotent = method.upper() in self.IDEMPOTENT_METHODS
 
-            if response.status_code == 204:
-                return None
+        for attempt in range(max_retries + 1):
+            self._count("throttled_seconds", self.bucket.acquire())
+            self._count("requests")
+            last_attempt = attempt == max_retries
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if last_attempt or not idempotent:
+                    logger.error(f"Toggl API request failed: {e}")
+                    raise TogglAPIError(f"Request failed: {e}") from e
+                delay = self._backoff(attempt)
+                reason = type(e).__name__
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Toggl API request failed: {e}")
+                raise TogglAPIError(f"Request failed: {e}") from e
+            else:
+                status = response.status_code
+                retryable = status == self.THROTTLED or (
+                    status in self.RETRY_STATUSES and idempotent
+                )
+                if not retryable or last_attempt:
+                    return self._parse(response)
+                delay = _retry_after(response)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                delay = min(delay, settings.TOGGL_RETRY_MAX_DELAY)
+                if status == self.THROTTLED:
+                    self._count("throttled_seconds", delay)
+                reason = f"HTTP {status}"
+
+            self._count("retries")
+            logger.warning(
+                f"Toggl API {method} {url}: {reason}, "
+                f"retry {attempt + 1}/{max_retries} in {delay:.2f}s"
+            )
+            time.sleep(delay)
 
-            return response.json()
+    def _parse(self, response):
+        try:
+            response.raise_for_status()
         except requests.exceptions.HTTPError as e:
             logger.error(
                 f"Toggl API error: {e.response.status_code} - {e.response.text}"
             )
-            raise e
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Toggl API request failed: {e}")
-            raise e
+            raise TogglAPIError(
+                f"{e.response.status_code} - {e.response.text}",
+                status_code=e.response.status_code,
+            ) from e
+
+        if response.status_code == 204:
+            return None
+
+        return response.json()
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """Exponential backoff with full jitter."""
+        ceiling = min(
+            settings.TOGGL_RETRY_MAX_DELAY,
+            settings.TOGGL_RETRY_BASE_DELAY * 2 ** attempt,
+        )
+        return random.uniform(0, ceiling)
 
     def _request_api(self, method: str, url: str, **kwargs):
         return self._request(
@@ -73,6 +234,25 @@ class TogglService:
 
         return projects
 
+    def get_time_entries(
+        self, since: int | None = None, start_date: str | None = None,
+        end_date: str | None = None,
+    ) -> list[dict]:
+        """List the user's time entries.
+
+        ``since`` (UNIX timestamp, at most ~3 months back) returns entries
+        modified after it, including deleted ones (``server_deleted_at``);
+        otherwise ``start_date``/``end_date`` select entries by start time.
+        """
+        params = {}
+        if since is not None:
+            params["since"] = since
+        if start_date:
+            params["start_date"] = start_date
+        if end_date:
+            params["end_date"] = end_date
+        return self._request_api("GET", "me/time_entries", params=params) or []
+
     def get_tags(self, workspace_id: int):
         return self._request_api("GET", f"workspaces/{workspace_id}/tags")
 
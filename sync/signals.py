@@ -1,11 +1,33 @@
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from .models import UserCredentials
+from .models import (
+    ColorResolver, EntityColorMapping, TogglProject, TogglWorkspace, UserCredentials,
+)
+from .services import CredentialCache
+from .webhooks import WebhookTokenCache
 
 
 @receiver(post_save, sender=User)
 def create_user_credentials(sender, instance, created, **kwargs):
     if created:
         UserCredentials.objects.create(user=instance)
+        ColorResolver.invalidate(instance.pk)
+        CredentialCache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=EntityColorMapping)
+@receiver(post_delete, sender=EntityColorMapping)
+@receiver(post_save, sender=TogglProject)
+@receiver(post_delete, sender=TogglProject)
+@receiver(post_save, sender=TogglWorkspace)
+@receiver(post_delete, sender=TogglWorkspace)
+def invalidate_color_resolver(sender, instance, **kwargs):
+    ColorResolver.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=TogglWorkspace)
+@receiver(post_delete, sender=TogglWorkspace)
+def invalidate_webhook_routes(sender, instance, **kwargs):
+    WebhookTokenCache.invalidate(workspace_id=instance.pk, token=instance.webhook_token)
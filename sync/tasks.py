@@ -1,161 +1,238 @@
+import itertools
+import json
 import logging
-import re
-import secrets
+import time
+from datetime import timedelta
 
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Q
 from django.utils import timezone
 
 from .models import (
-    TogglTimeEntry, TogglOrganization, TogglWorkspace, TogglProject,
-    TogglTag, EntityColorMapping,
+    TogglTimeEntry, UserCredentials,
+    ColorResolver, EntryMetadata, WebhookInboxItem,
 )
+from .backfill import TimeEntryBackfill
+from .dispatch import BULK, dispatch
+from .ingest import WebhookBulkIngest
+from .metadata import MetadataSync
+from .scheduling import claim_entry_sync, request_entry_sync
 from .services import GoogleCalendarService, GoogleCalendarError, TogglService, TogglAPIError
+from .webhooks import handle_time_entry_event, wake_inbox_consumer
 
 logger = logging.getLogger(__name__)
 
 
-def process_time_entry_event(user_id: int, entry_id: int):
-    try:
-        user = User.objects.get(id=user_id)
-    except User.DoesNotExist:
-        logger.error(f"User {user_id} not found")
-        return
+def run_entry_sync(user_id: int, entry_id: int):
+    """Coalesced entry sync, queued by sync.scheduling.request_entry_sync.
 
-    try:
-        entry = TogglTimeEntry.objects.get(user=user, toggl_id=entry_id)
-    except TogglTimeEntry.DoesNotExist:
-        logger.warning(f"Entry {entry_id} not found in database")
+    The edited entry goes out in the first page, then the slice drains the
+    rest of the user's unsynced backlog, so tasks queued for other entries
+    in the same burst find little or nothing left to do.
+    """
+    pending = claim_entry_sync(user_id, entry_id)
+    if pending is None:
         return
+    if pending.requests > 1:
+        logger.info(f"Coalesced {pending.requests} sync requests for entry {entry_id}")
+    drain_unsynced_entries(
+        user_id, max_batches=settings.DISPATCH_SLICE_BATCHES, first_toggl_id=entry_id,
+    )
 
-    if not user.credentials.is_connected:
-        logger.warning(f"Skipping entry {entry_id}: Google Calendar not connected")
-        return
 
-    logger.info(f"Processing entry {entry_id} (user: {user.username})")
-    logger.debug(
-        f"Entry {entry_id} state: desc={entry.description!r} "
-        f"start={entry.start_time} end={entry.end_time} "
-        f"synced={entry.synced} updated_at={entry.updated_at}"
-    )
+def process_time_entry_event(user_id: int, entry_id: int):
+    """Kept for tasks queued before coalescing; requests a coalesced sync."""
+    request_entry_sync(user_id, entry_id)
 
-    try:
-        if entry.pending_deletion:
-            _handle_deleted(entry)
-        else:
-            _sync_to_calendar(entry)
-
-        db_entry = TogglTimeEntry.objects.get(id=entry.id)
-        logger.debug(
-            f"Entry {entry_id} post-sync DB state: desc={db_entry.description!r} "
-            f"start={db_entry.start_time} end={db_entry.end_time} "
-            f"synced={db_entry.synced} updated_at={db_entry.updated_at} "
-            f"(task read updated_at={entry.updated_at})"
-        )
 
-        updated = TogglTimeEntry.objects.filter(
-            id=entry.id,
-            updated_at=entry.updated_at,
-        ).update(synced=True)
+def _refresh_metadata(user: User, entries) -> EntryMetadata:
+    """Load names for ``entries``, fetching from Toggl once if any are unknown."""
+    metadata = EntryMetadata(user.id, entries)
+    if not metadata.missing:
+        return metadata
 
-        if not updated:
-            logger.info(
-                f"Entry {entry_id} was modified during sync, "
-                f"skipping synced=True (next task will handle it)"
-            )
-        else:
-            logger.debug(f"Entry {entry_id} marked synced=True")
+    creds = user.credentials
+    if not creds.toggl_api_token:
+        return metadata
 
-    except Exception as e:
-        logger.exception(f"Error processing entry {entry_id}: {e}")
+    # Upsert only: pruning belongs to the full metadata sync, not to entry syncs
+    MetadataSync(user, TogglService(creds.toggl_api_token)).sync_projects_and_tags(prune=False)
+    metadata.reload()
+    return metadata
 
 
-def _refresh_unknown_metadata(entry: TogglTimeEntry):
-    """Fetch metadata from Toggl if entry references unknown projects/tags."""
-    user = entry.user
-    unknown_project = (
-        entry.project_id
-        and not TogglProject.objects.filter(user=user, toggl_id=entry.project_id).exists()
+def _remember_event(entry: TogglTimeEntry, event: dict):
+    """Store the Google event id/etag so later writes can skip the lookup."""
+    # Events without an etag (409 fallback in create_event) carry no real id
+    if not event or not event.get("etag"):
+        return
+    entry.google_event_id = event["id"]
+    entry.google_event_etag = event["etag"]
+    # queryset update: leaves updated_at alone for the optimistic synced check
+    TogglTimeEntry.objects.filter(id=entry.id).update(
+        google_event_id=entry.google_event_id,
+        google_event_etag=entry.google_event_etag,
     )
-    unknown_tags = (
-        entry.tag_ids
-        and not TogglTag.objects.filter(user=user, toggl_id__in=entry.tag_ids).count() == len(entry.tag_ids)
+
+
+def _forget_event(entry: TogglTimeEntry):
+    entry.google_event_id = ""
+    entry.google_event_etag = ""
+    TogglTimeEntry.objects.filter(id=entry.id).update(
+        google_event_id="", google_event_etag=""
     )
-    if not unknown_project and not unknown_tags:
+
+
+def sync_entries_batch(user_id: int, entry_ids: list[int]):
+    """Sync many entries of one user through batched Calendar requests."""
+    try:
+        user = User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        logger.error(f"User {user_id} not found")
         return
 
-    creds = user.credentials
-    if not creds.toggl_api_token:
+    if not user.credentials.is_connected:
+        logger.warning(f"Skipping batch sync for {user.username}: Google Calendar not connected")
         return
 
-    toggl = TogglService(creds.toggl_api_token)
-    for ws in TogglWorkspace.objects.filter(user=user):
-        try:
-            for project in toggl.get_projects(ws.toggl_id):
-                TogglProject.objects.update_or_create(
-                    user=user, toggl_id=project["id"],
-                    defaults={"workspace": ws, "name": project["name"],
-                              "color": project.get("color"), "active": project.get("active", True)},
-                )
-        except TogglAPIError:
-            pass
-        try:
-            tags = toggl.get_tags(ws.toggl_id)
-            if tags:
-                for tag in tags:
-                    TogglTag.objects.update_or_create(
-                        user=user, toggl_id=tag["id"],
-                        defaults={"workspace": ws, "name": tag["name"]},
-                    )
-        except TogglAPIError:
-            pass
+    entries = list(TogglTimeEntry.objects.filter(user=user, toggl_id__in=entry_ids))
+    if not entries:
+        return
 
+    try:
+        synced = _push_entries(user, entries)
+    except Exception as e:
+        logger.exception(f"Error batch syncing {len(entries)} entries for {user.username}: {e}")
+        return
 
-def _sync_to_calendar(entry: TogglTimeEntry):
-    user = entry.user
-    _refresh_unknown_metadata(entry)
-    color_id = EntityColorMapping.resolve_color(user, project_id=entry.project_id, tag_ids=entry.tag_ids)
-    gcal_data = entry.get_gcal_data(color_id=color_id)
+    logger.info(
+        f"Batch synced {synced}/{len(entries)} entries for {user.username}"
+    )
 
-    gcal = GoogleCalendarService(user=user)
-    calendar_id = gcal.ensure_toggl_calendar()
 
-    existing = gcal.find_event_by_ical_uid(
-        calendar_id=calendar_id,
-        ical_uid=entry.gcal_event_id,
+def _push_entries(user: User, entries: list[TogglTimeEntry], gcal=None, calendar_id=None) -> int:
+    """Write ``entries`` to the calendar in batches and mark them synced.
+
+    Names and colors are looked up once for the whole list. Each row is
+    only marked synced if its updated_at is unchanged since it was read.
+    Returns the number of rows marked synced.
+    """
+    entries = {entry.id: entry for entry in entries}
+    upserts = {}
+    deletes = {}
+    # Rows with a stored event are written by id, without the iCalUID lookup
+    known = {
+        entry.id: (entry.google_event_id, entry.google_event_etag)
+        for entry in entries.values() if entry.google_event_id
+    }
+    live = [entry for entry in entries.values() if not entry.pending_deletion]
+    metadata = _refresh_metadata(user, live)
+    resolver = ColorResolver.for_user(user)
+    for entry in entries.values():
+        if entry.pending_deletion:
+            deletes[entry.id] = entry.gcal_event_id
+            continue
+        color_id = resolver.resolve(entry.project_id, entry.tag_ids)
+        upserts[entry.id] = entry.get_gcal_data(color_id=color_id, metadata=metadata)
+
+    if gcal is None:
+        gcal = GoogleCalendarService(user=user)
+        calendar_id = gcal.ensure_toggl_calendar()
+    results = gcal.sync_events_batch(
+        calendar_id, upserts=upserts, deletes=deletes, known=known,
     )
 
-    if existing:
-        gcal.update_event(
-            calendar_id=calendar_id,
-            event_id=existing["id"],
-            summary=gcal_data["summary"],
-            start=gcal_data["start"],
-            end=gcal_data["end"],
-            description=gcal_data["description"],
-            color_id=gcal_data["color_id"],
-        )
-        logger.info(f"Updated calendar event for entry {entry.toggl_id}")
-    else:
-        gcal.create_event(calendar_id=calendar_id, **gcal_data)
-        logger.info(f"Created calendar event for entry {entry.toggl_id}")
-
+    synced = 0
+    for pk, result in results.items():
+        entry = entries[pk]
+        if isinstance(result, GoogleCalendarError):
+            logger.warning(f"Batch sync failed for entry {entry.toggl_id}: {result}")
+            continue
+        if entry.pending_deletion:
+            _forget_event(entry)
+        else:
+            _remember_event(entry, result)
+        synced += TogglTimeEntry.objects.filter(
+            id=pk,
+            updated_at=entry.updated_at,
+        ).update(synced=True)
+    return synced
+
+
+def drain_unsynced_entries(
+    user_id: int, batch_size: int | None = None, max_batches: int | None = None,
+    first_toggl_id: int | None = None,
+) -> int:
+    """Push every unsynced entry of one user to the calendar.
+
+    Rows are read oldest change first along the (user, synced, updated_at)
+    index, SYNC_DRAIN_BATCH at a time, and each page goes out as one
+    batched Calendar write. Paging is keyed on (updated_at, id): rows that
+    fail are left for the next drain instead of being retried in a loop,
+    while rows edited mid-drain move past the cursor and are pushed again
+    with their new state. With ``max_batches`` the drain stops after that
+    many full pages and dispatches the rest as a bulk job, so other users
+    get a turn. The unsynced row of ``first_toggl_id``, if any, leads the
+    first page whatever its place in that order. Returns the number of
+    rows marked synced.
+    """
+    try:
+        user = User.objects.select_related("credentials").get(id=user_id)
+    except User.DoesNotExist:
+        logger.error(f"User {user_id} not found")
+        return 0
 
-def _handle_deleted(entry: TogglTimeEntry):
-    user = entry.user
-    gcal = GoogleCalendarService(user=user)
-    calendar_id = gcal.ensure_toggl_calendar()
+    if not user.credentials.is_connected:
+        logger.warning(f"Skipping drain for {user.username}: Google Calendar not connected")
+        return 0
+
+    batch_size = batch_size or settings.SYNC_DRAIN_BATCH
+    pending = TogglTimeEntry.objects.filter(user=user, synced=False).order_by("updated_at", "id")
+    gcal = None
+    calendar_id = None
+    seen = 0
+    synced = 0
+    pages = 0
+    page = []
+    if first_toggl_id is not None:
+        page = list(pending.filter(toggl_id=first_toggl_id))
+        pending = pending.exclude(toggl_id=first_toggl_id)
+    remaining = pending
+    page += remaining[:batch_size - len(page)]
+    while page:
+        try:
+            if gcal is None:
+                gcal = GoogleCalendarService(user=user)
+                calendar_id = gcal.ensure_toggl_calendar()
+            synced += _push_entries(user, page, gcal=gcal, calendar_id=calendar_id)
+        except Exception as e:
+            logger.exception(f"Error draining entries for {user.username}: {e}")
+            break
+        seen += len(page)
+        pages += 1
+        if len(page) < batch_size:
+            break
+        if max_batches and pages >= max_batches:
+            # A slice that synced nothing would only requeue the same failures
+            if synced:
+                dispatch(
+                    "sync.tasks.drain_unsynced_entries", user_id, batch_size, max_batches,
+                    user_id=user_id, lane=BULK,
+                )
+            break
+        last = page[-1]
+        if last.toggl_id != first_toggl_id:
+            remaining = pending.filter(
+                Q(updated_at__gt=last.updated_at) | Q(updated_at=last.updated_at, id__gt=last.id)
+            )
+        page = list(remaining[:batch_size])
 
-    event = gcal.find_event_by_ical_uid(
-        calendar_id=calendar_id,
-        ical_uid=entry.gcal_event_id,
-    )
-    if event:
-        gcal.delete_event(calendar_id, event["id"])
-        logger.info(f"Deleted calendar event for entry {entry.toggl_id}")
-    else:
-        logger.debug(f"Event {entry.toggl_id} not found in calendar, already deleted")
+    if seen:
+        logger.info(f"Drained {synced}/{seen} unsynced entries for {user.username}")
+    return synced
 
 
 def apply_color_to_entry(entry_id: int, color_id: str):
@@ -171,6 +248,18 @@ def apply_color_to_entry(entry_id: int, color_id: str):
     gcal = GoogleCalendarService(user=user)
     calendar_id = gcal.ensure_toggl_calendar()
 
+    if entry.google_event_id:
+        event = gcal.patch_event(
+            calendar_id=calendar_id,
+            event_id=entry.google_event_id,
+            etag=entry.google_event_etag,
+            color_id=color_id,
+        )
+        if event:
+            _remember_event(entry, event)
+            logger.info(f"Applied color {color_id} to entry {entry.toggl_id}")
+            return
+
     event = gcal.find_event_by_ical_uid(
         calendar_id=calendar_id,
         ical_uid=entry.gcal_event_id,
@@ -180,11 +269,12 @@ def apply_color_to_entry(entry_id: int, color_id: str):
         entry.save(update_fields=["synced"])
         return
 
-    gcal.update_event(
+    event = gcal.update_event(
         calendar_id=calendar_id,
         event_id=event["id"],
         color_id=color_id,
     )
+    _remember_event(entry, event)
     logger.info(f"Applied color {color_id} to entry {entry.toggl_id}")
 
 
@@ -198,121 +288,17 @@ def sync_toggl_metadata_for_user(request, user):
 
     try:
         toggl = TogglService(creds.toggl_api_token)
-
-        orgs = toggl.get_organizations()
-        org_count = 0
-        for org in orgs:
-            TogglOrganization.objects.update_or_create(
-                user=user,
-                toggl_id=org["id"],
-                defaults={"name": org["name"]},
-            )
-            org_count += 1
-
-        workspaces = toggl.get_workspaces()
-        ws_count = 0
-        for ws in workspaces:
-            org = None
-            if ws.get("organization_id"):
-                org = TogglOrganization.objects.filter(
-                    user=user, toggl_id=ws["organization_id"]
-                ).first()
-
-            workspace, created = TogglWorkspace.objects.update_or_create(
-                user=user,
-                toggl_id=ws["id"],
-                defaults={
-                    "name": ws["name"],
-                    "organization": org,
-                },
-            )
-            if not workspace.webhook_token:
-                workspace.webhook_token = secrets.token_urlsafe(32)
-                workspace.save(update_fields=["webhook_token"])
-            ws_count += 1
-
-        proj_count = 0
-        tag_count = 0
-        webhook_count = 0
-        webhook_domain = settings.WEBHOOK_DOMAIN
-
-        for ws in TogglWorkspace.objects.filter(user=user):
-            try:
-                projects = toggl.get_projects(ws.toggl_id)
-                for project in projects:
-                    TogglProject.objects.update_or_create(
-                        user=user,
-                        toggl_id=project["id"],
-                        defaults={
-                            "workspace": ws,
-                            "name": project["name"],
-                            "color": project.get("color"),
-                            "active": project.get("active", True),
-                        },
-                    )
-                    proj_count += 1
-            except TogglAPIError as e:
-                logger.warning(
-                    f"Failed to sync projects for workspace {ws.toggl_id} "
-                    f"(user: {user.username}): {e}"
-                )
-
-            try:
-                tags = toggl.get_tags(ws.toggl_id)
-                if tags:
-                    for tag in tags:
-                        TogglTag.objects.update_or_create(
-                            user=user,
-                            toggl_id=tag["id"],
-                            defaults={
-                                "workspace": ws,
-                                "name": tag["name"],
-                            },
-                        )
-                        tag_count += 1
-            except TogglAPIError as e:
-                logger.warning(
-                    f"Failed to sync tags for workspace {ws.toggl_id} "
-                    f"(user: {user.username}): {e}"
-                )
-
-            try:
-                webhooks = toggl.list_webhooks(ws.toggl_id)
-                if webhooks:
-                    for webhook in webhooks:
-                        callback_url = webhook.get("url_callback", "")
-                        if webhook_domain and webhook_domain in callback_url:
-                            match = re.search(
-                                r"/webhook/toggl/([^/]+)/?", callback_url
-                            )
-                            if match:
-                                token = match.group(1)
-                                ws.webhook_token = token
-                                ws.webhook_subscription_id = webhook.get(
-                                    "subscription_id"
-                                )
-                                ws.webhook_secret = webhook.get("secret")
-                                ws.webhook_enabled = webhook.get(
-                                    "enabled", False
-                                )
-                                ws.save()
-                                webhook_count += 1
-                                logger.info(
-                                    f"Found existing webhook for workspace {ws.name}: "
-                                    f"subscription_id={ws.webhook_subscription_id}"
-                                )
-            except TogglAPIError as e:
-                logger.debug(
-                    f"Could not fetch webhooks for workspace {ws.toggl_id}: {e}"
-                )
+        engine = MetadataSync(user, toggl)
+        engine.sync_organizations()
+        engine.sync_workspaces()
+        engine.sync_projects_and_tags(include_webhooks=True)
+        stats = engine.stats
+        webhook_count = engine.webhooks_found
 
         creds.last_toggl_metadata_sync = timezone.now()
         creds.save(update_fields=["last_toggl_metadata_sync"])
 
-        msg = (
-            f"Synced {org_count} organizations, {ws_count} workspaces, "
-            f"{proj_count} projects, {tag_count} tags"
-        )
+        msg = "Synced " + "; ".join(f"{kind}: {counts}" for kind, counts in stats.items())
         if webhook_count:
             msg += f", {webhook_count} existing webhooks"
         msg += f" for {user.username}"
@@ -325,68 +311,305 @@ def sync_toggl_metadata_for_user(request, user):
         messages.error(request, f"Error: {e}")
 
 
-def validate_synced_events():
-    synced_entries = TogglTimeEntry.objects.filter(
-        synced=True,
-        pending_deletion=False,
-    ).select_related('user')
+def _credentials_with_toggl_token():
+    return UserCredentials.objects.exclude(toggl_api_token="")
 
-    if not synced_entries.exists():
-        return
 
-    entries_by_user = {}
-    for entry in synced_entries:
-        entries_by_user.setdefault(entry.user_id, []).append(entry)
+def queue_time_entry_backfill():
+    """Scheduled: dispatch one bulk backfill job per user with a Toggl token."""
+    for user_id in _credentials_with_toggl_token().values_list("user_id", flat=True):
+        dispatch("sync.tasks.backfill_time_entries", user_id, user_id=user_id, lane=BULK)
+
+
+def backfill_time_entries(user_id: int | None = None):
+    """Catch up on time entries the webhooks did not deliver."""
+    creds_qs = _credentials_with_toggl_token().select_related("user")
+    if user_id is not None:
+        creds_qs = creds_qs.filter(user_id=user_id)
+
+    for creds in creds_qs:
+        try:
+            backfill_user_entries(creds.user)
+        except TogglAPIError as e:
+            logger.warning(f"Time entry backfill failed for {creds.user.username}: {e}")
+        except Exception as e:
+            logger.exception(f"Time entry backfill failed for {creds.user.username}: {e}")
+
+
+def backfill_user_entries(user: User, days: int | None = None, full: bool = False):
+    """Backfill one user's entries and queue calendar syncs for the changes."""
+    creds = user.credentials
+    engine = TimeEntryBackfill(user, TogglService(creds.toggl_api_token))
+    stats = engine.run(days=days, full=full)
+
+    if engine.changed_ids and creds.is_connected:
+        dispatch(
+            "sync.tasks.drain_unsynced_entries", user.id, None, settings.DISPATCH_SLICE_BATCHES,
+            user_id=user.id, lane=BULK,
+        )
+
+    logger.info(f"Backfilled time entries for {user.username}: {stats}")
+    return stats
+
+
+def ingest_webhook_events(user: User, raw: str, secrets: list[str] = ()):
+    """Apply a batch of webhook events and queue one calendar drain for them."""
+    engine = WebhookBulkIngest(user, secrets)
+    stats = engine.run(raw)
+
+    if engine.changed_ids and user.credentials.is_connected:
+        dispatch(
+            "sync.tasks.drain_unsynced_entries", user.id, None, settings.DISPATCH_SLICE_BATCHES,
+            user_id=user.id, lane=BULK,
+        )
+
+    logger.info(f"Ingested webhook events for {user.username}: {stats}")
+    return stats
+
+
+def _users_with_synced_entries():
+    return (
+        TogglTimeEntry.objects.filter(synced=True, pending_deletion=False)
+        .order_by()
+        .values_list("user_id", flat=True)
+        .distinct()
+    )
+
+
+def queue_event_validation():
+    """Scheduled: dispatch one bulk validation job per user with synced entries."""
+    for user_id in _users_with_synced_entries():
+        dispatch("sync.tasks.validate_synced_events", user_id, user_id=user_id, lane=BULK)
+
+
+def validate_synced_events(user_id: int | None = None):
+    """Reconcile synced entries against the Toggl calendar.
+
+    Per user, two bounded passes run: events changed since the last run
+    (via the stored sync token) are diffed against their rows, and a
+    rotating window of rows is looked up in Google to catch missing events.
+    """
+    user_ids = _users_with_synced_entries()
+    if user_id is not None:
+        user_ids = user_ids.filter(user_id=user_id)
 
     total_checked = 0
     total_discrepancies = 0
 
-    for user_id, entries in entries_by_user.items():
-        user = entries[0].user
-
+    for user in User.objects.filter(id__in=user_ids).select_related("credentials"):
         if not user.credentials.is_connected:
             continue
 
         try:
-            gcal = GoogleCalendarService(user=user)
-            calendar_id = gcal.ensure_toggl_calendar()
+            checked, discrepancies = _reconcile_calendar(user)
         except Exception as e:
             logger.warning(f"Cannot validate events for {user.username}: {e}")
             continue
 
-        for entry in entries[:20]:
-            total_checked += 1
-            try:
-                event = gcal.find_event_by_ical_uid(
-                    calendar_id=calendar_id,
-                    ical_uid=entry.gcal_event_id,
-                )
-
-                if not event:
-                    logger.warning(
-                        f"Validation: entry {entry.toggl_id} not found in calendar, marking unsynced"
-                    )
-                    entry.synced = False
-                    entry.save(update_fields=["synced"])
-                    total_discrepancies += 1
-                    continue
-
-                expected_summary = entry.description or "(No description)"
-                actual_summary = event.get("summary", "")
-                if expected_summary != actual_summary:
-                    logger.warning(
-                        f"Validation: entry {entry.toggl_id} summary mismatch: "
-                        f"expected={expected_summary!r}, actual={actual_summary!r}"
-                    )
-                    entry.synced = False
-                    entry.save(update_fields=["synced"])
-                    total_discrepancies += 1
-
-            except GoogleCalendarError as e:
-                logger.warning(f"Validation: could not check entry {entry.toggl_id}: {e}")
+        total_checked += checked
+        total_discrepancies += discrepancies
 
     if total_discrepancies:
         logger.info(
             f"Validation: checked {total_checked}, "
             f"found {total_discrepancies} discrepancies"
         )
+
+
+# Max rows held in memory at once while validating
+RECONCILE_CHUNK_SIZE = 500
+
+
+def _reconcile_calendar(user: User) -> tuple[int, int]:
+    creds = user.credentials
+    gcal = GoogleCalendarService(user=user)
+    calendar_id = gcal.ensure_toggl_calendar()
+
+    synced_rows = TogglTimeEntry.objects.filter(
+        user=user, synced=True, pending_deletion=False
+    ).values_list("id", "toggl_id", "description")
+
+    checked = 0
+    unsynced = 0
+
+    # Events changed since the last run (the whole calendar on the first)
+    sync_token = creds.google_sync_token
+    for events, next_sync_token in gcal.iter_event_changes(calendar_id, sync_token):
+        events_by_toggl_id = {}
+        for event in events:
+            toggl_id = _toggl_id_from_ical_uid(event.get("iCalUID", ""))
+            if toggl_id is not None:
+                events_by_toggl_id[toggl_id] = event
+
+        changed_ids = list(events_by_toggl_id)
+        for i in range(0, len(changed_ids), RECONCILE_CHUNK_SIZE):
+            rows = synced_rows.filter(
+                toggl_id__in=changed_ids[i:i + RECONCILE_CHUNK_SIZE]
+            )
+            for chunk in _iter_chunks(rows, RECONCILE_CHUNK_SIZE):
+                checked += len(chunk)
+                unsynced += _mark_discrepancies(chunk, events_by_toggl_id)
+
+        sync_token = next_sync_token or sync_token
+
+    creds.google_sync_token = sync_token
+    UserCredentials.objects.filter(id=creds.id).update(google_sync_token=sync_token)
+
+    # Rotating window of rows, so rows missing from Google are caught too
+    window = synced_rows.filter(id__gt=creds.validation_cursor).order_by("id")
+    window = window[:settings.SYNC_VALIDATE_WINDOW]
+    cursor = 0
+    seen = 0
+    for chunk in _iter_chunks(window, RECONCILE_CHUNK_SIZE):
+        found = gcal.find_events_by_ical_uids(
+            calendar_id,
+            {toggl_id: f"toggl{toggl_id}" for _, toggl_id, _ in chunk},
+        )
+        events_by_toggl_id = {
+            toggl_id: event for toggl_id, event in found.items()
+            if not isinstance(event, GoogleCalendarError)
+        }
+        verified = [row for row in chunk if row[1] in events_by_toggl_id]
+        checked += len(verified)
+        unsynced += _mark_discrepancies(verified, events_by_toggl_id)
+        seen += len(chunk)
+        cursor = chunk[-1][0]
+
+    if seen < settings.SYNC_VALIDATE_WINDOW:
+        cursor = 0  # reached the end, start over next run
+    creds.validation_cursor = cursor
+    UserCredentials.objects.filter(id=creds.id).update(validation_cursor=cursor)
+
+    logger.debug(
+        f"Validation for {user.username}: {checked} entries checked, "
+        f"{unsynced} discrepancies, next window after id {cursor}"
+    )
+    return checked, unsynced
+
+
+def _iter_chunks(queryset, size: int):
+    """Stream a queryset as lists of at most ``size`` rows."""
+    rows = queryset.iterator(chunk_size=size)
+    while chunk := list(itertools.islice(rows, size)):
+        yield chunk
+
+
+def _mark_discrepancies(rows, events_by_toggl_id: dict) -> int:
+    """Mark (id, toggl_id, description) rows unsynced if their event differs."""
+    unsynced = []
+    for pk, toggl_id, description in rows:
+        event = events_by_toggl_id.get(toggl_id)
+
+        if event is None or event.get("status") == "cancelled":
+            logger.warning(
+                f"Validation: entry {toggl_id} not found in calendar, marking unsynced"
+            )
+            unsynced.append(pk)
+            continue
+
+        expected_summary = description or "(No description)"
+        actual_summary = event.get("summary", "")
+        if expected_summary != actual_summary:
+            logger.warning(
+                f"Validation: entry {toggl_id} summary mismatch: "
+                f"expected={expected_summary!r}, actual={actual_summary!r}"
+            )
+            unsynced.append(pk)
+
+    if unsynced:
+        TogglTimeEntry.objects.filter(id__in=unsynced).update(synced=False)
+    return len(unsynced)
+
+
+def _toggl_id_from_ical_uid(ical_uid: str) -> int | None:
+    """Inverse of TogglTimeEntry.gcal_event_id."""
+    if not ical_uid.startswith("toggl"):
+        return None
+    try:
+        return int(ical_uid[len("toggl"):])
+    except ValueError:
+        return None
+
+
+def _claimable_inbox_items(now):
+    # Claims older than the cluster's retry window belong to a lost drain or
+    # to an item that failed; both are taken over
+    lost = now - timedelta(seconds=settings.Q_CLUSTER["retry"])
+    return WebhookInboxItem.objects.filter(
+        processed_at__isnull=True, attempts__lt=settings.WEBHOOK_INBOX_MAX_ATTEMPTS,
+    ).filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=lost))
+
+
+def drain_webhook_inbox(batch_size: int | None = None, budget: float | None = None) -> int:
+    """Process pending inbox items in arrival order; returns how many ran.
+
+    Items are leased through ``claimed_at`` and marked processed in the
+    transaction that applies them, so a drain killed mid-page leaves its
+    items to be taken over once the lease runs out. Failing items are
+    retried the same way until WEBHOOK_INBOX_MAX_ATTEMPTS, then kept
+    unprocessed with their error. The drain stops after ``budget`` seconds
+    (WEBHOOK_INBOX_TIME_BUDGET) and queues a fresh one for the rest.
+    """
+    batch_size = batch_size or settings.WEBHOOK_INBOX_BATCH
+    budget = settings.WEBHOOK_INBOX_TIME_BUDGET if budget is None else budget
+    deadline = time.monotonic() + budget
+    processed = 0
+
+    while time.monotonic() < deadline:
+        now = timezone.now()
+        items = list(
+            _claimable_inbox_items(now).select_related("workspace__user").order_by("id")[:batch_size]
+        )
+        if not items:
+            break
+
+        # Lease first so a concurrent drain skips these rows
+        ids = [item.id for item in items]
+        claimed = _claimable_inbox_items(now).filter(id__in=ids).update(
+            claimed_at=now, attempts=F("attempts") + 1
+        )
+        if not claimed:
+            continue
+        if claimed < len(items):
+            # A concurrent drain claimed some of them; process only ours
+            ours = set(WebhookInboxItem.objects.filter(
+                id__in=ids, claimed_at=now
+            ).values_list("id", flat=True))
+            items = [item for item in items if item.id in ours]
+
+        for i, item in enumerate(items):
+            if time.monotonic() >= deadline:
+                # Hand the rest of the page straight to the next drain
+                WebhookInboxItem.objects.filter(
+                    id__in=[rest.id for rest in items[i:]], claimed_at=now
+                ).update(claimed_at=None, attempts=F("attempts") - 1)
+                break
+            try:
+                with transaction.atomic():
+                    handle_time_entry_event(item.workspace.user, json.loads(item.body))
+                    WebhookInboxItem.objects.filter(id=item.id).update(
+                        processed_at=timezone.now(), error=""
+                    )
+            except Exception as e:
+                logger.exception(f"Failed to process webhook inbox item {item.id}: {e}")
+                # The lease stays, so the item is retried once it runs out
+                WebhookInboxItem.objects.filter(id=item.id).update(error=str(e))
+                if item.attempts + 1 >= settings.WEBHOOK_INBOX_MAX_ATTEMPTS:
+                    logger.error(f"Giving up on webhook inbox item {item.id}")
+            processed += 1
+    else:
+        if _claimable_inbox_items(timezone.now()).exists():
+            wake_inbox_consumer(force=True)
+
+    retention = timezone.now() - timedelta(days=settings.WEBHOOK_INBOX_RETENTION_DAYS)
+    WebhookInboxItem.objects.filter(processed_at__lt=retention).delete()
+    # Dead letters are kept as long, for inspection
+    WebhookInboxItem.objects.filter(
+        processed_at__isnull=True,
+        attempts__gte=settings.WEBHOOK_INBOX_MAX_ATTEMPTS,
+        received_at__lt=retention,
+    ).delete()
+
+    if processed:
+        logger.info(f"Processed {processed} webhook inbox items")
+    return processed
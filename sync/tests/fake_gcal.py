@@ -0,0 +1,210 @@
+"""In-memory stand-in for the Google Calendar v3 REST API.
+
+Plugs into googleapiclient as the ``http`` object, so requests built by
+``GoogleCalendarService`` (including batch requests) are served locally.
+"""
+
+import copy
+import itertools
+import json
+import re
+import urllib.parse
+from email.parser import Parser
+
+import httplib2
+from googleapiclient.discovery import build_from_document
+
+from sync.services.gcal import _calendar_discovery_document
+
+API_PREFIX = "/calendar/v3"
+BATCH_PATH = "/batch/calendar/v3"
+
+
+class FakeCalendarAPI:
+    def __init__(self):
+        self.calendars = {}
+        self.http_calls = 0
+        self.operations = []
+        self.bodies = []
+        self.page_size = 250
+        self._ids = itertools.count(1)
+        self._changes = itertools.count(1)
+        self._changed_at = {}
+        self._sync_seq = 0
+
+    def build_service(self, credentials=None):
+        """Drop-in replacement for ``gcal.build_calendar_service``."""
+        return build_from_document(_calendar_discovery_document(), http=self)
+
+    def add_calendar(self, calendar_id: str = "cal_id") -> str:
+        self.calendars.setdefault(calendar_id, {})
+        return calendar_id
+
+    def add_event(self, calendar_id: str = "cal_id", **fields) -> dict:
+        event = self._new_event(fields)
+        self.calendars.setdefault(calendar_id, {})[event["id"]] = event
+        return copy.deepcopy(event)
+
+    def events(self, calendar_id: str = "cal_id") -> list[dict]:
+        return list(self.calendars.get(calendar_id, {}).values())
+
+    def count(self, method: str) -> int:
+        return sum(1 for op in self.operations if op == method)
+
+    # httplib2.Http interface
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        self.http_calls += 1
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        parsed = urllib.parse.urlparse(uri)
+
+        if parsed.path == BATCH_PATH:
+            return self._batch(body, headers)
+
+        status, payload = self._dispatch(method, parsed.path, parsed.query, body, headers)
+        return _response(status), json.dumps(payload).encode("utf-8")
+
+    def _batch(self, body, headers):
+        boundary = "fake_batch_boundary"
+        message = Parser().parsestr(
+            f"Content-Type: {headers['content-type']}\r\n\r\n{body}"
+        )
+        parts = []
+        for part in message.get_payload():
+            request_text = part.get_payload()
+            request_line, rest = request_text.split("\n", 1)
+            method, path_and_query, _ = request_line.split(" ")
+            sub = Parser().parsestr(rest)
+            path, _, query = path_and_query.partition("?")
+            sub_headers = {k.lower(): v for k, v in sub.items()}
+            status, payload = self._dispatch(
+                method, path, query, sub.get_payload() or None, sub_headers
+            )
+            content_id = part["Content-ID"][1:-1]
+            parts.append(
+                f"--{boundary}\r\n"
+                f"Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} X\r\n"
+                f"Content-Type: application/json\r\n\r\n"
+                f"{json.dumps(payload)}\r\n"
+            )
+        content = "".join(parts) + f"--{boundary}--\r\n"
+        response = _response(200, f"multipart/mixed; boundary={boundary}")
+        return response, content.encode("utf-8")
+
+    # Calendar API
+
+    def _dispatch(self, method, path, query, body, headers):
+        path = path[len(API_PREFIX):] if path.startswith(API_PREFIX) else path
+        params = dict(urllib.parse.parse_qsl(query))
+        data = json.loads(body) if body else {}
+        self.bodies.append(data)
+
+        if method == "POST" and path == "/calendars":
+            self.operations.append("calendars.insert")
+            calendar_id = f"cal{next(self._ids)}@group.calendar.google.com"
+            self.add_calendar(calendar_id)
+            return 200, {"id": calendar_id, **data}
+
+        match = re.fullmatch(r"/calendars/([^/]+)/events(?:/([^/]+))?", path)
+        if not match:
+            return 404, _error(404, "Not Found")
+        calendar_id = urllib.parse.unquote(match.group(1))
+        event_id = match.group(2) and urllib.parse.unquote(match.group(2))
+        events = self.calendars.get(calendar_id)
+        if events is None:
+            return 404, _error(404, "Calendar not found")
+
+        if event_id is None:
+            if method == "GET":
+                self.operations.append("events.list")
+                return self._list(events, params)
+            if method == "POST":
+                self.operations.append("events.insert")
+                return self._insert(events, data)
+            return 405, _error(405, "Method not allowed")
+
+        self.operations.append({
+            "GET": "events.get", "PUT": "events.update",
+            "PATCH": "events.patch", "DELETE": "events.delete",
+        }.get(method, method))
+
+        event = events.get(event_id)
+        if event is None:
+            return 404, _error(404, "Not Found")
+        if_match = headers.get("if-match")
+        if if_match and if_match != event["etag"]:
+            return 412, _error(412, "Precondition Failed")
+
+        if method == "GET":
+            return 200, copy.deepcopy(event)
+        if method == "DELETE":
+            if event["status"] == "cancelled":
+                return 410, _error(410, "Resource has been deleted")
+            event["status"] = "cancelled"
+            self._touch(event)
+            return 204, ""
+        if method == "PUT":
+            kept = {k: event[k] for k in ("id", "iCalUID", "status") if k in event}
+            event.clear()
+            event.update(data)
+            event.update(kept)
+        elif method == "PATCH":
+            event.update(data)
+        self._touch(event)
+        return 200, copy.deepcopy(event)
+
+    def expire_sync_tokens(self):
+        self._sync_seq = next(self._changes)
+        self._changed_at = {k: self._sync_seq for k in self._changed_at}
+
+    def _list(self, events, params):
+        items = list(events.values())
+        if "syncToken" in params:
+            since = int(params["syncToken"])
+            if since < self._sync_seq:
+                return 410, _error(410, "Sync token is no longer valid")
+            items = [e for e in items if self._changed_at[e["id"]] > since]
+        elif params.get("showDeleted") != "true":
+            items = [e for e in items if e["status"] != "cancelled"]
+        if "iCalUID" in params:
+            items = [e for e in items if e.get("iCalUID") == params["iCalUID"]]
+
+        offset = int(params.get("pageToken", 0))
+        limit = min(int(params.get("maxResults", self.page_size)), self.page_size)
+        page = {"items": copy.deepcopy(items[offset:offset + limit])}
+        if offset + limit < len(items):
+            page["nextPageToken"] = str(offset + limit)
+        elif "iCalUID" not in params:
+            page["nextSyncToken"] = str(max(self._changed_at.values(), default=self._sync_seq))
+        return 200, page
+
+    def _insert(self, events, data):
+        ical_uid = data.get("iCalUID")
+        if ical_uid and any(e.get("iCalUID") == ical_uid for e in events.values()):
+            return 409, _error(409, "The requested identifier already exists.")
+        event = self._new_event(data)
+        events[event["id"]] = event
+        return 200, copy.deepcopy(event)
+
+    def _new_event(self, fields):
+        event_id = f"evt{next(self._ids)}"
+        event = {"status": "confirmed", "iCalUID": f"{event_id}@google.com", **fields}
+        event["id"] = event_id
+        event["etag"] = '"0"'
+        self._touch(event)
+        return event
+
+    def _touch(self, event):
+        version = int(event.get("etag", '"0"').strip('"')) + 1
+        event["etag"] = f'"{version}"'
+        self._changed_at[event["id"]] = next(self._changes)
+
+
+def _response(status, content_type="application/json"):
+    return httplib2.Response({"status": str(status), "content-type": content_type})
+
+
+def _error(status, message):
+    return {"error": {"code": status, "message": message}}
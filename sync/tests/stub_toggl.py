@@ -0,0 +1,72 @@
+"""Local HTTP stand-in for the Toggl API, used by client-level tests."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubToggl(ThreadingHTTPServer):
+    """Serves queued (status, headers, body) responses, then 200 ``[]``."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        self.responses = []
+        self.requests = []
+        self.connections = 0
+        self.delay = 0
+
+    @classmethod
+    def start(cls) -> "StubToggl":
+        server = cls()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        # Clients that time out on purpose hang up mid-response
+        pass
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so connection reuse is observable
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; avoid delayed-ACK stalls
+    disable_nagle_algorithm = True
+
+    def _respond(self):
+        self.server.requests.append((self.command, self.path))
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        status, headers, body = (
+            self.server.responses.pop(0) if self.server.responses else (200, {}, [])
+        )
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        payload = b"" if status == 204 else json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = _respond
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,220 @@
+"""Tests for the time-entry backfill engine, task and command."""
+
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from sync.backfill import TimeEntryBackfill
+from sync.dispatch import BULK
+from sync.models import TogglTimeEntry
+from sync.services.toggl import TogglAPIError
+from sync.tasks import backfill_time_entries, queue_time_entry_backfill
+
+
+def _api_entry(toggl_id, description="Work", **extra):
+    entry = {
+        "id": toggl_id,
+        "description": description,
+        "start": "2026-10-01T09:00:00+00:00",
+        "stop": "2026-10-01T10:00:00+00:00",
+        "project_id": None,
+        "tag_ids": [],
+    }
+    entry.update(extra)
+    return entry
+
+
+@override_settings(TOGGL_BACKFILL_DAYS=90, TOGGL_BACKFILL_WINDOW_DAYS=30)
+class TimeEntryBackfillTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("testuser", password="pass")
+        self.toggl = MagicMock()
+        self.toggl.get_time_entries.return_value = []
+
+    def _run(self, **kwargs):
+        engine = TimeEntryBackfill(self.user, self.toggl)
+        engine.run(**kwargs)
+        self.user.credentials.refresh_from_db()
+        return engine
+
+    def test_first_run_reads_history_in_windows(self):
+        self.toggl.get_time_entries.side_effect = [[_api_entry(1)], [], [_api_entry(2)]]
+        engine = self._run()
+
+        calls = self.toggl.get_time_entries.call_args_list
+        self.assertEqual(len(calls), 3)
+        self.assertTrue(all("since" not in c.kwargs for c in calls))
+        self.assertEqual(calls[0].kwargs["end_date"], calls[1].kwargs["start_date"])
+        self.assertEqual(engine.stats.created, 2)
+        self.assertEqual(sorted(engine.changed_ids), [1, 2])
+        entry = TogglTimeEntry.objects.get(user=self.user, toggl_id=1)
+        self.assertEqual((entry.description, entry.synced), ("Work", False))
+        self.assertIsNotNone(self.user.credentials.toggl_entries_synced_at)
+
+    def test_catch_up_uses_since_and_diffs(self):
+        mark = timezone.now() - timedelta(hours=1)
+        self.user.credentials.toggl_entries_synced_at = mark
+        self.user.credentials.save()
+        self._run_with([_api_entry(1), _api_entry(2)])  # seed
+        TogglTimeEntry.objects.update(synced=True)
+
+        self.toggl.get_time_entries.reset_mock()
+        self.toggl.get_time_entries.return_value = [
+            _api_entry(1),
+            _api_entry(2, description="Renamed"),
+            _api_entry(3),
+        ]
+        engine = self._run()
+
+        since = self.toggl.get_time_entries.call_args.kwargs["since"]
+        self.assertLess(since, int(timezone.now().timestamp()) - 60)
+        stats = engine.stats
+        self.assertEqual((stats.created, stats.updated, stats.unchanged), (1, 1, 1))
+        self.assertEqual(sorted(engine.changed_ids), [2, 3])
+        self.assertTrue(TogglTimeEntry.objects.get(toggl_id=1).synced)
+        self.assertFalse(TogglTimeEntry.objects.get(toggl_id=2).synced)
+
+    def _run_with(self, entries):
+        self.toggl.get_time_entries.return_value = entries
+        return self._run()
+
+    def test_deleted_entries_flagged_for_removal(self):
+        TogglTimeEntry.objects.create(
+            user=self.user, toggl_id=1, start_time=timezone.now(), synced=True,
+        )
+        engine = self._run_with([
+            _api_entry(1, server_deleted_at="2026-10-02T00:00:00Z"),
+            _api_entry(9, server_deleted_at="2026-10-02T00:00:00Z"),
+        ])
+        entry = TogglTimeEntry.objects.get(toggl_id=1)
+        self.assertTrue(entry.pending_deletion)
+        self.assertFalse(entry.synced)
+        self.assertEqual(engine.stats.deleted, 1)
+        self.assertFalse(TogglTimeEntry.objects.filter(toggl_id=9).exists())
+
+    def test_newer_webhook_state_not_overwritten(self):
+        TogglTimeEntry.objects.create(
+            user=self.user, toggl_id=1, description="From webhook", start_time=timezone.now(),
+            toggl_updated_at=timezone.now(),
+        )
+        engine = self._run_with([
+            _api_entry(1, description="Older page", at="2026-10-01T10:00:00+00:00"),
+            _api_entry(2, at="2026-10-01T10:00:00+00:00"),
+        ])
+        self.assertEqual(TogglTimeEntry.objects.get(toggl_id=1).description, "From webhook")
+        self.assertEqual(engine.changed_ids, [2])
+        self.assertIsNotNone(TogglTimeEntry.objects.get(toggl_id=2).toggl_updated_at)
+
+    def test_stale_mark_falls_back_to_windows(self):
+        self.user.credentials.toggl_entries_synced_at = timezone.now() - timedelta(days=110)
+        self.user.credentials.save()
+        self._run()
+        calls = self.toggl.get_time_entries.call_args_list
+        self.assertEqual(len(calls), 4)
+        self.assertTrue(all("start_date" in c.kwargs for c in calls))
+
+    def test_constant_queries_per_page(self):
+        self._run_with([_api_entry(i) for i in range(5)])
+        small = self.toggl.get_time_entries.return_value = [_api_entry(i) for i in range(10, 12)]
+        with self.assertNumQueries(5):
+            TimeEntryBackfill(self.user, self.toggl).apply(small)
+        # Plus one guarded update of the changed rows and its read-back
+        with self.assertNumQueries(7):
+            TimeEntryBackfill(self.user, self.toggl).apply(
+                [_api_entry(i, description="x") for i in range(60)]
+            )
+
+    def test_webhook_written_during_apply_is_not_overwritten(self):
+        TogglTimeEntry.objects.create(
+            user=self.user, toggl_id=1, description="Old", start_time=timezone.now(),
+            toggl_updated_at=timezone.now() - timedelta(days=30),
+        )
+        newer = timezone.now()
+        raced = []
+
+        def concurrent_webhook(execute, sql, params, many, context):
+            # A webhook stores a newer state after the page was read
+            if not raced and sql.startswith("SAVEPOINT"):
+                raced.append(True)
+                TogglTimeEntry.objects.filter(toggl_id=1).update(
+                    description="From webhook", toggl_updated_at=newer
+                )
+            return execute(sql, params, many, context)
+
+        engine = TimeEntryBackfill(self.user, self.toggl)
+        with connection.execute_wrapper(concurrent_webhook):
+            engine.apply([
+                _api_entry(1, description="Older page", at="2026-10-01T10:00:00+00:00"),
+                _api_entry(2, at="2026-10-01T10:00:00+00:00"),
+            ])
+
+        self.assertEqual(TogglTimeEntry.objects.get(toggl_id=1).description, "From webhook")
+        self.assertEqual(engine.changed_ids, [2])
+        self.assertEqual((engine.stats.created, engine.stats.updated, engine.stats.unchanged), (1, 0, 1))
+
+
+@override_settings(DISPATCH_SLICE_BATCHES=1)
+class BackfillTaskTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("testuser", password="pass")
+        self.user.credentials.toggl_api_token = "tok"
+        self.user.credentials.gauth_credentials_json = "{}"
+        self.user.credentials.save()
+        User.objects.create_user("notoken", password="pass")
+
+    @patch("sync.tasks.dispatch")
+    @patch("sync.tasks.TogglService")
+    def test_queues_calendar_sync_for_changes(self, mock_cls, mock_dispatch):
+        mock_cls.return_value.get_time_entries.return_value = [_api_entry(1), _api_entry(2)]
+        backfill_time_entries()
+        mock_cls.assert_called_once_with("tok")
+        mock_dispatch.assert_called_once_with(
+            "sync.tasks.drain_unsynced_entries", self.user.id, None, 1,
+            user_id=self.user.id, lane=BULK,
+        )
+
+    @patch("sync.tasks.dispatch")
+    @patch("sync.tasks.TogglService")
+    def test_api_errors_do_not_abort(self, mock_cls, mock_dispatch):
+        mock_cls.return_value.get_time_entries.side_effect = TogglAPIError("down")
+        backfill_time_entries()
+        mock_dispatch.assert_not_called()
+        self.user.credentials.refresh_from_db()
+        self.assertIsNone(self.user.credentials.toggl_entries_synced_at)
+
+    @patch("sync.tasks.dispatch")
+    @patch("sync.tasks.TogglService")
+    def test_unexpected_errors_do_not_abort(self, mock_cls, mock_dispatch):
+        other = User.objects.create_user("other", password="pass")
+        other.credentials.toggl_api_token = "tok2"
+        other.credentials.save()
+        services = {"tok": MagicMock(), "tok2": MagicMock()}
+        services["tok"].get_time_entries.side_effect = ValueError("bad payload")
+        services["tok2"].get_time_entries.return_value = [_api_entry(1)]
+        mock_cls.side_effect = services.get
+
+        with self.assertLogs("sync.tasks", "ERROR"):
+            backfill_time_entries()
+
+        self.assertTrue(TogglTimeEntry.objects.filter(user=other, toggl_id=1).exists())
+
+    @patch("sync.tasks.dispatch")
+    def test_schedule_queues_one_bulk_job_per_user(self, mock_dispatch):
+        queue_time_entry_backfill()
+        mock_dispatch.assert_called_once_with(
+            "sync.tasks.backfill_time_entries", self.user.id, user_id=self.user.id, lane=BULK,
+        )
+
+    @patch("sync.tasks.dispatch")
+    @patch("sync.tasks.TogglService")
+    def test_command_reports_stats(self, mock_cls, mock_dispatch):
+        mock_cls.return_value.get_time_entries.return_value = [_api_entry(1)]
+        out = StringIO()
+        call_command("backfill_entries", user="testuser", days=10, stdout=out)
+        self.assertIn("1 created", out.getvalue())
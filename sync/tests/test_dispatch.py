@@ -0,0 +1,193 @@
+"""Tests for fair-share dispatch of per-user jobs."""
+
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django_q.models import Schedule
+
+from sync import dispatch as dispatch_module
+from sync.dispatch import (
+    BULK, DUE_SCHEDULE, claim_next_job, dispatch, dispatch_many, run_dispatcher, run_job,
+)
+from sync.models import DispatchJob, TogglTimeEntry
+from sync.scheduling import request_entry_sync
+from sync.tasks import queue_event_validation
+
+RAN = []
+
+
+def record(*args):
+    RAN.append(tuple(args))
+
+
+def explode(*args):
+    raise RuntimeError("boom")
+
+
+@override_settings(DISPATCH_MAX_ATTEMPTS=3, DISPATCH_WAKE_INTERVAL=0)
+@patch("sync.dispatch.async_task")
+class DispatchTest(TestCase):
+    def setUp(self):
+        RAN.clear()
+        dispatch_module._last_served.clear()
+        # No wake-up state (last wake, armed timer) from earlier tests
+        for attr, value in (("_last", 0.0), ("_timer", None)):
+            patcher = patch.object(dispatch_module._dispatcher_waker, attr, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        self.carol = User.objects.create_user("carol")
+
+    def _order(self):
+        order = []
+        while (job := claim_next_job()) is not None:
+            order.append((job.user_id, job.get_lane_display(), *job.args))
+            run_job(job)
+        return order
+
+    def test_dispatch_wakes_the_dispatcher(self, mock_async):
+        dispatch("sync.tests.test_dispatch.record", 1, user_id=self.alice.id)
+        mock_async.assert_called_once_with("sync.dispatch.run_dispatcher", task_name="run_dispatcher")
+
+    @override_settings(DISPATCH_WAKE_INTERVAL=60)
+    @patch("sync.utils.threading.Timer")
+    def test_suppressed_wake_up_queues_a_trailing_run(self, mock_timer, mock_async):
+        dispatch("sync.tests.test_dispatch.record", 1, user_id=self.alice.id)
+        # Dispatched after the running dispatcher's last claim
+        dispatch("sync.tests.test_dispatch.record", 2, user_id=self.bob.id)
+        self.assertEqual(mock_async.call_count, 1)
+
+        mock_timer.assert_called_once()
+        delay, fire = mock_timer.call_args.args
+        self.assertAlmostEqual(delay, 60, delta=1)
+        with patch("sync.utils.connections"):
+            fire()
+        self.assertEqual(mock_async.call_count, 2)
+
+    def test_users_take_turns_within_a_lane(self, mock_async):
+        dispatch_many(
+            "sync.tests.test_dispatch.record", [(i,) for i in range(3)], user_id=self.alice.id
+        )
+        dispatch("sync.tests.test_dispatch.record", "b", user_id=self.bob.id, lane=BULK)
+        dispatch("sync.tests.test_dispatch.record", "c", user_id=self.carol.id, lane=BULK)
+
+        self.assertEqual(self._order(), [
+            (self.alice.id, "Bulk", 0),
+            (self.bob.id, "Bulk", "b"),
+            (self.carol.id, "Bulk", "c"),
+            (self.alice.id, "Bulk", 1),
+            (self.alice.id, "Bulk", 2),
+        ])
+        self.assertFalse(DispatchJob.objects.exists())
+
+    def test_live_jobs_run_before_bulk(self, mock_async):
+        dispatch_many(
+            "sync.tests.test_dispatch.record", [(i,) for i in range(2)], user_id=self.alice.id
+        )
+        dispatch("sync.tests.test_dispatch.record", "live", user_id=self.bob.id)
+
+        self.assertEqual(
+            [args for _, _, *args in self._order()], [["live"], [0], [1]]
+        )
+
+    def test_jobs_wait_for_run_after(self, mock_async):
+        later = timezone.now() + timedelta(seconds=30)
+        dispatch("sync.tests.test_dispatch.record", 1, user_id=self.alice.id, run_after=later)
+        self.assertIsNone(claim_next_job())
+
+    def test_failed_job_is_retried_then_kept(self, mock_async):
+        dispatch("sync.tests.test_dispatch.explode", user_id=self.alice.id)
+        for attempt in range(1, 4):
+            DispatchJob.objects.update(run_after=timezone.now())
+            job = claim_next_job()
+            self.assertEqual(job.attempts, attempt)
+            self.assertFalse(run_job(job))
+
+        job = DispatchJob.objects.get()
+        self.assertEqual((job.attempts, job.error), (3, "boom"))
+        DispatchJob.objects.update(run_after=timezone.now())
+        self.assertIsNone(claim_next_job())
+
+    def test_lost_claims_are_taken_over(self, mock_async):
+        dispatch("sync.tests.test_dispatch.record", 1, user_id=self.alice.id)
+        claim_next_job()
+        self.assertIsNone(claim_next_job())
+
+        DispatchJob.objects.update(claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(claim_next_job().attempts, 2)
+
+    @patch("sync.utils.threading.Timer")
+    def test_run_dispatcher_schedules_deferred_jobs(self, mock_timer, mock_async):
+        later = timezone.now() + timedelta(seconds=5)
+        dispatch("sync.tests.test_dispatch.record", 1, user_id=self.alice.id)
+        dispatch("sync.tests.test_dispatch.record", 2, user_id=self.bob.id, run_after=later)
+
+        with patch("time.sleep") as mock_sleep:
+            self.assertEqual(run_dispatcher(budget=60), 1)
+        mock_sleep.assert_not_called()
+        self.assertEqual(RAN, [(1,)])
+        wake = Schedule.objects.get(name=DUE_SCHEDULE)
+        self.assertEqual((wake.func, wake.schedule_type), ("sync.dispatch.run_dispatcher", Schedule.ONCE))
+        self.assertEqual(wake.next_run, later)
+        self.assertAlmostEqual(mock_timer.call_args.args[0], 5, delta=1)
+
+    @override_settings(SYNC_COALESCE_WINDOW=5)
+    @patch("sync.utils.threading.Timer")
+    @patch("sync.tasks.drain_unsynced_entries")
+    def test_edited_entry_does_not_hold_up_other_users(self, mock_drain, mock_timer, mock_async):
+        request_entry_sync(self.alice.id, 7)
+        dispatch("sync.tests.test_dispatch.record", "bob", user_id=self.bob.id)
+
+        with patch("time.sleep") as mock_sleep:
+            for _ in range(3):
+                run_dispatcher(budget=60)
+                # Alice's entry keeps being edited
+                request_entry_sync(self.alice.id, 7)
+
+        mock_sleep.assert_not_called()
+        self.assertEqual(RAN, [("bob",)])
+        # The first edit synced at once, the rest wait for one follow-up
+        mock_drain.assert_called_once()
+        deferred = DispatchJob.objects.get()
+        self.assertEqual((deferred.user_id, deferred.func), (self.alice.id, "sync.tasks.run_entry_sync"))
+        self.assertAlmostEqual((deferred.run_after - timezone.now()).total_seconds(), 5, delta=1)
+        self.assertAlmostEqual(mock_timer.call_args.args[0], 5, delta=1)
+
+    @patch("sync.utils.threading.Timer")
+    def test_deferred_job_wakes_the_dispatcher_when_due(self, mock_timer, mock_async):
+        dispatch(
+            "sync.tests.test_dispatch.record", 1, user_id=self.alice.id,
+            run_after=timezone.now() + timedelta(seconds=5),
+        )
+        mock_async.assert_not_called()
+
+        delay, fire = mock_timer.call_args.args
+        self.assertAlmostEqual(delay, 5, delta=1)
+        with patch("sync.utils.connections"):
+            fire()
+        mock_async.assert_called_once_with("sync.dispatch.run_dispatcher", task_name="run_dispatcher")
+
+    def test_run_dispatcher_hands_over_when_budget_is_spent(self, mock_async):
+        dispatch("sync.tests.test_dispatch.record", 1, user_id=self.alice.id)
+        mock_async.reset_mock()
+
+        self.assertEqual(run_dispatcher(budget=0), 0)
+        mock_async.assert_called_once_with("sync.dispatch.run_dispatcher", task_name="run_dispatcher")
+
+    def test_validation_is_one_bulk_job_per_user(self, mock_async):
+        for user in (self.alice, self.bob):
+            TogglTimeEntry.objects.create(
+                user=user, toggl_id=1, start_time=timezone.now(), synced=True,
+            )
+        queue_event_validation()
+        self.assertEqual(
+            sorted(DispatchJob.objects.values_list("user_id", "lane", "func", "args")),
+            [
+                (self.alice.id, BULK, "sync.tasks.validate_synced_events", [self.alice.id]),
+                (self.bob.id, BULK, "sync.tasks.validate_synced_events", [self.bob.id]),
+            ],
+        )
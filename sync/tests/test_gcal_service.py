@@ -0,0 +1,255 @@
+"""Tests for the Google Calendar service client."""
+
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from google.oauth2.credentials import Credentials
+
+from sync.services import gcal
+from sync.services.gcal import GoogleCalendarError, GoogleCalendarService
+from sync.tests.fake_gcal import FakeCalendarAPI
+
+
+class BuildCalendarServiceTest(SimpleTestCase):
+    def setUp(self):
+        gcal._calendar_discovery_document.cache_clear()
+        self.addCleanup(gcal._calendar_discovery_document.cache_clear)
+
+    def _creds(self, token):
+        return Credentials(token=token, refresh_token="r", client_id="c",
+                           client_secret="s", token_uri="https://oauth2.googleapis.com/token")
+
+    def test_discovery_document_loaded_once(self):
+        with patch("sync.services.gcal.get_static_doc", wraps=gcal.get_static_doc) as spy:
+            gcal.build_calendar_service(self._creds("a"))
+            gcal.build_calendar_service(self._creds("b"))
+        spy.assert_called_once_with("calendar", "v3")
+
+    def test_services_are_per_credentials(self):
+        a = gcal.build_calendar_service(self._creds("a"))
+        b = gcal.build_calendar_service(self._creds("b"))
+        self.assertIsNot(a, b)
+        self.assertEqual(a._http.credentials.token, "a")
+        self.assertEqual(b._http.credentials.token, "b")
+
+
+class GcalServiceTestCase(TestCase):
+    """Runs GoogleCalendarService against an in-memory Calendar API."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("testuser", password="pass")
+        self.user.credentials.gauth_credentials_json = json.dumps({
+            "token": "t", "refresh_token": "r", "client_id": "c", "client_secret": "s",
+            "expiry": (timezone.now() + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        })
+        self.user.credentials.google_calendar_id = "cal_id"
+        self.user.credentials.save()
+        self.api = FakeCalendarAPI()
+        self.api.add_calendar("cal_id")
+        patcher = patch("sync.services.gcal.build_calendar_service", self.api.build_service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.gcal = GoogleCalendarService(user=self.user)
+
+    def _data(self, toggl_id, summary="Work", color_id=None):
+        start = timezone.now().replace(microsecond=0)
+        return {
+            "event_id": f"toggl{toggl_id}", "summary": summary,
+            "start": start, "end": start + timedelta(hours=1),
+            "description": f"Toggl Entry: {toggl_id}", "color_id": color_id,
+        }
+
+
+class SyncEventsBatchTest(GcalServiceTestCase):
+    def test_inserts_updates_and_deletes_in_two_round_trips(self):
+        self.api.add_event(iCalUID="toggl2", summary="Old", location="Office")
+        self.api.add_event(iCalUID="toggl3", summary="Gone")
+
+        results = self.gcal.sync_events_batch(
+            "cal_id",
+            upserts={1: self._data(1, "New"), 2: self._data(2, "Renamed", "5")},
+            deletes={3: "toggl3", 4: "toggl4"},
+        )
+
+        self.assertEqual(self.api.http_calls, 2)
+        by_uid = {e["iCalUID"]: e for e in self.api.events()}
+        self.assertEqual(results[1]["id"], by_uid["toggl1"]["id"])
+        self.assertEqual(results[2]["etag"], by_uid["toggl2"]["etag"])
+        self.assertEqual(results[3], {})
+        self.assertEqual(results[4], {})
+        self.assertEqual(by_uid["toggl1"]["summary"], "New")
+        self.assertEqual(by_uid["toggl2"]["summary"], "Renamed")
+        self.assertEqual(by_uid["toggl2"]["colorId"], "5")
+        self.assertEqual(by_uid["toggl2"]["location"], "Office")
+        self.assertEqual(by_uid["toggl3"]["status"], "cancelled")
+
+    def test_splits_into_batches_of_fifty(self):
+        upserts = {i: self._data(i) for i in range(120)}
+        results = self.gcal.sync_events_batch("cal_id", upserts=upserts)
+        self.assertFalse(any(isinstance(r, GoogleCalendarError) for r in results.values()))
+        self.assertEqual(len(self.api.events()), 120)
+        self.assertEqual(self.api.http_calls, 6)
+
+    def test_reports_failed_operations_per_key(self):
+        self.api.add_event(iCalUID="toggl1", status="cancelled")
+        results = self.gcal.sync_events_batch(
+            "cal_id", upserts={2: self._data(2)}, deletes={1: "toggl1"},
+        )
+        self.assertEqual(results[1], {})
+        self.assertEqual(results[2]["iCalUID"], "toggl2")
+
+        del self.api.calendars["cal_id"]
+        results = self.gcal.sync_events_batch("cal_id", upserts={5: self._data(5)})
+        self.assertIsInstance(results[5], GoogleCalendarError)
+
+
+    def test_known_events_skip_the_lookup(self):
+        kept = self.api.add_event(iCalUID="toggl1", summary="Old")
+        gone = self.api.add_event(iCalUID="toggl2", summary="Gone")
+
+        results = self.gcal.sync_events_batch(
+            "cal_id", upserts={1: self._data(1, "New")}, deletes={2: "toggl2"},
+            known={1: (kept["id"], kept["etag"]), 2: (gone["id"], gone["etag"])},
+        )
+
+        self.assertEqual(self.api.http_calls, 1)
+        self.assertEqual(self.api.operations, ["events.patch", "events.delete"])
+        self.assertEqual(results[1]["summary"], "New")
+        self.assertEqual(results[2], {})
+
+    def test_stale_known_events_fall_back_to_lookup(self):
+        moved = self.api.add_event(iCalUID="toggl1", summary="Old")
+        edited = self.api.add_event(iCalUID="toggl2", summary="Old")
+
+        results = self.gcal.sync_events_batch(
+            "cal_id", upserts={1: self._data(1, "New"), 2: self._data(2, "New")},
+            known={1: ("missing", '"1"'), 2: (edited["id"], '"stale"')},
+        )
+
+        # By-id pass, then lookup and write passes for both
+        self.assertEqual(self.api.http_calls, 3)
+        self.assertEqual(results[1]["id"], moved["id"])
+        self.assertEqual(results[2]["id"], edited["id"])
+        self.assertEqual({e["summary"] for e in self.api.events()}, {"New"})
+
+    def test_deletes_of_events_already_gone_succeed(self):
+        cancelled = self.api.add_event(iCalUID="toggl1", status="cancelled")
+        self.api.add_event(iCalUID="toggl3", summary="Moved")
+
+        results = self.gcal.sync_events_batch(
+            "cal_id", deletes={1: "toggl1", 2: "toggl2", 3: "toggl3"},
+            known={1: (cancelled["id"], cancelled["etag"]), 2: ("missing", '"1"'), 3: ("missing", "")},
+        )
+
+        # 410 and 404 by id, then the lookup finds the cancelled event (410
+        # again) and the moved one; toggl2 is not in the calendar at all
+        self.assertEqual(results, {1: {}, 2: {}, 3: {}})
+        self.assertEqual(self.api.operations.count("events.delete"), 5)
+        self.assertEqual({e["status"] for e in self.api.events()}, {"cancelled"})
+
+
+class PatchEventTest(GcalServiceTestCase):
+    def test_single_conditional_patch(self):
+        event = self.api.add_event(iCalUID="toggl1", summary="Old")
+        patched = self.gcal.patch_event(
+            "cal_id", event["id"], etag=event["etag"], summary="New",
+        )
+        self.assertEqual(patched["summary"], "New")
+        self.assertNotEqual(patched["etag"], event["etag"])
+        self.assertEqual(self.api.operations, ["events.patch"])
+
+    def test_returns_none_on_stale_etag_or_missing_event(self):
+        event = self.api.add_event(iCalUID="toggl1", summary="Old")
+        self.assertIsNone(self.gcal.patch_event("cal_id", event["id"], etag='"stale"', summary="New"))
+        self.assertIsNone(self.gcal.patch_event("cal_id", "missing", summary="New"))
+        self.assertEqual(self.api.events()[0]["summary"], "Old")
+
+
+class UpdateEventTest(GcalServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = self.api.add_event(
+            iCalUID="toggl1", summary="Work", description="Toggl Entry: 1",
+            location="Office", attendees=[{"email": "a@example.com"}],
+            start={"dateTime": "2026-02-27T10:00:00+00:00", "timeZone": "UTC"},
+            end={"dateTime": "2026-02-27T11:00:00+00:00", "timeZone": "UTC"},
+        )
+
+    def test_color_only_update_sends_partial_body(self):
+        updated = self.gcal.update_event("cal_id", self.event["id"], color_id="5")
+        self.assertEqual(self.api.operations, ["events.patch"])
+        self.assertEqual(self.api.bodies, [{"colorId": "5"}])
+        self.assertEqual(updated["colorId"], "5")
+        for field in ("summary", "description", "location", "attendees", "start", "end"):
+            self.assertEqual(updated[field], self.event[field])
+
+    def test_summary_update_keeps_other_fields(self):
+        updated = self.gcal.update_event("cal_id", self.event["id"], summary="Renamed")
+        self.assertEqual(updated["summary"], "Renamed")
+        self.assertEqual(updated["location"], "Office")
+        self.assertEqual(updated["start"], self.event["start"])
+
+    def test_missing_event_raises(self):
+        with self.assertRaises(GoogleCalendarError):
+            self.gcal.update_event("cal_id", "missing", summary="x")
+
+    def test_batch_patches_only_changed_fields(self):
+        data = self._data(1, summary="Work", color_id="7")
+        data["start"] = datetime(2026, 2, 27, 10, tzinfo=dt_timezone.utc)
+        data["end"] = datetime(2026, 2, 27, 11, tzinfo=dt_timezone.utc)
+
+        results = self.gcal.sync_events_batch("cal_id", upserts={1: data})
+        self.assertEqual(results[1]["colorId"], "7")
+        self.assertEqual(self.api.bodies[-1], {"colorId": "7"})
+        self.assertEqual(results[1]["location"], "Office")
+
+        self.api.operations.clear()
+        self.gcal.sync_events_batch("cal_id", upserts={1: data})
+        self.assertEqual(self.api.operations, ["events.list"])
+
+
+class IterEventChangesTest(GcalServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.api.page_size = 2
+        self.events = [self.api.add_event(iCalUID=f"toggl{i}", summary="Work") for i in range(5)]
+
+    def _changes(self, sync_token=""):
+        pages = list(self.gcal.iter_event_changes("cal_id", sync_token))
+        return [e for events, _ in pages for e in events], pages[-1][1]
+
+    def test_full_listing_pages_and_returns_sync_token(self):
+        pages = list(self.gcal.iter_event_changes("cal_id"))
+        self.assertEqual([len(events) for events, _ in pages], [2, 2, 1])
+        self.assertEqual([bool(token) for _, token in pages], [False, False, True])
+
+    def test_incremental_listing_returns_only_changes(self):
+        _, token = self._changes()
+        self.gcal.update_event("cal_id", self.events[1]["id"], summary="Changed")
+        self.gcal.delete_event("cal_id", self.events[3]["id"])
+
+        events, next_token = self._changes(token)
+        self.assertEqual(
+            {(e["iCalUID"], e["status"]) for e in events},
+            {("toggl1", "confirmed"), ("toggl3", "cancelled")},
+        )
+        self.assertEqual(self._changes(next_token)[0], [])
+
+    def test_expired_token_falls_back_to_full_listing(self):
+        _, token = self._changes()
+        self.api.expire_sync_tokens()
+        events, _ = self._changes(token)
+        self.assertEqual(len(events), 5)
+
+
+class FindEventsByIcalUidsTest(GcalServiceTestCase):
+    def test_batched_lookup(self):
+        event = self.api.add_event(iCalUID="toggl1")
+        found = self.gcal.find_events_by_ical_uids("cal_id", {1: "toggl1", 2: "toggl2"})
+        self.assertEqual(found[1]["id"], event["id"])
+        self.assertIsNone(found[2])
+        self.assertEqual(self.api.http_calls, 1)
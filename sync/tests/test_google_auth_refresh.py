@@ -1,14 +1,21 @@
 """Tests for Google OAuth token refresh."""
 
 import json
+import threading
+import time
 from datetime import timedelta
 from unittest.mock import Mock, patch, MagicMock
 
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
 from django.utils import timezone
+from google.auth.exceptions import RefreshError
+from google.oauth2.credentials import Credentials
 
-from sync.services.gcal import GoogleCalendarService
+from sync.models import UserCredentials
+from sync.services.gcal import CredentialCache, GoogleCalendarError, GoogleCalendarService
 
 
 class GoogleAuthRefreshTest(TestCase):
@@ -29,19 +36,20 @@ class GoogleAuthRefreshTest(TestCase):
     def _mock_creds(self, expired=True):
         m = Mock()
         m.expired = expired
+        m.expiry = None
         m.refresh = Mock()
         m.to_json.return_value = json.dumps(self.creds_data)
         return m
 
     def test_detects_expired(self):
-        with patch('sync.services.gcal.build'), \
+        with patch('sync.services.gcal.build_calendar_service'), \
              patch('sync.services.gcal.Credentials') as cls:
             cls.from_authorized_user_info.return_value = self._mock_creds(True)
             svc = GoogleCalendarService(user=self.user)
             self.assertTrue(svc.credentials.expired)
 
     def test_refresh_called_when_expired(self):
-        with patch('sync.services.gcal.build'), \
+        with patch('sync.services.gcal.build_calendar_service'), \
              patch('sync.services.gcal.Credentials') as cls, \
              patch('sync.services.gcal.Request'):
             mock_creds = self._mock_creds(True)
@@ -53,7 +61,7 @@ class GoogleAuthRefreshTest(TestCase):
 
     def test_refreshed_token_saved(self):
         new_data = {**self.creds_data, "token": "new_tok"}
-        with patch('sync.services.gcal.build'), \
+        with patch('sync.services.gcal.build_calendar_service'), \
              patch('sync.services.gcal.Credentials') as cls, \
              patch('sync.services.gcal.Request'):
             mock_creds = self._mock_creds(True)
@@ -65,7 +73,7 @@ class GoogleAuthRefreshTest(TestCase):
             self.assertEqual(saved["token"], "new_tok")
 
     def test_no_refresh_when_valid(self):
-        with patch('sync.services.gcal.build'), \
+        with patch('sync.services.gcal.build_calendar_service'), \
              patch('sync.services.gcal.Credentials') as cls:
             mock_creds = self._mock_creds(False)
             cls.from_authorized_user_info.return_value = mock_creds
@@ -75,7 +83,7 @@ class GoogleAuthRefreshTest(TestCase):
 
     def test_refresh_updates_timestamp(self):
         orig = self.user.credentials.updated_at
-        with patch('sync.services.gcal.build'), \
+        with patch('sync.services.gcal.build_calendar_service'), \
              patch('sync.services.gcal.Credentials') as cls, \
              patch('sync.services.gcal.Request'):
             cls.from_authorized_user_info.return_value = self._mock_creds(True)
@@ -84,7 +92,7 @@ class GoogleAuthRefreshTest(TestCase):
             self.assertGreater(self.user.credentials.updated_at, orig)
 
     def test_refresh_called_before_api(self):
-        with patch('sync.services.gcal.build') as build, \
+        with patch('sync.services.gcal.build_calendar_service') as build, \
              patch('sync.services.gcal.Credentials') as cls:
             mock_creds = self._mock_creds(False)
             cls.from_authorized_user_info.return_value = mock_creds
@@ -96,3 +104,166 @@ class GoogleAuthRefreshTest(TestCase):
                 except:
                     pass
                 spy.assert_called()
+
+
+class CredentialCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("testuser", password="pass")
+        self.user.credentials.gauth_credentials_json = json.dumps({"token": "t"})
+        self.user.credentials.google_calendar_id = "cal_id"
+        self.user.credentials.save()
+        patcher = patch('sync.services.gcal.build_calendar_service')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _fresh_user(self):
+        # Tasks load the user and credentials row from scratch
+        return User.objects.select_related("credentials").get(id=self.user.id)
+
+    def test_credentials_parsed_once_per_process(self):
+        with patch('sync.services.gcal.Credentials') as cls:
+            cls.from_authorized_user_info.return_value = Mock(expired=False, expiry=None)
+            first = GoogleCalendarService(user=self._fresh_user())
+            second = GoogleCalendarService(user=self._fresh_user())
+        cls.from_authorized_user_info.assert_called_once()
+        self.assertIs(first.credentials, second.credentials)
+
+    def test_refreshed_token_shared_with_later_tasks(self):
+        creds = Mock(expired=True, expiry=None)
+        creds.refresh.side_effect = lambda request: setattr(creds, "expired", False)
+        creds.to_json.return_value = json.dumps({"token": "new"})
+        with patch('sync.services.gcal.Credentials') as cls, \
+             patch('sync.services.gcal.Request'):
+            cls.from_authorized_user_info.return_value = creds
+            GoogleCalendarService(user=self._fresh_user())
+            GoogleCalendarService(user=self._fresh_user())
+        creds.refresh.assert_called_once()
+        cls.from_authorized_user_info.assert_called_once()
+
+    def test_changed_json_is_reparsed(self):
+        with patch('sync.services.gcal.Credentials') as cls:
+            cls.from_authorized_user_info.return_value = Mock(expired=False, expiry=None)
+            GoogleCalendarService(user=self._fresh_user())
+            # Another process refreshed or reconnected
+            UserCredentials.objects.filter(user=self.user).update(
+                gauth_credentials_json=json.dumps({"token": "other"})
+            )
+            GoogleCalendarService(user=self._fresh_user())
+        self.assertEqual(cls.from_authorized_user_info.call_count, 2)
+        self.assertEqual(
+            cls.from_authorized_user_info.call_args.args[0], {"token": "other"}
+        )
+
+    def test_ensure_calendar_uses_loaded_row(self):
+        with patch('sync.services.gcal.Credentials') as cls:
+            cls.from_authorized_user_info.return_value = Mock(expired=False, expiry=None)
+            gcal = GoogleCalendarService(user=self._fresh_user())
+            with self.assertNumQueries(0):
+                self.assertEqual(gcal.ensure_toggl_calendar(), "cal_id")
+                self.assertEqual(gcal.ensure_toggl_calendar(), "cal_id")
+
+    def test_disconnect_drops_cached_credentials(self):
+        with patch('sync.services.gcal.Credentials') as cls:
+            cls.from_authorized_user_info.return_value = Mock(expired=False, expiry=None)
+            GoogleCalendarService(user=self._fresh_user())
+        self.assertIn(self.user.id, CredentialCache._cache)
+
+        self.client.force_login(self.user)
+        self.client.get(reverse("sync:google_oauth_disconnect"))
+        self.assertNotIn(self.user.id, CredentialCache._cache)
+
+
+class SingleFlightRefreshTest(TransactionTestCase):
+    WORKERS = 10
+
+    def setUp(self):
+        self.user = User.objects.create_user("testuser", password="pass")
+        self.user.credentials.gauth_credentials_json = json.dumps({
+            "token": "old", "refresh_token": "r", "client_id": "c", "client_secret": "s",
+            "expiry": (timezone.now() - timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        })
+        self.user.credentials.save()
+        for target, value in [
+            ('sync.services.gcal.build_calendar_service', None),
+            ('sync.services.gcal.Request', None),
+            # Every worker parses its own copy, as separate processes would
+            ('sync.services.gcal.CredentialCache.load', self._parse),
+            ('sync.services.gcal.GoogleCalendarService.REFRESH_POLL_INTERVAL', 0.01),
+        ]:
+            patcher = patch(target, value) if value is not None else patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _parse(user_id, source, scopes):
+        return Credentials.from_authorized_user_info(json.loads(source), scopes)
+
+    def test_concurrent_refreshes_make_one_token_request(self):
+        # A file database waits on its busy timeout; the shared in-memory test
+        # database raises "table is locked" instead. Workers therefore hold
+        # the database in turn and only overlap while waiting on Google or
+        # polling for the lease, which is where real workers race.
+        db_lock = threading.Lock()
+        sleep = time.sleep
+
+        def yielding(seconds):
+            db_lock.release()
+            try:
+                sleep(seconds)
+            finally:
+                db_lock.acquire()
+
+        token_requests = []
+
+        def refresh(credentials, request):
+            token_requests.append(credentials)
+            yielding(0.2)
+            credentials.token = "new"
+            credentials.expiry = (timezone.now() + timedelta(hours=1)).replace(tzinfo=None)
+
+        barrier = threading.Barrier(self.WORKERS)
+        tokens = []
+        errors = []
+
+        def worker():
+            barrier.wait()
+            try:
+                with db_lock:
+                    user = User.objects.select_related("credentials").get(id=self.user.id)
+                    tokens.append(GoogleCalendarService(user=user).credentials.token)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        with patch.object(Credentials, "refresh", autospec=True, side_effect=refresh), \
+             patch("sync.services.gcal.time.sleep", side_effect=yielding):
+            threads = [threading.Thread(target=worker) for _ in range(self.WORKERS)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(token_requests), 1)
+        self.assertEqual(tokens, ["new"] * self.WORKERS)
+        self.user.credentials.refresh_from_db()
+        self.assertIsNone(self.user.credentials.gauth_refresh_lease)
+        self.assertEqual(json.loads(self.user.credentials.gauth_credentials_json)["token"], "new")
+
+    @override_settings(GOOGLE_TOKEN_REFRESH_MARGIN=600)
+    def test_refreshes_shortly_before_expiry(self):
+        soon = (timezone.now() + timedelta(minutes=8)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        data = json.loads(self.user.credentials.gauth_credentials_json)
+        self.user.credentials.gauth_credentials_json = json.dumps({**data, "expiry": soon})
+        self.user.credentials.save()
+        with patch.object(Credentials, "refresh", autospec=True) as refresh:
+            GoogleCalendarService(user=self.user)
+        refresh.assert_called_once()
+
+    def test_failed_refresh_releases_lease(self):
+        with patch.object(Credentials, "refresh", autospec=True, side_effect=RefreshError("revoked")):
+            with self.assertRaises(GoogleCalendarError):
+                GoogleCalendarService(user=self.user)
+        self.user.credentials.refresh_from_db()
+        self.assertIsNone(self.user.credentials.gauth_refresh_lease)
@@ -0,0 +1,222 @@
+"""Tests for bulk webhook ingestion: engine, endpoint and command."""
+
+import hashlib
+import hmac
+import json
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from sync.dispatch import BULK
+from sync.ingest import WebhookBulkIngest
+from sync.models import SyncMetric, TogglTimeEntry, TogglWorkspace
+from sync.webhooks import DUPLICATE, STALE, WebhookTokenCache, handle_time_entry_event
+
+
+def _event(entry_id, action="updated", description="Work", at="2026-02-27T11:00:00Z",
+           event_id=None, **extra):
+    entry = {
+        "id": entry_id, "description": description, "at": at,
+        "start": "2026-02-27T10:00:00Z", "stop": "2026-02-27T11:00:00Z",
+        "project_id": None, "tag_ids": [],
+    }
+    entry.update(extra)
+    payload = {"payload": entry, "metadata": {"action": action}}
+    if event_id is not None:
+        payload["event_id"] = event_id
+    return payload
+
+
+def _sign(body: bytes, secret: str) -> str:
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def _lines(events) -> str:
+    return "\n".join(json.dumps(event) for event in events)
+
+
+class WebhookBulkIngestTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("testuser", password="pass")
+
+    def _rows(self, user):
+        return list(
+            TogglTimeEntry.objects.filter(user=user).order_by("toggl_id").values_list(
+                "toggl_id", "description", "pending_deletion", "toggl_updated_at",
+                "webhook_event_id",
+            )
+        )
+
+    @patch("sync.scheduling.dispatch")
+    def test_matches_posting_events_one_by_one(self, mock_dispatch):
+        TogglTimeEntry.objects.create(
+            user=self.user, toggl_id=2, description="Stored",
+            start_time="2026-02-27T10:00:00Z", toggl_updated_at="2026-02-27T12:00:00Z",
+        )
+        events = [
+            _event(1, "created", "First", at="2026-02-27T11:00:00Z", event_id=1),
+            _event(1, "updated", "Second", at="2026-02-27T11:05:00Z", event_id=2),
+            _event(1, "updated", "Second", at="2026-02-27T11:05:00Z", event_id=2),
+            _event(1, "updated", "Older", at="2026-02-27T11:01:00Z", event_id=3),
+            _event(2, "updated", "Behind stored", at="2026-02-27T11:30:00Z", event_id=4),
+            _event(2, "deleted", at="2026-02-27T12:30:00Z", event_id=5),
+            _event(3, "deleted", at="2026-02-27T12:30:00Z", event_id=6),
+        ]
+
+        other = User.objects.create_user("serial")
+        TogglTimeEntry.objects.create(
+            user=other, toggl_id=2, description="Stored",
+            start_time="2026-02-27T10:00:00Z", toggl_updated_at="2026-02-27T12:00:00Z",
+        )
+        for event in events:
+            handle_time_entry_event(other, event)
+        serial = self._rows(other)
+        SyncMetric.objects.all().delete()
+
+        engine = WebhookBulkIngest(self.user)
+        stats = engine.run(_lines(events))
+
+        self.assertEqual(self._rows(self.user), serial)
+        self.assertEqual(
+            (stats.received, stats.applied, stats.duplicate, stats.stale, stats.created,
+             stats.updated),
+            (7, 4, 1, 2, 1, 1),
+        )
+        self.assertEqual(sorted(engine.changed_ids), [1, 2])
+        self.assertEqual(SyncMetric.snapshot(), {DUPLICATE: 1, STALE: 2})
+
+    def test_same_second_delete_is_applied(self):
+        stats = WebhookBulkIngest(self.user).run(_lines([
+            _event(1, "created", "Work", event_id=1),
+            _event(1, "deleted", event_id=2),
+            _event(1, "deleted", event_id=2),
+        ]))
+        self.assertEqual((stats.applied, stats.duplicate), (2, 1))
+        self.assertTrue(TogglTimeEntry.objects.get(toggl_id=1).pending_deletion)
+
+    def test_array_input_and_invalid_items(self):
+        raw = json.dumps([
+            _event(1),
+            {"payload": "ping"},
+            _event(2, action="archived"),
+            _event(3, start=None),
+        ])
+        stats = WebhookBulkIngest(self.user).run(raw)
+        self.assertEqual((stats.received, stats.invalid, stats.created), (4, 3, 1))
+        self.assertEqual(
+            list(TogglTimeEntry.objects.values_list("toggl_id", flat=True)), [1]
+        )
+
+    def test_unparsable_lines_are_counted(self):
+        stats = WebhookBulkIngest(self.user).run(_lines([_event(1)]) + "\n{not json\n\n")
+        self.assertEqual((stats.received, stats.invalid, stats.created), (2, 1, 1))
+
+    def test_envelope_signatures_are_verified(self):
+        good = json.dumps(_event(1))
+        bad = json.dumps(_event(2))
+        raw = _lines([
+            {"body": good, "signature": _sign(good.encode(), "s3cret")},
+            {"body": bad, "signature": _sign(bad.encode(), "wrong")},
+        ])
+        stats = WebhookBulkIngest(self.user, ["", "s3cret"]).run(raw)
+        self.assertEqual((stats.created, stats.rejected), (1, 1))
+        self.assertTrue(TogglTimeEntry.objects.filter(toggl_id=1).exists())
+
+    def test_queries_do_not_grow_with_events(self):
+        TogglTimeEntry.objects.create(
+            user=self.user, toggl_id=1, description="Stored", start_time="2026-02-27T10:00:00Z",
+        )
+        raw = _lines([_event(i, event_id=i) for i in range(1, 401)])
+        with CaptureQueriesContext(connection) as queries:
+            stats = WebhookBulkIngest(self.user).run(raw)
+        self.assertEqual((stats.created, stats.updated), (399, 1))
+        # One lookup per chunk plus bulk writes, split only by parameter limits
+        self.assertLess(len(queries), 20)
+
+
+@override_settings(DISPATCH_SLICE_BATCHES=1)
+class BulkWebhookEndpointTest(TestCase):
+    def setUp(self):
+        WebhookTokenCache.invalidate()
+        self.client = Client()
+        self.user = User.objects.create_user("testuser", password="pass")
+        self.user.credentials.gauth_credentials_json = '{"token": "t"}'
+        self.user.credentials.save()
+        self.ws = TogglWorkspace.objects.create(
+            user=self.user, toggl_id=1, name="WS", webhook_token="tok_abc",
+            webhook_secret="s3cret",
+        )
+        self.body = _lines([
+            _event(1, event_id=1), _event(2, event_id=2), _event(1, event_id=1),
+        ]).encode()
+
+    def _post(self, body, signature=None):
+        headers = {"HTTP_X_WEBHOOK_SIGNATURE_256": signature} if signature else {}
+        return self.client.post(
+            "/webhook/toggl/tok_abc/bulk/", body, content_type="application/x-ndjson", **headers
+        )
+
+    @patch("sync.tasks.dispatch")
+    def test_applies_batch_and_queues_one_drain(self, mock_dispatch):
+        resp = self._post(self.body, _sign(self.body, "s3cret"))
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.content)
+        self.assertEqual((data["received"], data["created"], data["duplicate"]), (3, 2, 1))
+        self.assertIn("entries_per_sec", data)
+        self.assertEqual(TogglTimeEntry.objects.filter(user=self.user).count(), 2)
+        mock_dispatch.assert_called_once_with(
+            "sync.tasks.drain_unsynced_entries", self.user.id, None, 1,
+            user_id=self.user.id, lane=BULK,
+        )
+
+    @patch("sync.tasks.dispatch")
+    def test_rejects_missing_or_bad_signature(self, mock_dispatch):
+        self.assertEqual(self._post(self.body).status_code, 401)
+        self.assertEqual(self._post(self.body, _sign(self.body, "wrong")).status_code, 401)
+        self.assertFalse(TogglTimeEntry.objects.exists())
+        mock_dispatch.assert_not_called()
+
+    def test_requires_a_webhook_secret(self):
+        self.ws.webhook_secret = ""
+        self.ws.save()
+        self.assertEqual(self._post(self.body).status_code, 403)
+
+    def test_unknown_token_returns_404(self):
+        resp = self.client.post("/webhook/toggl/nope/bulk/", b"[]", content_type="application/json")
+        self.assertEqual(resp.status_code, 404)
+
+    def test_oversized_body_returns_413(self):
+        with self.settings(WEBHOOK_BULK_MAX_BYTES=10):
+            self.assertEqual(self._post(self.body, _sign(self.body, "s3cret")).status_code, 413)
+
+
+class IngestWebhooksCommandTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("testuser", password="pass")
+        TogglWorkspace.objects.create(
+            user=self.user, toggl_id=1, name="WS", webhook_token="tok_abc",
+            webhook_secret="s3cret",
+        )
+
+    def test_ingests_file(self):
+        signed = json.dumps(_event(2))
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl") as f:
+            f.write(_lines([
+                _event(1), {"body": signed, "signature": _sign(signed.encode(), "s3cret")},
+            ]))
+            f.flush()
+            out = StringIO()
+            call_command("ingest_webhooks", f.name, user="testuser", stdout=out)
+        self.assertIn("2 received, 2 applied (2 created, 0 updated)", out.getvalue())
+        self.assertEqual(TogglTimeEntry.objects.filter(user=self.user).count(), 2)
+
+    def test_unknown_user(self):
+        with self.assertRaises(CommandError):
+            call_command("ingest_webhooks", "-", user="nobody")
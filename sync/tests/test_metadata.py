@@ -0,0 +1,261 @@
+"""Tests for the Toggl metadata sync engine and its callers."""
+
+import threading
+import time
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from sync.metadata import MetadataSync
+from sync.models import (
+    ColorResolver, TogglOrganization, TogglProject, TogglTag, TogglWorkspace, WebhookInboxItem,
+)
+from sync.services.toggl import TogglAPIError
+from sync.tasks import sync_toggl_metadata_for_user
+
+
+def _toggl(orgs=(), workspaces=(), projects=None, tags=None):
+    toggl = MagicMock()
+    toggl.get_organizations.return_value = list(orgs)
+    toggl.get_workspaces.return_value = list(workspaces)
+    toggl.get_projects.side_effect = lambda ws_id: (projects or {}).get(ws_id, [])
+    toggl.get_tags.side_effect = lambda ws_id: (tags or {}).get(ws_id, [])
+    return toggl
+
+
+class MetadataSyncTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("testuser", password="pass")
+
+    def _sync(self, toggl):
+        engine = MetadataSync(self.user, toggl)
+        engine.run()
+        return engine
+
+    def test_creates_everything(self):
+        engine = self._sync(_toggl(
+            orgs=[{"id": 1, "name": "Org"}],
+            workspaces=[{"id": 10, "name": "WS", "organization_id": 1}],
+            projects={10: [{"id": 100, "name": "P", "color": "#f00"}]},
+            tags={10: [{"id": 200, "name": "t"}]},
+        ))
+        ws = TogglWorkspace.objects.get(user=self.user, toggl_id=10)
+        self.assertEqual(ws.organization.toggl_id, 1)
+        self.assertTrue(ws.webhook_token)
+        project = TogglProject.objects.get(user=self.user, toggl_id=100)
+        self.assertEqual((project.workspace, project.color, project.active), (ws, "#f00", True))
+        self.assertEqual(TogglTag.objects.get(user=self.user, toggl_id=200).workspace, ws)
+        for kind in ("organizations", "workspaces", "projects", "tags"):
+            self.assertEqual(engine.stats[kind].created, 1, kind)
+
+    def test_counts_updated_and_unchanged(self):
+        ws = TogglWorkspace.objects.create(user=self.user, toggl_id=10, name="WS", webhook_token="tok")
+        TogglProject.objects.create(user=self.user, toggl_id=100, workspace=ws, name="Old")
+        TogglProject.objects.create(user=self.user, toggl_id=101, workspace=ws, name="Same")
+        engine = self._sync(_toggl(
+            workspaces=[{"id": 10, "name": "WS"}],
+            projects={10: [
+                {"id": 100, "name": "New"},
+                {"id": 101, "name": "Same"},
+                {"id": 102, "name": "Added"},
+            ]},
+        ))
+        stats = engine.stats["projects"]
+        self.assertEqual((stats.created, stats.updated, stats.unchanged), (1, 1, 1))
+        self.assertEqual(TogglProject.objects.get(toggl_id=100).name, "New")
+        self.assertEqual(engine.stats["workspaces"].unchanged, 1)
+        ws.refresh_from_db()
+        self.assertEqual(ws.webhook_token, "tok")
+
+    def test_deletes_vanished_rows(self):
+        org = TogglOrganization.objects.create(user=self.user, toggl_id=1, name="Gone")
+        ws = TogglWorkspace.objects.create(user=self.user, toggl_id=10, name="WS", organization=org)
+        gone_ws = TogglWorkspace.objects.create(user=self.user, toggl_id=11, name="Gone")
+        TogglProject.objects.create(user=self.user, toggl_id=100, workspace=ws, name="Gone")
+        TogglProject.objects.create(user=self.user, toggl_id=101, workspace=gone_ws, name="Gone")
+        TogglTag.objects.create(user=self.user, toggl_id=200, workspace=gone_ws, name="gone")
+
+        engine = self._sync(_toggl(workspaces=[{"id": 10, "name": "WS"}]))
+
+        self.assertFalse(TogglOrganization.objects.filter(user=self.user).exists())
+        self.assertEqual(list(TogglWorkspace.objects.values_list("toggl_id", flat=True)), [10])
+        self.assertFalse(TogglProject.objects.exists())
+        self.assertFalse(TogglTag.objects.exists())
+        self.assertEqual(engine.stats["organizations"].deleted, 1)
+        self.assertEqual(engine.stats["workspaces"].deleted, 1)
+        self.assertEqual(engine.stats["projects"].deleted, 1)
+
+    def test_logs_inbox_items_of_vanished_workspaces(self):
+        gone_ws = TogglWorkspace.objects.create(user=self.user, toggl_id=11, name="Gone")
+        item = WebhookInboxItem.objects.create(workspace=gone_ws, body="{}")
+
+        with self.assertLogs("sync.metadata", "WARNING") as logs:
+            MetadataSync(self.user, _toggl(workspaces=[{"id": 10, "name": "WS"}])).sync_workspaces()
+
+        self.assertIn(f"dropping 1 unprocessed webhook inbox items: [{item.id}]", logs.output[0])
+        self.assertFalse(WebhookInboxItem.objects.exists())
+
+    def test_failed_fetch_keeps_existing_rows(self):
+        ws = TogglWorkspace.objects.create(user=self.user, toggl_id=10, name="WS")
+        TogglProject.objects.create(user=self.user, toggl_id=100, workspace=ws, name="Kept")
+        toggl = _toggl(workspaces=[{"id": 10, "name": "WS"}])
+        toggl.get_projects.side_effect = TogglAPIError("fail")
+
+        engine = self._sync(toggl)
+
+        self.assertTrue(TogglProject.objects.filter(toggl_id=100).exists())
+        self.assertEqual([(ws_id, kind) for ws_id, kind, _ in engine.errors], [(10, "projects")])
+
+    def test_null_listings_keep_existing_rows(self):
+        org = TogglOrganization.objects.create(user=self.user, toggl_id=1, name="Org")
+        ws = TogglWorkspace.objects.create(
+            user=self.user, toggl_id=10, name="WS", organization=org, webhook_token="tok",
+        )
+        TogglProject.objects.create(user=self.user, toggl_id=100, workspace=ws, name="P")
+        TogglTag.objects.create(user=self.user, toggl_id=200, workspace=ws, name="t")
+        toggl = _toggl()
+        toggl.get_organizations.return_value = None
+        toggl.get_workspaces.return_value = None
+        toggl.get_projects.side_effect = None
+        toggl.get_projects.return_value = None
+        toggl.get_tags.side_effect = None
+        toggl.get_tags.return_value = None
+
+        engine = self._sync(toggl)
+
+        self.assertTrue(TogglOrganization.objects.filter(toggl_id=1).exists())
+        self.assertEqual(TogglWorkspace.objects.get(toggl_id=10).webhook_token, "tok")
+        self.assertTrue(TogglProject.objects.filter(toggl_id=100).exists())
+        self.assertTrue(TogglTag.objects.filter(toggl_id=200).exists())
+        self.assertEqual(sum(stats.deleted for stats in engine.stats.values()), 0)
+
+    def test_query_count_independent_of_row_count(self):
+        def run(n):
+            TogglProject.objects.all().delete()
+            toggl = _toggl(
+                workspaces=[{"id": 10, "name": "WS"}],
+                projects={10: [{"id": i, "name": f"P{i}"} for i in range(n)]},
+            )
+            with CaptureQueriesContext(connection) as ctx:
+                MetadataSync(self.user, toggl).sync_projects_and_tags()
+            return len(ctx)
+
+        TogglWorkspace.objects.create(user=self.user, toggl_id=10, name="WS", webhook_token="tok")
+        self.assertEqual(run(2), run(100))
+
+    def test_invalidates_color_resolver(self):
+        resolver = ColorResolver.for_user(self.user)
+        self._sync(_toggl())
+        self.assertIsNot(ColorResolver.for_user(self.user), resolver)
+
+    def test_organization_and_workspace_syncs_invalidate_color_resolver(self):
+        engine = MetadataSync(self.user, _toggl())
+        for sync in (engine.sync_organizations, engine.sync_workspaces):
+            resolver = ColorResolver.for_user(self.user)
+            sync()
+            self.assertIsNot(ColorResolver.for_user(self.user), resolver, sync.__name__)
+
+
+class ConcurrentFetchTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("testuser", password="pass")
+        for i in range(6):
+            TogglWorkspace.objects.create(user=self.user, toggl_id=i, name=f"WS{i}", webhook_token=f"t{i}")
+
+    def _tracking_toggl(self, token):
+        lock = threading.Lock()
+        state = {"active": 0, "peak": 0}
+
+        def slow(ws_id):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            time.sleep(0.02)
+            with lock:
+                state["active"] -= 1
+            return [{"id": ws_id * 100, "name": f"x{ws_id}"}]
+
+        toggl = _toggl()
+        toggl.api_token = token
+        toggl.get_projects.side_effect = slow
+        toggl.get_tags.side_effect = slow
+        toggl.list_webhooks.side_effect = slow
+        return toggl, state
+
+    @override_settings(TOGGL_MAX_CONCURRENCY=3)
+    def test_fetches_in_parallel_within_limit(self):
+        toggl, state = self._tracking_toggl("concurrency-token")
+        engine = MetadataSync(self.user, toggl)
+        engine.sync_projects_and_tags(include_webhooks=True)
+
+        self.assertEqual(state["peak"], 3)
+        self.assertEqual(TogglProject.objects.filter(user=self.user).count(), 6)
+        self.assertEqual(TogglTag.objects.filter(user=self.user).count(), 6)
+        self.assertEqual(len(engine.webhooks), 6)
+
+    @override_settings(TOGGL_MAX_CONCURRENCY=1)
+    def test_limit_of_one_is_sequential(self):
+        toggl, state = self._tracking_toggl("sequential-token")
+        MetadataSync(self.user, toggl).sync_projects_and_tags()
+        self.assertEqual(state["peak"], 1)
+
+    @patch("sync.tasks.messages")
+    @patch("sync.tasks.TogglService")
+    @override_settings(WEBHOOK_DOMAIN="sync.example.com")
+    def test_admin_sync_discovers_existing_webhooks(self, mock_cls, mock_messages):
+        self.user.credentials.toggl_api_token = "tok"
+        self.user.credentials.save()
+        toggl = _toggl(workspaces=[{"id": 1, "name": "WS1"}])
+        toggl.list_webhooks.side_effect = lambda ws_id: [{
+            "url_callback": "https://sync.example.com/webhook/toggl/abc/",
+            "subscription_id": 77, "secret": "s", "enabled": True,
+        }]
+        mock_cls.return_value = toggl
+
+        sync_toggl_metadata_for_user(MagicMock(), self.user)
+
+        ws = TogglWorkspace.objects.get(user=self.user, toggl_id=1)
+        self.assertEqual((ws.webhook_token, ws.webhook_subscription_id), ("abc", 77))
+        self.assertIn("1 existing webhooks", mock_messages.success.call_args[0][1])
+
+    def test_webhook_failure_rolls_back_projects_and_tags(self):
+        toggl = _toggl(
+            workspaces=[{"id": 1, "name": "WS1"}],
+            projects={1: [{"id": 100, "name": "P"}]},
+            tags={1: [{"id": 200, "name": "t"}]},
+        )
+        toggl.list_webhooks.return_value = []
+        engine = MetadataSync(self.user, toggl)
+        engine.sync_workspaces()
+
+        with patch.object(MetadataSync, "_apply_webhooks", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                engine.sync_projects_and_tags(include_webhooks=True)
+
+        self.assertFalse(TogglProject.objects.exists())
+        self.assertFalse(TogglTag.objects.exists())
+
+
+class SyncMetadataCommandTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("testuser", password="pass")
+        self.user.credentials.toggl_api_token = "tok"
+        self.user.credentials.save()
+
+    @patch("sync.management.commands.sync_metadata.TogglService")
+    def test_reports_counts(self, mock_cls):
+        mock_cls.return_value = _toggl(
+            workspaces=[{"id": 10, "name": "WS"}],
+            tags={10: [{"id": 200, "name": "t"}]},
+        )
+        out = StringIO()
+        call_command("sync_metadata", user="testuser", stdout=out)
+        self.assertIn("Workspaces: 1 created, 0 updated, 0 unchanged, 0 deleted", out.getvalue())
+        self.assertIn("Tags: 1 created", out.getvalue())
+        self.user.credentials.refresh_from_db()
+        self.assertIsNotNone(self.user.credentials.last_toggl_metadata_sync)
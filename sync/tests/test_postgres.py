@@ -0,0 +1,47 @@
+"""PostgreSQL-only checks; run the suite with DATABASE_ENGINE=postgresql."""
+
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from sync.models import EntityColorMapping, TogglTimeEntry
+
+
+@skipUnless(connection.vendor == "postgresql", "requires PostgreSQL")
+class PostgresIndexTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("testuser", password="pass")
+        TogglTimeEntry.objects.bulk_create([
+            TogglTimeEntry(
+                user=self.user, toggl_id=i, start_time=timezone.now(),
+                tag_ids=[i % 7, 100 + i % 3], synced=True,
+            )
+            for i in range(200)
+        ])
+
+    def test_tag_ids_gin_index_exists(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT indexdef FROM pg_indexes WHERE indexname = %s",
+                ["sync_entry_tag_ids_gin"],
+            )
+            row = cursor.fetchone()
+        self.assertIsNotNone(row)
+        self.assertIn("gin", row[0])
+
+    def test_tag_lookup_uses_gin_index(self):
+        mapping = EntityColorMapping(
+            user=self.user, entity_type="tag", entity_id=101,
+            entity_name="T", color_name="Tomato", process_order=1,
+        )
+        matching = mapping.find_matching_entries()
+        self.assertEqual(matching.count(), len([i for i in range(200) if i % 3 == 1]))
+
+        # Few rows here, so only without seq scans does the plan show the index
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        plan = TogglTimeEntry.objects.filter(tag_ids__contains=101).explain()
+        self.assertIn("sync_entry_tag_ids_gin", plan)
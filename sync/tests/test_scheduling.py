@@ -0,0 +1,103 @@
+"""Tests for coalescing of per-entry sync tasks."""
+
+from datetime import timedelta
+from unittest.mock import ANY, patch
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from sync.models import PendingEntrySync, SyncMetric
+from sync.scheduling import COALESCED, EXECUTED, claim_entry_sync, request_entry_sync
+from sync.tasks import run_entry_sync
+
+
+@override_settings(SYNC_COALESCE_WINDOW=5, DISPATCH_SLICE_BATCHES=1)
+@patch("sync.scheduling.dispatch")
+class RequestEntrySyncTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("testuser", password="pass")
+
+    def test_first_request_runs_immediately(self, mock_dispatch):
+        before = timezone.now()
+        self.assertTrue(request_entry_sync(self.user.id, 7))
+        mock_dispatch.assert_called_once_with(
+            "sync.tasks.run_entry_sync", self.user.id, 7, user_id=self.user.id, run_after=ANY,
+        )
+        run_after = mock_dispatch.call_args.kwargs["run_after"]
+        self.assertLessEqual(run_after - before, timedelta(seconds=1))
+
+    def test_burst_enqueues_one_task(self, mock_dispatch):
+        results = [request_entry_sync(self.user.id, 7) for _ in range(5)]
+
+        self.assertEqual(results, [True, False, False, False, False])
+        mock_dispatch.assert_called_once()
+        pending = PendingEntrySync.objects.get()
+        self.assertEqual(pending.requests, 5)
+        # Counted when the sync claims them, not on the request path
+        self.assertEqual(SyncMetric.snapshot(), {})
+        claim_entry_sync(self.user.id, 7)
+        self.assertEqual(SyncMetric.snapshot(), {COALESCED: 4, EXECUTED: 1})
+
+    def test_entries_are_independent(self, mock_dispatch):
+        request_entry_sync(self.user.id, 7)
+        request_entry_sync(self.user.id, 8)
+        self.assertEqual(mock_dispatch.call_count, 2)
+
+    def test_edits_after_a_sync_queue_one_follow_up_a_window_later(self, mock_dispatch):
+        request_entry_sync(self.user.id, 7)
+        self.assertEqual(claim_entry_sync(self.user.id, 7).toggl_id, 7)
+        follow_up = PendingEntrySync.objects.get().due_at
+        mock_dispatch.reset_mock()
+
+        results = [request_entry_sync(self.user.id, 7) for _ in range(3)]
+
+        self.assertEqual(results, [True, False, False])
+        mock_dispatch.assert_called_once_with(
+            "sync.tasks.run_entry_sync", self.user.id, 7,
+            user_id=self.user.id, run_after=follow_up,
+        )
+        self.assertAlmostEqual(
+            (follow_up - timezone.now()).total_seconds(), 5, delta=1
+        )
+
+    def test_request_after_a_quiet_window_runs_immediately(self, mock_dispatch):
+        request_entry_sync(self.user.id, 7)
+        claim_entry_sync(self.user.id, 7)
+        PendingEntrySync.objects.update(due_at=timezone.now() - timedelta(seconds=1))
+        mock_dispatch.reset_mock()
+
+        self.assertTrue(request_entry_sync(self.user.id, 7))
+        self.assertLessEqual(mock_dispatch.call_args.kwargs["run_after"], timezone.now())
+
+    def test_claim_takes_requests_once(self, mock_dispatch):
+        request_entry_sync(self.user.id, 7)
+        request_entry_sync(self.user.id, 7)
+
+        self.assertEqual(claim_entry_sync(self.user.id, 7).requests, 2)
+        self.assertIsNone(claim_entry_sync(self.user.id, 7))
+        self.assertEqual(PendingEntrySync.objects.get().requests, 0)
+        self.assertEqual(SyncMetric.snapshot()[EXECUTED], 1)
+
+    def test_claim_drops_rows_of_quiet_entries(self, mock_dispatch):
+        request_entry_sync(self.user.id, 8)
+        claim_entry_sync(self.user.id, 8)
+        PendingEntrySync.objects.update(due_at=timezone.now() - timedelta(seconds=1))
+
+        request_entry_sync(self.user.id, 7)
+        claim_entry_sync(self.user.id, 7)
+
+        self.assertEqual(list(PendingEntrySync.objects.values_list("toggl_id", flat=True)), [7])
+
+    @patch("sync.tasks.drain_unsynced_entries")
+    def test_run_entry_sync_drains_once(self, mock_drain, mock_dispatch):
+        request_entry_sync(self.user.id, 7)
+        request_entry_sync(self.user.id, 7)
+
+        with patch("time.sleep") as mock_sleep:
+            run_entry_sync(self.user.id, 7)
+            run_entry_sync(self.user.id, 7)  # duplicate task finds nothing to claim
+
+        mock_sleep.assert_not_called()
+        mock_drain.assert_called_once_with(self.user.id, max_batches=1, first_toggl_id=7)
+        self.assertEqual(SyncMetric.snapshot(), {COALESCED: 1, EXECUTED: 1})
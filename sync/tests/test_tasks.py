@@ -1,22 +1,26 @@
 """Tests for sync tasks, models, and color resolution."""
 
+import json
 from datetime import timedelta
 from unittest.mock import MagicMock, patch
 
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils import timezone
 
 from sync.models import (
     TogglTimeEntry, TogglWorkspace, TogglProject,
-    TogglTag, TogglOrganization, EntityColorMapping,
+    TogglTag, TogglOrganization, EntityColorMapping, ColorResolver, EntryMetadata,
 )
+from sync import tasks
+from sync.dispatch import BULK
 from sync.services.gcal import GoogleCalendarError
 from sync.services.toggl import TogglAPIError
 from sync.tasks import (
-    process_time_entry_event, _sync_to_calendar, _handle_deleted,
-    _refresh_unknown_metadata, apply_color_to_entry, validate_synced_events,
+    _refresh_metadata, apply_color_to_entry, validate_synced_events,
+    sync_entries_batch, drain_unsynced_entries, process_time_entry_event,
 )
+from sync.tests.fake_gcal import FakeCalendarAPI
 
 GCAL = patch("sync.tasks.GoogleCalendarService")
 
@@ -27,156 +31,241 @@ def _make_gcal(mock_cls, find_return=None):
     m.ensure_toggl_calendar.return_value = "cal_id"
     m.find_event_by_ical_uid.return_value = find_return
     m.create_event.return_value = {"id": "evt1"}
+    m.update_event.return_value = {"id": "evt1"}
+    _set_calendar(m, [])
     return m
 
 
-class ProcessTimeEntryEventTest(TestCase):
+def _set_calendar(gcal, events, sync_token="sync1"):
+    """Serve ``events`` from both the change feed and iCalUID lookups."""
+    by_uid = {e["iCalUID"]: e for e in events}
+    gcal.iter_event_changes.side_effect = lambda calendar_id, token: iter([(events, sync_token)])
+    gcal.find_events_by_ical_uids.side_effect = lambda calendar_id, uids: {
+        key: by_uid.get(uid) for key, uid in uids.items()
+    }
+
+
+class SyncEntriesBatchTest(TestCase):
     def setUp(self):
         self.user = User.objects.create_user("testuser", password="pass")
         self.user.credentials.gauth_credentials_json = '{"token": "t"}'
         self.user.credentials.save()
-        self.entry = TogglTimeEntry.objects.create(
-            user=self.user, toggl_id=100, description="Test",
-            start_time=timezone.now() - timedelta(hours=1),
-            end_time=timezone.now(), synced=False,
-        )
-
-    def test_skips_missing_user_and_entry(self):
-        process_time_entry_event(9999, 100)
-        process_time_entry_event(self.user.id, 9999)
-
-    def test_skips_if_not_connected(self):
-        self.user.credentials.gauth_credentials_json = ""
-        self.user.credentials.save()
-        process_time_entry_event(self.user.id, 100)
-        self.entry.refresh_from_db()
-        self.assertFalse(self.entry.synced)
+        self.entries = [
+            TogglTimeEntry.objects.create(
+                user=self.user, toggl_id=800 + i, description=f"Task {i}",
+                start_time=timezone.now() - timedelta(hours=1),
+                end_time=timezone.now(), pending_deletion=(i == 2),
+            )
+            for i in range(3)
+        ]
 
     @GCAL
-    def test_syncs_and_marks_synced(self, mock_cls):
-        _make_gcal(mock_cls)
-        process_time_entry_event(self.user.id, 100)
-        self.entry.refresh_from_db()
-        self.assertTrue(self.entry.synced)
+    def test_marks_only_successful_operations_synced(self, mock_cls):
+        gcal = _make_gcal(mock_cls)
+        e0, e1, e2 = self.entries
+        gcal.sync_events_batch.return_value = {
+            e0.id: {"id": "evt0", "etag": '"1"'}, e1.id: GoogleCalendarError("boom"), e2.id: {},
+        }
+        sync_entries_batch(self.user.id, [e.toggl_id for e in self.entries])
+
+        kwargs = gcal.sync_events_batch.call_args.kwargs
+        self.assertEqual(set(kwargs["upserts"]), {e0.id, e1.id})
+        self.assertEqual(kwargs["deletes"], {e2.id: "toggl802"})
+        synced = dict(TogglTimeEntry.objects.values_list("toggl_id", "synced"))
+        self.assertEqual(synced, {800: True, 801: False, 802: True})
+        e0.refresh_from_db()
+        self.assertEqual(e0.google_event_id, "evt0")
 
     @GCAL
-    def test_handles_deletion(self, mock_cls):
-        self.entry.pending_deletion = True
-        self.entry.save()
-        gcal = _make_gcal(mock_cls, {"id": "evt1"})
-        process_time_entry_event(self.user.id, 100)
-        gcal.delete_event.assert_called_once_with("cal_id", "evt1")
-        self.entry.refresh_from_db()
-        self.assertTrue(self.entry.synced)
+    def test_concurrent_update_keeps_entry_unsynced(self, mock_cls):
+        gcal = _make_gcal(mock_cls)
+        e0 = self.entries[0]
 
-    @GCAL
-    def test_exception_does_not_mark_synced(self, mock_cls):
-        mock_cls.side_effect = GoogleCalendarError("fail")
-        process_time_entry_event(self.user.id, 100)
-        self.entry.refresh_from_db()
-        self.assertFalse(self.entry.synced)
+        def concurrent_update(calendar_id, upserts, deletes, known):
+            TogglTimeEntry.objects.get(id=e0.id).save()
+            return {e0.id: {}}
+
+        gcal.sync_events_batch.side_effect = concurrent_update
+        sync_entries_batch(self.user.id, [e0.toggl_id])
+        e0.refresh_from_db()
+        self.assertFalse(e0.synced)
 
     @GCAL
-    def test_concurrent_update_prevents_synced_flag(self, mock_cls):
-        """If entry is modified mid-sync, synced stays False."""
+    def test_batch_failure_leaves_entries_unsynced(self, mock_cls):
         gcal = _make_gcal(mock_cls)
-
-        def concurrent_update(**kwargs):
-            fresh = TogglTimeEntry.objects.get(id=self.entry.id)
-            fresh.description = "Updated by webhook"
-            fresh.synced = False
-            fresh.save()
-            return {"id": "evt1"}
-
-        gcal.create_event.side_effect = concurrent_update
-        process_time_entry_event(self.user.id, 100)
-        self.entry.refresh_from_db()
-        self.assertFalse(self.entry.synced)
-        self.assertEqual(self.entry.description, "Updated by webhook")
+        gcal.sync_events_batch.side_effect = GoogleCalendarError("down")
+        sync_entries_batch(self.user.id, [e.toggl_id for e in self.entries])
+        self.assertFalse(TogglTimeEntry.objects.filter(synced=True).exists())
 
 
-class SyncToCalendarTest(TestCase):
+class DrainUnsyncedEntriesTest(TestCase):
     def setUp(self):
         self.user = User.objects.create_user("testuser", password="pass")
-        self.user.credentials.gauth_credentials_json = '{"token": "t"}'
+        self.api = FakeCalendarAPI()
+        self.user.credentials.gauth_credentials_json = json.dumps({
+            "token": "t", "refresh_token": "r", "client_id": "c", "client_secret": "s",
+            "expiry": (timezone.now() + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        })
+        self.user.credentials.google_calendar_id = self.api.add_calendar()
         self.user.credentials.save()
-        self.entry = TogglTimeEntry.objects.create(
-            user=self.user, toggl_id=200, description="My task",
-            start_time=timezone.now() - timedelta(hours=1),
-            end_time=timezone.now(), synced=False,
+        patcher = patch("sync.services.gcal.build_calendar_service", self.api.build_service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _entries(self, count, user=None, **fields):
+        start = timezone.now() - timedelta(hours=2)
+        return [
+            TogglTimeEntry.objects.create(
+                user=user or self.user, toggl_id=900 + i, description=f"Task {i}",
+                start_time=start, end_time=start + timedelta(hours=1), **fields,
+            )
+            for i in range(count)
+        ]
+
+    def test_drains_backlog_in_batches(self):
+        self._entries(7)
+        TogglTimeEntry.objects.filter(toggl_id=900).update(synced=True)
+        other = User.objects.create_user("other", password="pass")
+        self._entries(2, user=other)
+
+        self.assertEqual(drain_unsynced_entries(self.user.id, batch_size=3), 6)
+
+        self.assertFalse(TogglTimeEntry.objects.filter(user=self.user, synced=False).exists())
+        self.assertEqual(TogglTimeEntry.objects.filter(user=other, synced=False).count(), 2)
+        self.assertEqual(len(self.api.events()), 6)
+        # Pages of 3 + 3: one lookup batch and one insert batch each
+        self.assertEqual(self.api.http_calls, 4)
+
+    @patch("sync.tasks.dispatch")
+    def test_slice_dispatches_the_rest(self, mock_dispatch):
+        self._entries(7)
+
+        self.assertEqual(drain_unsynced_entries(self.user.id, batch_size=3, max_batches=1), 3)
+
+        self.assertEqual(TogglTimeEntry.objects.filter(user=self.user, synced=False).count(), 4)
+        mock_dispatch.assert_called_once_with(
+            "sync.tasks.drain_unsynced_entries", self.user.id, 3, 1,
+            user_id=self.user.id, lane=BULK,
         )
 
-    @GCAL
-    def test_creates_when_not_existing(self, mock_cls):
-        gcal = _make_gcal(mock_cls)
-        _sync_to_calendar(self.entry)
-        gcal.create_event.assert_called_once()
+    @patch("sync.tasks.dispatch")
+    def test_last_slice_dispatches_nothing(self, mock_dispatch):
+        self._entries(2)
+        self.assertEqual(drain_unsynced_entries(self.user.id, batch_size=3, max_batches=1), 2)
+        mock_dispatch.assert_not_called()
+
+    def test_deleted_entries_removed_in_same_pass(self):
+        live, gone = self._entries(2)
+        self.api.add_event(iCalUID=gone.gcal_event_id, summary="Old")
+        TogglTimeEntry.objects.filter(id=gone.id).update(pending_deletion=True)
+
+        self.assertEqual(drain_unsynced_entries(self.user.id), 2)
+        statuses = {e["iCalUID"]: e["status"] for e in self.api.events()}
+        self.assertEqual(statuses, {live.gcal_event_id: "confirmed", gone.gcal_event_id: "cancelled"})
+
+    def test_stored_events_are_written_by_id(self):
+        edited, gone, stale = self._entries(3)
+        for entry in (edited, gone, stale):
+            event = self.api.add_event(iCalUID=entry.gcal_event_id, summary="Old")
+            TogglTimeEntry.objects.filter(id=entry.id).update(
+                google_event_id=event["id"], google_event_etag=event["etag"],
+            )
+        TogglTimeEntry.objects.filter(id=gone.id).update(pending_deletion=True)
+        TogglTimeEntry.objects.filter(id=stale.id).update(google_event_etag='"stale"')
+        self.api.operations.clear()
+
+        self.assertEqual(drain_unsynced_entries(self.user.id), 3)
+
+        by_uid = {e["iCalUID"]: e for e in self.api.events()}
+        self.assertEqual(by_uid[edited.gcal_event_id]["summary"], "Task 0")
+        self.assertEqual(by_uid[gone.gcal_event_id]["status"], "cancelled")
+        self.assertEqual(by_uid[stale.gcal_event_id]["summary"], "Task 2")
+        # Only the stale etag (412) went through the iCalUID lookup
+        self.assertEqual(self.api.count("events.list"), 1)
+        self.assertEqual(self.api.count("events.patch"), 3)
+        edited.refresh_from_db()
+        gone.refresh_from_db()
+        self.assertEqual(edited.google_event_etag, by_uid[edited.gcal_event_id]["etag"])
+        self.assertEqual(gone.google_event_id, "")
+
+    def test_delete_of_an_event_already_gone_counts_as_synced(self):
+        gone, missing = self._entries(2, pending_deletion=True)
+        event = self.api.add_event(iCalUID=gone.gcal_event_id, status="cancelled")
+        TogglTimeEntry.objects.filter(id=gone.id).update(
+            google_event_id=event["id"], google_event_etag=event["etag"],
+        )
+        TogglTimeEntry.objects.filter(id=missing.id).update(
+            google_event_id="deleted-elsewhere", google_event_etag='"1"',
+        )
 
-    @GCAL
-    def test_updates_when_existing(self, mock_cls):
-        gcal = _make_gcal(mock_cls, {"id": "existing"})
-        _sync_to_calendar(self.entry)
-        gcal.update_event.assert_called_once()
-        self.assertEqual(gcal.update_event.call_args.kwargs["event_id"], "existing")
-        self.assertEqual(gcal.update_event.call_args.kwargs["summary"], "My task")
-        gcal.create_event.assert_not_called()
+        self.assertEqual(drain_unsynced_entries(self.user.id), 2)
 
-    @GCAL
-    def test_uses_color_mapping(self, mock_cls):
-        ws = TogglWorkspace.objects.create(user=self.user, toggl_id=1, name="WS")
-        TogglProject.objects.create(user=self.user, toggl_id=10, workspace=ws, name="P")
-        EntityColorMapping.objects.create(
-            user=self.user, entity_type="project", entity_id=10,
-            entity_name="P", color_name="Tomato", process_order=1,
+        self.assertFalse(TogglTimeEntry.objects.filter(synced=False).exists())
+        self.assertEqual(
+            set(TogglTimeEntry.objects.values_list("google_event_id", flat=True)), {""}
         )
-        self.entry.project_id = 10
-        self.entry.save()
-        gcal = _make_gcal(mock_cls)
-        _sync_to_calendar(self.entry)
-        self.assertEqual(gcal.create_event.call_args.kwargs["color_id"], "11")
 
-    @GCAL
-    def test_running_entry_gets_grey(self, mock_cls):
-        self.entry.end_time = None
-        self.entry.save()
-        gcal = _make_gcal(mock_cls)
-        _sync_to_calendar(self.entry)
-        self.assertEqual(gcal.create_event.call_args.kwargs["color_id"], "8")
+    @patch("sync.tasks.dispatch")
+    def test_first_entry_leads_the_first_page(self, mock_dispatch):
+        self._entries(5)
 
-    @GCAL
-    def test_no_description_placeholder(self, mock_cls):
-        self.entry.description = ""
-        self.entry.save()
-        gcal = _make_gcal(mock_cls)
-        _sync_to_calendar(self.entry)
-        self.assertEqual(gcal.create_event.call_args.kwargs["summary"], "(No description)")
+        drain_unsynced_entries(self.user.id, batch_size=2, max_batches=1, first_toggl_id=904)
 
+        synced = TogglTimeEntry.objects.filter(synced=True).values_list("toggl_id", flat=True)
+        self.assertEqual(sorted(synced), [900, 904])
+        mock_dispatch.assert_called_once()
 
-class HandleDeletedTest(TestCase):
-    def setUp(self):
-        self.user = User.objects.create_user("testuser", password="pass")
-        self.user.credentials.gauth_credentials_json = '{"token": "t"}'
-        self.user.credentials.save()
-        self.entry = TogglTimeEntry.objects.create(
-            user=self.user, toggl_id=300, description="Del",
-            start_time=timezone.now() - timedelta(hours=1),
-            end_time=timezone.now(), pending_deletion=True,
-        )
+    def test_first_entry_alone_in_a_page_keeps_the_cursor(self):
+        self._entries(3)
+        self.assertEqual(drain_unsynced_entries(self.user.id, batch_size=1, first_toggl_id=902), 3)
+        self.assertFalse(TogglTimeEntry.objects.filter(synced=False).exists())
 
-    @GCAL
-    def test_deletes_existing(self, mock_cls):
-        gcal = _make_gcal(mock_cls, {"id": "evt"})
-        _handle_deleted(self.entry)
-        gcal.delete_event.assert_called_once_with("cal_id", "evt")
+    @patch("sync.tasks.request_entry_sync")
+    def test_process_time_entry_event_requests_a_sync(self, mock_request):
+        process_time_entry_event(self.user.id, 900)
+        mock_request.assert_called_once_with(self.user.id, 900)
 
     @GCAL
-    def test_noop_when_already_gone(self, mock_cls):
+    def test_failed_rows_left_and_changed_rows_repushed(self, mock_cls):
         gcal = _make_gcal(mock_cls)
-        _handle_deleted(self.entry)
-        gcal.delete_event.assert_not_called()
+        entries = self._entries(4)
+
+        def push(calendar_id, upserts, deletes, known):
+            if entries[0].id in upserts and gcal.sync_events_batch.call_count == 1:
+                TogglTimeEntry.objects.get(id=entries[0].id).save()
+            return {
+                pk: GoogleCalendarError("boom") if pk == entries[3].id else {}
+                for pk in upserts
+            }
+
+        gcal.sync_events_batch.side_effect = push
+        self.assertEqual(drain_unsynced_entries(self.user.id, batch_size=2), 3)
+
+        # 903 failed and stays behind the cursor; 900 was edited mid-sync,
+        # so it was skipped once and pushed again on a later page
+        pages = [sorted(c.kwargs["upserts"]) for c in gcal.sync_events_batch.call_args_list]
+        ids = [e.id for e in entries]
+        self.assertEqual(pages, [ids[:2], ids[2:], ids[:1]])
+        mock_cls.assert_called_once()
+        unsynced = TogglTimeEntry.objects.filter(synced=False).values_list("toggl_id", flat=True)
+        self.assertEqual(list(unsynced), [903])
+
+    @override_settings(SYNC_DRAIN_BATCH=2)
+    def test_one_metadata_lookup_per_page(self):
+        self._entries(4)
+        with patch("sync.tasks._refresh_metadata", wraps=tasks._refresh_metadata) as spy:
+            drain_unsynced_entries(self.user.id)
+        self.assertEqual(spy.call_count, 2)
+
+    def test_not_connected_skips(self):
+        self._entries(1)
+        self.user.credentials.gauth_credentials_json = ""
+        self.user.credentials.save()
+        self.assertEqual(drain_unsynced_entries(self.user.id), 0)
+        self.assertEqual(self.api.http_calls, 0)
 
 
-class RefreshUnknownMetadataTest(TestCase):
+class RefreshMetadataTest(TestCase):
     def setUp(self):
         self.user = User.objects.create_user("testuser", password="pass")
         self.user.credentials.toggl_api_token = "tok"
@@ -193,7 +282,7 @@ class RefreshUnknownMetadataTest(TestCase):
             {"id": 999, "name": "New", "color": "#f00", "active": True}
         ]
         mock_cls.return_value.get_tags.return_value = []
-        _refresh_unknown_metadata(self.entry)
+        _refresh_metadata(self.user, [self.entry])
         self.assertTrue(TogglProject.objects.filter(user=self.user, toggl_id=999).exists())
 
     @patch("sync.tasks.TogglService")
@@ -205,7 +294,7 @@ class RefreshUnknownMetadataTest(TestCase):
         mock_cls.return_value.get_tags.return_value = [
             {"id": 50, "name": "a"}, {"id": 51, "name": "b"},
         ]
-        _refresh_unknown_metadata(self.entry)
+        _refresh_metadata(self.user, [self.entry])
         self.assertEqual(TogglTag.objects.filter(user=self.user, toggl_id__in=[50, 51]).count(), 2)
 
     @patch("sync.tasks.TogglService")
@@ -213,19 +302,41 @@ class RefreshUnknownMetadataTest(TestCase):
         TogglProject.objects.create(user=self.user, toggl_id=999, workspace=self.ws, name="K")
         self.entry.tag_ids = []
         self.entry.save()
-        _refresh_unknown_metadata(self.entry)
+        _refresh_metadata(self.user, [self.entry])
         mock_cls.assert_not_called()
 
     def test_skips_without_toggl_token(self):
         self.user.credentials.toggl_api_token = ""
         self.user.credentials.save()
-        _refresh_unknown_metadata(self.entry)
+        _refresh_metadata(self.user, [self.entry])
+
+    @patch("sync.tasks.TogglService")
+    def test_returns_metadata_with_fetched_names(self, mock_cls):
+        mock_cls.return_value.get_projects.return_value = [
+            {"id": 999, "name": "New", "color": "#f00", "active": True}
+        ]
+        mock_cls.return_value.get_tags.return_value = []
+        metadata = _refresh_metadata(self.user, [self.entry])
+        self.assertEqual(metadata.project_names, {999: "New"})
+        self.assertFalse(metadata.missing)
+
+    @patch("sync.tasks.TogglService")
+    def test_does_not_prune_other_rows(self, mock_cls):
+        TogglProject.objects.create(user=self.user, toggl_id=5, workspace=self.ws, name="Kept")
+        TogglTag.objects.create(user=self.user, toggl_id=6, workspace=self.ws, name="kept")
+        mock_cls.return_value.get_projects.return_value = [{"id": 999, "name": "New"}]
+        mock_cls.return_value.get_tags.return_value = None
+        _refresh_metadata(self.user, [self.entry])
+        self.assertEqual(
+            sorted(TogglProject.objects.values_list("toggl_id", flat=True)), [5, 999]
+        )
+        self.assertTrue(TogglTag.objects.filter(toggl_id=6).exists())
 
     @patch("sync.tasks.TogglService")
     def test_tolerates_api_errors(self, mock_cls):
         mock_cls.return_value.get_projects.side_effect = TogglAPIError("fail")
         mock_cls.return_value.get_tags.side_effect = TogglAPIError("fail")
-        _refresh_unknown_metadata(self.entry)
+        _refresh_metadata(self.user, [self.entry])
 
 
 class ApplyColorToEntryTest(TestCase):
@@ -265,13 +376,17 @@ class ValidateSyncedEventsTest(TestCase):
         self.user.credentials.gauth_credentials_json = '{"token": "t"}'
         self.user.credentials.save()
 
-    def _entry(self, toggl_id, desc="Task"):
+    def _entry(self, toggl_id, desc="Task", user=None):
         return TogglTimeEntry.objects.create(
-            user=self.user, toggl_id=toggl_id, description=desc,
+            user=user or self.user, toggl_id=toggl_id, description=desc,
             start_time=timezone.now() - timedelta(hours=1),
             end_time=timezone.now(), synced=True,
         )
 
+    def _event(self, toggl_id, summary="Task", status="confirmed"):
+        return {"id": f"e{toggl_id}", "iCalUID": f"toggl{toggl_id}",
+                "summary": summary, "status": status}
+
     @GCAL
     def test_marks_unsynced_when_missing(self, mock_cls):
         entry = self._entry(601)
@@ -280,10 +395,18 @@ class ValidateSyncedEventsTest(TestCase):
         entry.refresh_from_db()
         self.assertFalse(entry.synced)
 
+    @GCAL
+    def test_marks_unsynced_when_cancelled(self, mock_cls):
+        entry = self._entry(608)
+        _set_calendar(_make_gcal(mock_cls), [self._event(608, status="cancelled")])
+        validate_synced_events()
+        entry.refresh_from_db()
+        self.assertFalse(entry.synced)
+
     @GCAL
     def test_marks_unsynced_on_summary_mismatch(self, mock_cls):
         entry = self._entry(602, "Right")
-        _make_gcal(mock_cls, {"id": "e", "summary": "Wrong"})
+        _set_calendar(_make_gcal(mock_cls), [self._event(602, "Wrong")])
         validate_synced_events()
         entry.refresh_from_db()
         self.assertFalse(entry.synced)
@@ -291,11 +414,76 @@ class ValidateSyncedEventsTest(TestCase):
     @GCAL
     def test_keeps_synced_when_matching(self, mock_cls):
         entry = self._entry(603, "Match")
-        _make_gcal(mock_cls, {"id": "e", "summary": "Match"})
+        _set_calendar(_make_gcal(mock_cls), [self._event(603, "Match")])
         validate_synced_events()
         entry.refresh_from_db()
         self.assertTrue(entry.synced)
 
+    @GCAL
+    def test_change_feed_uses_and_stores_sync_token(self, mock_cls):
+        changed = self._entry(610, "Right")
+        self.user.credentials.google_sync_token = "s1"
+        self.user.credentials.save()
+        gcal = _make_gcal(mock_cls)
+        _set_calendar(gcal, [self._event(610, "Wrong")], sync_token="s2")
+
+        with self.settings(SYNC_VALIDATE_WINDOW=0):
+            validate_synced_events()
+
+        self.assertEqual(gcal.iter_event_changes.call_args.args, ("cal_id", "s1"))
+        gcal.find_events_by_ical_uids.assert_not_called()
+        changed.refresh_from_db()
+        self.assertFalse(changed.synced)
+        self.user.credentials.refresh_from_db()
+        self.assertEqual(self.user.credentials.google_sync_token, "s2")
+
+    @GCAL
+    def test_window_rotates_through_entries(self, mock_cls):
+        entries = [self._entry(700 + i) for i in range(5)]
+        gcal = _make_gcal(mock_cls)
+        _set_calendar(gcal, [self._event(700 + i) for i in range(5)])
+
+        windows = []
+        with self.settings(SYNC_VALIDATE_WINDOW=2):
+            for _ in range(4):
+                validate_synced_events()
+                uids = gcal.find_events_by_ical_uids.call_args.args[1]
+                windows.append(sorted(uids))
+
+        self.assertEqual(windows, [[700, 701], [702, 703], [704], [700, 701]])
+        self.assertTrue(all(
+            synced for synced in TogglTimeEntry.objects.values_list("synced", flat=True)
+        ))
+        self.user.credentials.refresh_from_db()
+        self.assertEqual(self.user.credentials.validation_cursor, entries[1].id)
+
+    @GCAL
+    def test_memory_bounded_by_chunk_size(self, mock_cls):
+        for i in range(60):
+            self._entry(900 + i)
+        gcal = _make_gcal(mock_cls)
+        events = [self._event(900 + i) for i in range(60)]
+        _set_calendar(gcal, events)
+        pages = [(events[:20], ""), (events[20:40], ""), (events[40:], "s")]
+        gcal.iter_event_changes.side_effect = lambda calendar_id, token: iter(pages)
+
+        peak = []
+        real_iter_chunks = tasks._iter_chunks
+
+        def spy(queryset, size):
+            for chunk in real_iter_chunks(queryset, size):
+                peak.append(len(chunk))
+                yield chunk
+
+        with patch.object(tasks, "RECONCILE_CHUNK_SIZE", 8), \
+             patch.object(tasks, "_iter_chunks", spy), \
+             self.settings(SYNC_VALIDATE_WINDOW=30):
+            validate_synced_events()
+
+        self.assertEqual(max(peak), 8)
+        self.assertEqual(sum(peak), 60 + 30)
+        self.assertEqual(TogglTimeEntry.objects.filter(synced=False).count(), 0)
+
     @GCAL
     def test_skips_disconnected_user(self, mock_cls):
         entry = self._entry(604)
@@ -315,17 +503,22 @@ class ValidateSyncedEventsTest(TestCase):
         mock_cls.assert_not_called()
 
     @GCAL
-    def test_tolerates_per_entry_error(self, mock_cls):
+    def test_tolerates_per_user_error(self, mock_cls):
+        other = User.objects.create_user("other", password="pass")
+        other.credentials.gauth_credentials_json = '{"token": "t"}'
+        other.credentials.save()
         e1 = self._entry(606, "First")
-        e2 = self._entry(607, "Second")
+        e2 = self._entry(607, "Second", user=other)
         gcal = _make_gcal(mock_cls)
+        _set_calendar(gcal, [self._event(606, "First"), self._event(607, "Second")])
+        feed = gcal.iter_event_changes.side_effect
 
-        def side_effect(calendar_id, ical_uid):
-            if ical_uid == e1.gcal_event_id:
+        def side_effect(calendar_id, sync_token):
+            if gcal.iter_event_changes.call_count == 1:
                 raise GoogleCalendarError("transient")
-            return {"id": "e", "summary": "Second"}
+            return feed(calendar_id, sync_token)
 
-        gcal.find_event_by_ical_uid.side_effect = side_effect
+        gcal.iter_event_changes.side_effect = side_effect
         validate_synced_events()
         e1.refresh_from_db()
         e2.refresh_from_db()
@@ -376,6 +569,35 @@ class GetGcalDataTest(TestCase):
         e = self._entry(12345)
         self.assertEqual(e.gcal_event_id, "toggl12345")
 
+    def _assert_constant_queries(self, count):
+        for i in range(3):
+            TogglProject.objects.create(user=self.user, toggl_id=10 + i, workspace=self.ws, name=f"P{i}")
+            TogglTag.objects.create(user=self.user, toggl_id=20 + i, workspace=self.ws, name=f"t{i}")
+        TogglTimeEntry.objects.bulk_create(
+            TogglTimeEntry(user=self.user, toggl_id=1000 + i, start_time=self.now,
+                           end_time=self.now, project_id=10 + i % 3, tag_ids=[20 + i % 3, 22])
+            for i in range(count)
+        )
+        entries = list(TogglTimeEntry.objects.filter(user=self.user))
+        with self.assertNumQueries(2):
+            metadata = EntryMetadata(self.user.id, entries)
+            payloads = [e.get_gcal_data(metadata=metadata) for e in entries]
+        self.assertEqual(len(payloads), count)
+        self.assertIn("Project: P", payloads[0]["description"])
+        self.assertIn("t2", payloads[0]["description"])
+
+    def test_single_entry_constant_queries(self):
+        self._assert_constant_queries(1)
+
+    def test_500_entries_constant_queries(self):
+        self._assert_constant_queries(500)
+
+    def test_tags_listed_by_name(self):
+        TogglTag.objects.create(user=self.user, toggl_id=21, workspace=self.ws, name="b")
+        TogglTag.objects.create(user=self.user, toggl_id=20, workspace=self.ws, name="a")
+        e = self._entry(704, tag_ids=[21, 20, 99])
+        self.assertIn("Tags: a, b", e.get_gcal_data()["description"])
+
 
 class ResolveColorTest(TestCase):
     def setUp(self):
@@ -417,3 +639,32 @@ class ResolveColorTest(TestCase):
 
     def test_no_args_returns_none(self):
         self.assertIsNone(EntityColorMapping.resolve_color(self.user))
+
+    def test_resolver_is_query_free_once_built(self):
+        self._map("workspace", 10, "Peacock", 1)
+        self._map("tag", 50, "Tomato", 2)
+        resolver = ColorResolver.for_user(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolver.resolve(100, [50]), "11")
+            self.assertEqual(resolver.resolve(100, []), "7")
+            self.assertIsNone(resolver.resolve(999, [1]))
+            self.assertIs(ColorResolver.for_user(self.user), resolver)
+
+    def test_mapping_change_invalidates_resolver(self):
+        self._map("project", 100, "Blueberry", 1)
+        self.assertEqual(EntityColorMapping.resolve_color(self.user, project_id=100), "9")
+        EntityColorMapping.objects.filter(user=self.user).get().delete()
+        self.assertIsNone(EntityColorMapping.resolve_color(self.user, project_id=100))
+
+    def test_project_change_invalidates_resolver(self):
+        self._map("workspace", 20, "Peacock", 1)
+        self.assertIsNone(EntityColorMapping.resolve_color(self.user, project_id=100))
+        ws2 = TogglWorkspace.objects.create(user=self.user, toggl_id=20, name="WS2")
+        self.project.workspace = ws2
+        self.project.save()
+        self.assertEqual(EntityColorMapping.resolve_color(self.user, project_id=100), "7")
+
+    def test_resolver_expires_after_ttl(self):
+        resolver = ColorResolver.for_user(self.user)
+        resolver.built_at -= ColorResolver.CACHE_TTL + 1
+        self.assertIsNot(ColorResolver.for_user(self.user), resolver)
@@ -0,0 +1,130 @@
+"""Tests for TogglService retries and rate limiting against a local stub server."""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import SimpleTestCase, override_settings
+
+from sync.services.toggl import TogglAPIError, TogglService, TokenBucket, close_sessions
+from sync.tests.stub_toggl import StubToggl
+
+
+@override_settings(
+    TOGGL_RATE_LIMIT=0,
+    TOGGL_MAX_RETRIES=3,
+    TOGGL_RETRY_BASE_DELAY=0.01,
+    TOGGL_RETRY_MAX_DELAY=0.5,
+    TOGGL_CONNECT_TIMEOUT=1,
+    TOGGL_READ_TIMEOUT=1,
+)
+class TogglRetryTest(SimpleTestCase):
+    def setUp(self):
+        self.server = StubToggl.start()
+        self.addCleanup(self.server.stop)
+        self.toggl = TogglService(f"token-{self._testMethodName}")
+        self.override = override_settings(
+            TOGGL_API_ENDPOINT=self.server.url, TOGGL_WEBHOOK_API_ENDPOINT=self.server.url
+        )
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+
+    def test_retries_429_honouring_retry_after(self):
+        self.server.responses = [
+            (429, {"Retry-After": "0.2"}, {}),
+            (200, {}, [{"id": 1, "name": "WS"}]),
+        ]
+        started = time.monotonic()
+        self.assertEqual(self.toggl.get_workspaces(), [{"id": 1, "name": "WS"}])
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(self.toggl.stats["retries"], 1)
+        self.assertGreaterEqual(self.toggl.stats["throttled_seconds"], 0.2)
+
+    def test_retries_429_on_post(self):
+        self.server.responses = [(429, {}, {}), (200, {}, {"subscription_id": 5})]
+        result = self.toggl._request_api("POST", "subscriptions/1", json={})
+        self.assertEqual(result, {"subscription_id": 5})
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_gives_up_after_max_retries(self):
+        self.server.responses = [(503, {}, {})] * 10
+        with self.assertRaises(TogglAPIError) as ctx:
+            self.toggl.get_organizations()
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(self.toggl.stats["retries"], 3)
+
+    def test_5xx_not_retried_for_post(self):
+        self.server.responses = [(502, {}, {})]
+        with self.assertRaises(TogglAPIError):
+            self.toggl._request_api("POST", "subscriptions/1", json={})
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_client_errors_raise_immediately(self):
+        self.server.responses = [(402, {}, {"error": "limit"})]
+        with self.assertRaises(TogglAPIError) as ctx:
+            self.toggl.list_webhooks(1)
+        self.assertEqual(ctx.exception.status_code, 402)
+        self.assertIn("402", str(ctx.exception))
+        self.assertEqual(len(self.server.requests), 1)
+
+    @override_settings(TOGGL_READ_TIMEOUT=0.1, TOGGL_MAX_RETRIES=1)
+    def test_read_timeout_is_retried_then_raised(self):
+        self.server.delay = 0.3
+        with self.assertRaises(TogglAPIError):
+            self.toggl.get_tags(1)
+        self.assertEqual(self.toggl.stats["retries"], 1)
+
+    def test_stats_are_counted_across_threads(self):
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(self.toggl.get_tags, range(40)))
+        self.assertEqual(self.toggl.stats["requests"], 40)
+
+    def test_204_returns_none(self):
+        self.server.responses = [(204, {}, None)]
+        self.assertIsNone(self.toggl.delete_webhook(1, 2))
+
+
+class TokenBucketTest(SimpleTestCase):
+    def test_throttles_beyond_burst(self):
+        bucket = TokenBucket(rate=20, capacity=2)
+        waited = sum(bucket.acquire() for _ in range(4))
+        # Two free tokens, then two more at 1/20s each
+        self.assertAlmostEqual(waited, 0.1, delta=0.04)
+
+    def test_zero_rate_disables_limiting(self):
+        bucket = TokenBucket(rate=0, capacity=1)
+        self.assertEqual(sum(bucket.acquire() for _ in range(10)), 0)
+
+    @override_settings(TOGGL_RATE_LIMIT=50, TOGGL_RATE_BURST=1)
+    def test_services_share_a_bucket_per_token(self):
+        first = TogglService("shared-bucket-token")
+        second = TogglService("shared-bucket-token")
+        self.assertIs(first.bucket, second.bucket)
+        self.assertIsNot(first.bucket, TogglService("other-bucket-token").bucket)
+
+
+@override_settings(TOGGL_RATE_LIMIT=0)
+class SessionPoolTest(SimpleTestCase):
+    def setUp(self):
+        self.server = StubToggl.start()
+        self.addCleanup(self.server.stop)
+        self.addCleanup(close_sessions)
+        self.override = override_settings(TOGGL_API_ENDPOINT=self.server.url)
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+
+    def test_services_share_a_session_per_token(self):
+        self.assertIs(TogglService("a").session, TogglService("a").session)
+        self.assertIsNot(TogglService("a").session, TogglService("b").session)
+        self.assertEqual(TogglService("b").session.auth, ("b", "api_token"))
+
+    def test_connection_reused_across_services(self):
+        for _ in range(10):
+            TogglService("pooled").get_workspaces()
+        self.assertEqual(len(self.server.requests), 10)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_close_sessions_starts_a_new_pool(self):
+        session = TogglService("closing").session
+        close_sessions()
+        self.assertIsNot(TogglService("closing").session, session)
@@ -1,13 +1,24 @@
 """Tests for Toggl webhook view."""
 
 import json
-from unittest.mock import patch
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
 
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase, RequestFactory
+from django.db import connection
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
-from sync.models import TogglWorkspace, TogglTimeEntry
+from sync.models import (
+    PendingEntrySync, SyncMetric, TogglProject, TogglTag, TogglTimeEntry, TogglWorkspace, WebhookInboxItem,
+)
+from sync.tasks import drain_webhook_inbox
 from sync.views import toggl_webhook
+from sync.webhooks import (
+    DUPLICATE, STALE, WebhookTokenCache, _drop_reason, _inbox_waker, handle_time_entry_event,
+)
 
 
 class TogglWebhookTest(TestCase):
@@ -37,7 +48,7 @@ class TogglWebhookTest(TestCase):
         request = self.factory.post("/", data="bad", content_type="application/json")
         self.assertEqual(toggl_webhook(request, webhook_token="tok_abc").status_code, 400)
 
-    @patch("sync.views.async_task")
+    @patch("sync.scheduling.dispatch")
     def test_created_saves_entry_and_queues_task(self, mock_async):
         self._post("tok_abc", {
             "payload": {"id": 123, "description": "Work", "start": "2026-02-27T10:00:00Z",
@@ -49,9 +60,9 @@ class TogglWebhookTest(TestCase):
         self.assertFalse(entry.synced)
         mock_async.assert_called_once()
         self.assertEqual(mock_async.call_args[0][:3],
-                         ("sync.tasks.process_time_entry_event", self.user.id, 123))
+                         ("sync.tasks.run_entry_sync", self.user.id, 123))
 
-    @patch("sync.views.async_task")
+    @patch("sync.scheduling.dispatch")
     def test_updated_resets_synced(self, mock_async):
         TogglTimeEntry.objects.create(
             user=self.user, toggl_id=123, description="Old",
@@ -66,7 +77,7 @@ class TogglWebhookTest(TestCase):
         self.assertEqual(entry.description, "New")
         self.assertFalse(entry.synced)
 
-    @patch("sync.views.async_task")
+    @patch("sync.scheduling.dispatch")
     def test_deleted_sets_pending_deletion(self, mock_async):
         TogglTimeEntry.objects.create(
             user=self.user, toggl_id=123, description="Del",
@@ -77,12 +88,392 @@ class TogglWebhookTest(TestCase):
         self.assertTrue(entry.pending_deletion)
         self.assertFalse(entry.synced)
 
-    @patch("sync.views.async_task")
+    def _tagged_event(self):
+        TogglProject.objects.create(user=self.user, toggl_id=10, workspace=self.ws, name="Proj")
+        TogglTag.objects.create(user=self.user, toggl_id=20, workspace=self.ws, name="urgent")
+        return {
+            "payload": {"id": 123, "description": "Work", "start": "2026-02-27T10:00:00Z",
+                        "stop": "2026-02-27T11:00:00Z", "project_id": 10, "tag_ids": [20, 21]},
+            "metadata": {"action": "created"},
+        }
+
+    @patch("sync.scheduling.dispatch")
+    def test_info_logging_runs_no_name_lookups(self, mock_async):
+        payload = self._tagged_event()
+        with self.assertLogs("sync.webhooks", "INFO") as logs, \
+                CaptureQueriesContext(connection) as queries:
+            handle_time_entry_event(self.user, payload)
+        self.assertFalse([
+            q for q in queries
+            if "sync_togglproject" in q["sql"] or "sync_toggltag" in q["sql"]
+        ])
+        self.assertIn("project:10 tags:[20, 21]", logs.output[0])
+        self.assertEqual(logs.records[0].toggl_tag_ids, [20, 21])
+
+    @patch("sync.utils.threading.Timer")
+    @patch("sync.dispatch.async_task")
+    def test_inline_event_query_counts(self, mock_async, mock_timer):
+        TogglTimeEntry.objects.create(
+            user=self.user, toggl_id=123, start_time=timezone.now(), synced=True,
+        )
+        # Synced before, quiet since
+        PendingEntrySync.objects.create(
+            user=self.user, toggl_id=123, requests=0,
+            due_at=timezone.now() - timedelta(minutes=1),
+        )
+
+        def event(description):
+            return {
+                "payload": {"id": 123, "description": description, "start": "2026-02-27T10:00:00Z"},
+                "metadata": {"action": "updated"},
+            }
+
+        # Stored row, guarded write, pending row (bump, read, claim), job insert
+        with self.assertNumQueries(6):
+            handle_time_entry_event(self.user, event("First"))
+        # While that job is queued: stored row, guarded write, bump
+        with self.assertNumQueries(3):
+            handle_time_entry_event(self.user, event("Second"))
+        self.assertEqual(PendingEntrySync.objects.get().requests, 2)
+
+    @patch("sync.scheduling.dispatch")
+    def test_debug_logging_resolves_names(self, mock_async):
+        payload = self._tagged_event()
+        with self.assertLogs("sync.webhooks", "DEBUG") as logs:
+            handle_time_entry_event(self.user, payload)
+        self.assertIn(
+            "Webhook entry 123 names: project:10(Proj) tags:[20(urgent), 21(?)]", logs.output[1]
+        )
+
+    @patch("sync.scheduling.dispatch")
     def test_unknown_action_ignored(self, mock_async):
         self._post("tok_abc", {"payload": {"id": 99}, "metadata": {"action": "unknown"}})
         mock_async.assert_not_called()
 
-    @patch("sync.views.async_task")
+    @patch("sync.scheduling.dispatch")
     def test_missing_id_ignored(self, mock_async):
         self._post("tok_abc", {"payload": {"description": "no id"}, "metadata": {"action": "created"}})
         mock_async.assert_not_called()
+
+
+@patch("sync.scheduling.dispatch")
+class WebhookOrderingTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("testuser", password="pass")
+
+    def _event(self, event_id, at, action="updated", description="Work"):
+        return {
+            "event_id": event_id,
+            "created_at": at,
+            "payload": {"id": 123, "description": description, "at": at,
+                        "start": "2026-02-27T10:00:00Z", "stop": "2026-02-27T11:00:00Z"},
+            "metadata": {"action": action},
+        }
+
+    def _entry(self):
+        return TogglTimeEntry.objects.get(user=self.user, toggl_id=123)
+
+    def _dropped(self):
+        counters = SyncMetric.snapshot()
+        return {name: counters[name] for name in (DUPLICATE, STALE) if name in counters}
+
+    def test_redelivered_event_dropped(self, mock_async):
+        event = self._event(1, "2026-02-27T11:00:00Z")
+        handle_time_entry_event(self.user, event)
+        TogglTimeEntry.objects.update(synced=True)
+
+        with patch("sync.webhooks.SyncMetric.incr") as incr, self.assertNumQueries(1):
+            handle_time_entry_event(self.user, event)
+        incr.assert_called_once_with(DUPLICATE)
+        self.assertTrue(self._entry().synced)
+        mock_async.assert_called_once()
+
+    def test_older_event_does_not_regress_entry(self, mock_async):
+        handle_time_entry_event(self.user, self._event(2, "2026-02-27T11:05:00Z", description="New"))
+        handle_time_entry_event(self.user, self._event(1, "2026-02-27T11:00:00Z", description="Old"))
+
+        entry = self._entry()
+        self.assertEqual(entry.description, "New")
+        self.assertEqual(entry.webhook_event_id, 2)
+        self.assertEqual(self._dropped(), {STALE: 1})
+
+    def test_newer_event_applied(self, mock_async):
+        handle_time_entry_event(self.user, self._event(1, "2026-02-27T11:00:00Z", description="Old"))
+        handle_time_entry_event(self.user, self._event(2, "2026-02-27T11:05:00Z", description="New"))
+        self.assertEqual(self._entry().description, "New")
+        self.assertEqual(self._dropped(), {})
+
+    def test_same_second_edits_under_new_event_ids_are_applied(self, mock_async):
+        at = "2026-02-27T11:00:00Z"
+        handle_time_entry_event(self.user, self._event(1, at, description="First"))
+        handle_time_entry_event(self.user, self._event(2, at, description="Second"))
+        self.assertEqual(self._entry().description, "Second")
+        handle_time_entry_event(self.user, self._event(3, at, action="deleted"))
+
+        entry = self._entry()
+        self.assertTrue(entry.pending_deletion)
+        self.assertEqual(entry.webhook_event_id, 3)
+        self.assertEqual(self._dropped(), {})
+
+    def test_late_update_after_delete_ignored(self, mock_async):
+        handle_time_entry_event(self.user, self._event(1, "2026-02-27T11:00:00Z", action="created"))
+        handle_time_entry_event(self.user, self._event(3, "2026-02-27T11:10:00Z", action="deleted"))
+        handle_time_entry_event(self.user, self._event(2, "2026-02-27T11:05:00Z"))
+        self.assertTrue(self._entry().pending_deletion)
+        self.assertEqual(self._dropped(), {STALE: 1})
+
+    def test_race_lost_between_check_and_write(self, mock_async):
+        handle_time_entry_event(self.user, self._event(1, "2026-02-27T11:00:00Z", description="Old"))
+
+        def check_then_race(*args):
+            reason = _drop_reason(*args)
+            # Another delivery stores a newer state right after our check
+            TogglTimeEntry.objects.update(toggl_updated_at=timezone.now(), description="Newest")
+            return reason
+
+        with patch("sync.webhooks._drop_reason", side_effect=check_then_race):
+            handle_time_entry_event(self.user, self._event(2, "2026-02-27T11:05:00Z", description="New"))
+        self.assertEqual(self._entry().description, "Newest")
+        self.assertEqual(self._dropped(), {STALE: 1})
+
+
+class WebhookTokenCacheTest(TestCase):
+    def setUp(self):
+        WebhookTokenCache.invalidate()
+        self.user = User.objects.create_user("testuser", password="pass")
+        self.ws = TogglWorkspace.objects.create(
+            user=self.user, toggl_id=1, name="WS", webhook_token="tok_abc",
+            webhook_secret="s3cret",
+        )
+
+    def test_resolve_caches_route(self):
+        route = WebhookTokenCache.resolve("tok_abc")
+        self.assertEqual(
+            (route.workspace_id, route.workspace_toggl_id, route.user_id, route.secret),
+            (self.ws.id, 1, self.user.id, "s3cret"),
+        )
+        self.assertEqual(route.user.username, "testuser")
+        with self.assertNumQueries(0):
+            self.assertEqual(WebhookTokenCache.resolve("tok_abc"), route)
+
+    def test_unknown_token_is_not_cached(self):
+        self.assertIsNone(WebhookTokenCache.resolve("nope"))
+        TogglWorkspace.objects.create(user=self.user, toggl_id=2, name="WS2", webhook_token="nope")
+        self.assertIsNotNone(WebhookTokenCache.resolve("nope"))
+
+    def test_expired_route_is_reloaded(self):
+        WebhookTokenCache.resolve("tok_abc")
+        TogglWorkspace.objects.filter(pk=self.ws.pk).update(webhook_secret="rotated")
+        with override_settings(WEBHOOK_TOKEN_CACHE_TTL=0), self.assertNumQueries(1):
+            self.assertEqual(WebhookTokenCache.resolve("tok_abc").secret, "rotated")
+
+    def test_workspace_save_invalidates(self):
+        WebhookTokenCache.resolve("tok_abc")
+        self.ws.webhook_secret = "rotated"
+        self.ws.save()
+        self.assertEqual(WebhookTokenCache.resolve("tok_abc").secret, "rotated")
+
+    def test_token_change_and_delete_invalidate(self):
+        WebhookTokenCache.resolve("tok_abc")
+        self.ws.webhook_token = "tok_new"
+        self.ws.save()
+        self.assertIsNone(WebhookTokenCache.resolve("tok_abc"))
+        self.assertIsNotNone(WebhookTokenCache.resolve("tok_new"))
+        self.ws.delete()
+        self.assertIsNone(WebhookTokenCache.resolve("tok_new"))
+
+    def test_least_recently_used_route_is_evicted(self):
+        TogglWorkspace.objects.create(user=self.user, toggl_id=2, name="WS2", webhook_token="tok_2")
+        TogglWorkspace.objects.create(user=self.user, toggl_id=3, name="WS3", webhook_token="tok_3")
+        with override_settings(WEBHOOK_TOKEN_CACHE_SIZE=2):
+            WebhookTokenCache.resolve("tok_abc")
+            WebhookTokenCache.resolve("tok_2")
+            WebhookTokenCache.resolve("tok_abc")
+            WebhookTokenCache.resolve("tok_3")
+            with self.assertNumQueries(0):
+                WebhookTokenCache.resolve("tok_abc")
+                WebhookTokenCache.resolve("tok_3")
+            with self.assertNumQueries(1):
+                WebhookTokenCache.resolve("tok_2")
+
+    def test_metadata_sync_invalidates_user_routes(self):
+        from sync.metadata import MetadataSync
+
+        WebhookTokenCache.resolve("tok_abc")
+        toggl = MagicMock()
+        toggl.get_workspaces.return_value = [{"id": 1, "name": "Renamed"}]
+        TogglWorkspace.objects.filter(pk=self.ws.pk).update(webhook_secret="rotated")
+        MetadataSync(self.user, toggl).sync_workspaces()
+        self.assertEqual(WebhookTokenCache.resolve("tok_abc").secret, "rotated")
+
+
+@override_settings(WEBHOOK_INGEST_MODE="inbox", WEBHOOK_INBOX_WAKE_INTERVAL=0)
+class WebhookInboxTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user("testuser", password="pass")
+        self.ws = TogglWorkspace.objects.create(
+            user=self.user, toggl_id=1, name="WS", webhook_token="tok_abc",
+        )
+        patcher = patch("sync.scheduling.dispatch")
+        self.sync_async = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _post(self, payload):
+        request = self.factory.post(
+            "/webhook/toggl/tok_abc/",
+            data=json.dumps(payload),
+            content_type="application/json",
+        )
+        return toggl_webhook(request, webhook_token="tok_abc")
+
+    def _event(self, entry_id, action="created", description="Work"):
+        return {
+            "payload": {"id": entry_id, "description": description,
+                        "start": "2026-02-27T10:00:00Z", "stop": "2026-02-27T11:00:00Z"},
+            "metadata": {"action": action},
+        }
+
+    @patch("sync.webhooks.async_task")
+    def test_view_only_appends_to_inbox(self, mock_async):
+        # workspace lookup + inbox insert
+        with self.assertNumQueries(2):
+            resp = self._post(self._event(123))
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(TogglTimeEntry.objects.exists())
+        item = WebhookInboxItem.objects.get()
+        self.assertEqual(json.loads(item.body)["payload"]["id"], 123)
+        mock_async.assert_called_once_with(
+            "sync.tasks.drain_webhook_inbox", task_name="drain_webhook_inbox"
+        )
+
+    @patch("sync.webhooks.async_task")
+    def test_cached_token_leaves_only_the_insert(self, mock_async):
+        self._post(self._event(123))
+        with self.assertNumQueries(1):
+            resp = self._post(self._event(124))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(WebhookInboxItem.objects.count(), 2)
+
+    @patch("sync.webhooks.async_task")
+    def test_ping_still_answered_synchronously(self, mock_async):
+        resp = self._post({"payload": "ping", "validation_code": "abc"})
+        self.assertEqual(json.loads(resp.content)["validation_code"], "abc")
+        self.assertFalse(WebhookInboxItem.objects.exists())
+
+    @patch("sync.webhooks.async_task")
+    def test_drain_applies_items_in_order(self, mock_async):
+        self._post(self._event(123, description="First"))
+        self._post(self._event(123, action="updated", description="Second"))
+        self._post(self._event(124))
+        mock_async.reset_mock()
+
+        self.assertEqual(drain_webhook_inbox(batch_size=2), 3)
+
+        self.assertEqual(TogglTimeEntry.objects.get(toggl_id=123).description, "Second")
+        self.assertTrue(TogglTimeEntry.objects.filter(toggl_id=124).exists())
+        self.assertFalse(WebhookInboxItem.objects.filter(processed_at__isnull=True).exists())
+        mock_async.assert_not_called()
+        # Two events for entry 123 collapse into one queued sync
+        self.assertEqual(
+            [c.args[1:] for c in self.sync_async.call_args_list],
+            [(self.user.id, 123), (self.user.id, 124)],
+        )
+        self.assertEqual(drain_webhook_inbox(), 0)
+
+    @patch("sync.webhooks.async_task")
+    def test_drain_records_failures_and_continues(self, mock_async):
+        WebhookInboxItem.objects.create(workspace=self.ws, body="not json")
+        self._post(self._event(125))
+        self.assertEqual(drain_webhook_inbox(), 2)
+        failed = WebhookInboxItem.objects.get(body="not json")
+        self.assertTrue(failed.error)
+        self.assertIsNone(failed.processed_at)
+        self.assertTrue(TogglTimeEntry.objects.filter(toggl_id=125).exists())
+
+    @override_settings(WEBHOOK_INBOX_MAX_ATTEMPTS=2)
+    @patch("sync.webhooks.async_task")
+    def test_failed_items_are_retried_then_kept(self, mock_async):
+        WebhookInboxItem.objects.create(workspace=self.ws, body="not json")
+        self.assertEqual(drain_webhook_inbox(), 1)
+        # Still leased: not retried straight away
+        self.assertEqual(drain_webhook_inbox(), 0)
+
+        expired = timezone.now() - timedelta(seconds=settings.Q_CLUSTER["retry"] + 1)
+        WebhookInboxItem.objects.update(claimed_at=expired)
+        self.assertEqual(drain_webhook_inbox(), 1)
+        WebhookInboxItem.objects.update(claimed_at=expired)
+        self.assertEqual(drain_webhook_inbox(), 0)
+
+        item = WebhookInboxItem.objects.get()
+        self.assertEqual((item.attempts, item.processed_at), (2, None))
+        self.assertTrue(item.error)
+
+    @patch("sync.webhooks.async_task")
+    def test_items_of_a_killed_drain_are_taken_over(self, mock_async):
+        self._post(self._event(126))
+        # A drain leased the item and died before handling it
+        WebhookInboxItem.objects.update(claimed_at=timezone.now(), attempts=1)
+        self.assertEqual(drain_webhook_inbox(), 0)
+        self.assertFalse(TogglTimeEntry.objects.exists())
+
+        WebhookInboxItem.objects.update(
+            claimed_at=timezone.now() - timedelta(seconds=settings.Q_CLUSTER["retry"] + 1)
+        )
+        self.assertEqual(drain_webhook_inbox(), 1)
+        self.assertTrue(TogglTimeEntry.objects.filter(toggl_id=126).exists())
+        self.assertIsNotNone(WebhookInboxItem.objects.get().processed_at)
+
+    @patch("sync.webhooks.async_task")
+    def test_drain_hands_over_when_budget_is_spent(self, mock_async):
+        self._post(self._event(127))
+        mock_async.reset_mock()
+
+        self.assertEqual(drain_webhook_inbox(budget=0), 0)
+
+        mock_async.assert_called_once_with(
+            "sync.tasks.drain_webhook_inbox", task_name="drain_webhook_inbox"
+        )
+        item = WebhookInboxItem.objects.get()
+        self.assertEqual((item.claimed_at, item.processed_at), (None, None))
+
+    @patch("sync.webhooks.async_task")
+    def test_drain_skips_rows_claimed_by_a_concurrent_drain(self, mock_async):
+        for i in range(3):
+            self._post(self._event(130 + i))
+        taken = WebhookInboxItem.objects.order_by("id")[1]
+        raced = []
+
+        def concurrent_claim(execute, sql, params, many, context):
+            # Another drain claims one selected row just before our claim
+            if not raced and sql.startswith("UPDATE") and "claimed_at" in sql:
+                raced.append(True)
+                WebhookInboxItem.objects.filter(id=taken.id).update(
+                    claimed_at=timezone.now() - timedelta(seconds=1), attempts=1
+                )
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(concurrent_claim):
+            self.assertEqual(drain_webhook_inbox(), 2)
+
+        self.assertEqual(
+            sorted(TogglTimeEntry.objects.values_list("toggl_id", flat=True)), [130, 132]
+        )
+
+    @override_settings(WEBHOOK_INBOX_WAKE_INTERVAL=60)
+    @patch("sync.utils.threading.Timer")
+    @patch("sync.webhooks.async_task")
+    def test_wake_up_is_rate_limited_with_a_trailing_wake(self, mock_async, mock_timer):
+        with patch.object(_inbox_waker, "_last", 0.0), patch.object(_inbox_waker, "_timer", None):
+            for i in range(5):
+                self._post(self._event(200 + i))
+            self.assertEqual(mock_async.call_count, 1)
+            self.assertEqual(WebhookInboxItem.objects.count(), 5)
+
+            # The suppressed wake-ups leave one drain queued at the end of the interval
+            mock_timer.assert_called_once()
+            delay, fire = mock_timer.call_args.args
+            self.assertAlmostEqual(delay, 60, delta=1)
+            with patch("sync.utils.connections"):
+                fire()
+        self.assertEqual(mock_async.call_count, 2)
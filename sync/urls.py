@@ -19,6 +19,11 @@ urlpatterns = [
 
     # Webhook endpoint with token for user identification
     path('webhook/toggl/<str:webhook_token>/', views.toggl_webhook, name='toggl_webhook'),
+    path(
+        'webhook/toggl/<str:webhook_token>/bulk/',
+        views.toggl_webhook_bulk,
+        name='toggl_webhook_bulk',
+    ),
 
     # Google OAuth endpoints
     path('oauth/google/start/', views.google_oauth_start, name='google_oauth_start'),
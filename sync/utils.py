@@ -1,8 +1,15 @@
 import hashlib
 import hmac
+import logging
+import threading
+import time
 from datetime import datetime
 
 from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
 
 def get_google_credentials():
     config = {
@@ -37,3 +44,66 @@ def verify_signature(payload: bytes, signature: str, secret: str) -> bool:
 
     return hmac.compare_digest(signature, expected)
 
+
+
+class Waker:
+    """Queue a consumer task at most once per interval per process, without dropping calls.
+
+    A call inside the interval queues nothing itself but arms one timer for
+    the end of the interval, so work stored just after the running task made
+    its final check is picked up within the interval instead of waiting for
+    the safety-net schedule. ``interval_setting`` names the setting to read.
+    Timers live only as long as the process, so callers keep a schedule as
+    the fallback.
+    """
+
+    def __init__(self, queue, interval_setting: str):
+        self.queue = queue
+        self.interval_setting = interval_setting
+        self._lock = threading.Lock()
+        self._last = 0.0
+        self._timer = None
+        self._timer_due = 0.0
+
+    def wake(self, force: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            due = self._last + getattr(settings, self.interval_setting)
+            if not force and now < due:
+                self._arm(due, now)
+                return
+            self._last = now
+        self.queue()
+
+    def wake_at(self, when: datetime):
+        """Queue a run at ``when`` from a timer in this process (now if it is past)."""
+        delay = (when - timezone.now()).total_seconds()
+        if delay <= 0:
+            self.wake()
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._arm(now + delay, now)
+
+    def _arm(self, due: float, now: float):
+        # Called with the lock held; one pending timer, the earliest, is enough
+        if self._timer is not None and self._timer_due <= due:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(due - now, self._fire)
+        self._timer.daemon = True
+        self._timer_due = due
+        self._timer.start()
+
+    def _fire(self):
+        with self._lock:
+            self._timer = None
+            self._last = time.monotonic()
+        try:
+            self.queue()
+        except Exception as e:
+            logger.warning(f"Deferred wake-up failed: {e}")
+        finally:
+            # The timer thread opened its own connection for the enqueue
+            connections.close_all()
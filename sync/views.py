@@ -1,20 +1,21 @@
 import json
 import logging
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import redirect, render
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from django_q.tasks import async_task
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 
-from .models import UserCredentials, TogglWorkspace, TogglTimeEntry, TogglProject, TogglTag
-from .services import GoogleCalendarService
-from .tasks import sync_toggl_metadata_for_user
-from .utils import get_google_credentials, verify_signature, parse_datetime
+from .models import UserCredentials, WebhookInboxItem
+from .services import CredentialCache, GoogleCalendarService
+from .tasks import ingest_webhook_events, sync_toggl_metadata_for_user
+from .utils import get_google_credentials, verify_signature
+from .webhooks import WebhookTokenCache, handle_time_entry_event, wake_inbox_consumer
 
 logger = logging.getLogger(__name__)
 
@@ -60,128 +61,85 @@ def terms_of_service(request):
 @csrf_exempt
 @require_POST
 def toggl_webhook(request, webhook_token: str):
-    workspace = TogglWorkspace.objects.filter(
-        webhook_token=webhook_token
-    ).first()
-    if not workspace:
+    route = WebhookTokenCache.resolve(webhook_token)
+    if route is None:
         logger.warning(f"Unknown webhook token: {webhook_token[:8]}...")
         return HttpResponse(status=404)
 
-    user = workspace.user
-
     try:
         payload = json.loads(request.body)
     except json.JSONDecodeError:
         logger.error("Invalid JSON in webhook payload")
         return HttpResponse(status=400)
 
-    if workspace.webhook_secret:
+    if route.secret:
         signature = request.headers.get("X-Webhook-Signature-256")
         if not verify_signature(
-            request.body, signature, workspace.webhook_secret
+            request.body, signature, route.secret
         ):
             logger.warning(
-                f"Invalid webhook signature for workspace {workspace.toggl_id}"
+                f"Invalid webhook signature for workspace {route.workspace_toggl_id}"
             )
             return HttpResponse(status=401)
 
-    inner_payload = payload.get("payload")
-    metadata = payload.get("metadata", {})
-
-    if inner_payload == "ping":
+    if payload.get("payload") == "ping":
         validation_code = payload.get("validation_code")
         logger.info(
-            f"Received PING from Toggl for workspace {workspace.toggl_id}, "
+            f"Received PING from Toggl for workspace {route.workspace_toggl_id}, "
             f"validation_code: {validation_code}"
         )
         if validation_code:
             return JsonResponse({"validation_code": validation_code})
         return JsonResponse({"status": "ok"})
 
-    if not isinstance(inner_payload, dict):
-        logger.warning(f"Unknown webhook format or non-dict payload: {payload}")
+    if settings.WEBHOOK_INGEST_MODE == "inbox":
+        WebhookInboxItem.objects.create(
+            workspace_id=route.workspace_id, body=request.body.decode("utf-8")
+        )
+        wake_inbox_consumer()
         return JsonResponse({"status": "ok"})
 
-    entry = inner_payload
-    event_type = metadata.get("action", "").lower()
-    entry_id = entry.get("id")
-
-    if not entry_id:
-        logger.warning("Time entry missing ID")
-        return JsonResponse({"status": "ok"})
+    handle_time_entry_event(route.user, payload)
+    return JsonResponse({"status": "ok"})
 
-    if event_type not in ("created", "updated", "deleted"):
-        logger.warning(f"Unknown event type: {event_type}")
-        return JsonResponse({"status": "ok"})
 
-    description = entry.get("description", "(no description)")
-    project_id = entry.get("project_id")
-    tag_ids = entry.get("tag_ids", [])
-
-    log_parts = [f"{event_type} entry {entry_id}"]
-    if description:
-        log_parts.append(f'"{description}"')
-    if project_id:
-        project = TogglProject.objects.filter(user=user, toggl_id=project_id).first()
-        project_str = f"project:{project_id}"
-        if project:
-            project_str += f"({project.name})"
-        log_parts.append(project_str)
-    if tag_ids:
-        tags = TogglTag.objects.filter(user=user, toggl_id__in=tag_ids)
-        tag_map = {t.toggl_id: t.name for t in tags}
-        tag_strs = [f"{tid}({tag_map.get(tid, '?')})" for tid in tag_ids]
-        log_parts.append(f"tags:[{', '.join(tag_strs)}]")
-
-    logger.info(f"Webhook from {user.username}: {' '.join(log_parts)}")
-
-    start_raw = entry.get("start")
-    stop_raw = entry.get("stop")
-    duration_raw = entry.get("duration")
-    logger.debug(
-        f"Webhook payload detail: entry={entry_id} "
-        f"start={start_raw} stop={stop_raw} duration={duration_raw}"
-    )
-
-    webhook_created_at = parse_datetime(payload.get("created_at"))
-
-    if event_type == "deleted":
-        TogglTimeEntry.objects.filter(user=user, toggl_id=entry_id).update(
-            pending_deletion=True,
-            synced=False
+@csrf_exempt
+@require_POST
+def toggl_webhook_bulk(request, webhook_token: str):
+    """Apply a batch of webhook events (JSON array or JSON lines) in one request.
+
+    The whole body must carry the workspace's webhook signature, so
+    workspaces without a secret cannot use it. Reads the stream directly:
+    batches are larger than DATA_UPLOAD_MAX_MEMORY_SIZE allows for body.
+    """
+    route = WebhookTokenCache.resolve(webhook_token)
+    if route is None:
+        logger.warning(f"Unknown webhook token: {webhook_token[:8]}...")
+        return HttpResponse(status=404)
+    if not route.secret:
+        logger.warning(
+            f"Bulk ingest refused for workspace {route.workspace_toggl_id}: no webhook secret"
         )
-    else:
-        start = parse_datetime(entry.get("start"))
-        end = parse_datetime(entry.get("stop"))
-        entry_exists = TogglTimeEntry.objects.filter(user=user, toggl_id=entry_id).exists()
-
-        defaults = {
-            "description": entry.get("description", ""),
-            "start_time": start,
-            "end_time": end,
-            "project_id": entry.get("project_id"),
-            "tag_ids": entry.get("tag_ids", []),
-            "synced": False,
-            "pending_deletion": False,
-        }
-
-        if not entry_exists and webhook_created_at:
-            defaults["created_at"] = webhook_created_at
-
-        TogglTimeEntry.objects.update_or_create(
-            user=user,
-            toggl_id=entry_id,
-            defaults=defaults
+        return HttpResponse(status=403)
+
+    body = request.read(settings.WEBHOOK_BULK_MAX_BYTES + 1)
+    if len(body) > settings.WEBHOOK_BULK_MAX_BYTES:
+        return HttpResponse(status=413)
+
+    signature = request.headers.get("X-Webhook-Signature-256")
+    if not signature or not verify_signature(body, signature, route.secret):
+        logger.warning(
+            f"Invalid bulk webhook signature for workspace {route.workspace_toggl_id}"
         )
+        return HttpResponse(status=401)
 
-    async_task(
-        "sync.tasks.process_time_entry_event",
-        user.id,
-        entry_id,
-        group=f"user_{user.id}_entry_{entry_id}",
-    )
+    try:
+        raw = body.decode("utf-8")
+    except UnicodeDecodeError:
+        return HttpResponse(status=400)
 
-    return JsonResponse({"status": "ok"})
+    stats = ingest_webhook_events(route.user, raw, [route.secret])
+    return JsonResponse({"status": "ok", **stats.as_dict()})
 
 
 @login_required
@@ -287,7 +245,11 @@ def google_oauth_disconnect(request):
         creds = request.user.credentials
         creds.gauth_credentials_json = ""
         creds.google_calendar_id = ""
-        creds.save(update_fields=["gauth_credentials_json", "google_calendar_id", "updated_at"])
+        creds.google_sync_token = ""
+        creds.save(update_fields=[
+            "gauth_credentials_json", "google_calendar_id", "google_sync_token", "updated_at",
+        ])
+        CredentialCache.invalidate(request.user.pk)
         logger.info(
             f"Google Calendar disconnected for user {request.user.username}"
         )
@@ -325,7 +287,8 @@ def refresh_calendar(request):
     try:
         gcal = GoogleCalendarService(user=request.user)
         creds.google_calendar_id = ""
-        creds.save(update_fields=["google_calendar_id", "updated_at"])
+        creds.google_sync_token = ""
+        creds.save(update_fields=["google_calendar_id", "google_sync_token", "updated_at"])
 
         calendar_id = gcal.ensure_toggl_calendar()
         messages.success(request, f"Toggl calendar refreshed: {calendar_id}")
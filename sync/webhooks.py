@@ -0,0 +1,303 @@
+"""Time-entry webhook handling, shared by the inline view and the inbox consumer."""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django_q.tasks import async_task
+
+from .models import SyncMetric, TogglProject, TogglTag, TogglTimeEntry, TogglWorkspace
+from .scheduling import request_entry_sync
+from .utils import Waker, parse_datetime
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookRoute(NamedTuple):
+    """What a webhook request needs to know about its workspace."""
+
+    workspace_id: int
+    workspace_toggl_id: int
+    user_id: int
+    username: str
+    secret: str | None
+
+    @property
+    def user(self) -> User:
+        # Unsaved stand-in: enough for user= filters and log lines
+        return User(id=self.user_id, username=self.username)
+
+
+class WebhookTokenCache:
+    """LRU of webhook token -> WebhookRoute, shared by a process's threads.
+
+    Lets webhook requests verify the signature and hand off without any
+    query. Saves and deletes of a workspace drop its entries (see
+    sync.signals); WEBHOOK_TOKEN_CACHE_TTL bounds how long changes made in
+    another process go unnoticed. A size of 0 disables caching.
+    """
+
+    _routes = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def resolve(cls, token: str) -> WebhookRoute | None:
+        now = time.monotonic()
+        with cls._lock:
+            cached = cls._routes.get(token)
+            if cached and now - cached[0] < settings.WEBHOOK_TOKEN_CACHE_TTL:
+                cls._routes.move_to_end(token)
+                return cached[1]
+
+        row = TogglWorkspace.objects.filter(webhook_token=token).values_list(
+            "id", "toggl_id", "user_id", "user__username", "webhook_secret"
+        ).first()
+        if row is None:
+            return None
+
+        route = WebhookRoute(*row)
+        with cls._lock:
+            cls._routes[token] = (now, route)
+            cls._routes.move_to_end(token)
+            while len(cls._routes) > settings.WEBHOOK_TOKEN_CACHE_SIZE:
+                cls._routes.popitem(last=False)
+        return route
+
+    @classmethod
+    def invalidate(
+        cls, workspace_id: int | None = None, user_id: int | None = None, token: str | None = None,
+    ):
+        """Drop the routes of a workspace, a user or a token, or all of them."""
+        with cls._lock:
+            if workspace_id is None and user_id is None and token is None:
+                cls._routes.clear()
+                return
+            stale = [
+                cached_token for cached_token, (_, route) in cls._routes.items()
+                if cached_token == token
+                or route.workspace_id == workspace_id
+                or route.user_id == user_id
+            ]
+            for cached_token in stale:
+                del cls._routes[cached_token]
+
+
+# SyncMetric counters for webhook events that were not applied
+DUPLICATE = "webhook_duplicate_dropped"
+STALE = "webhook_stale_dropped"
+
+
+def _event_id(payload: dict) -> int | None:
+    try:
+        return int(payload["event_id"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _event_version(payload: dict, entry: dict):
+    """When the entry reached the state in ``entry``, per Toggl.
+
+    ``at`` is the entry's last modification; the event's ``created_at`` is
+    the fallback for payloads without one.
+    """
+    return parse_datetime(entry.get("at")) or parse_datetime(payload.get("created_at"))
+
+
+def _drop_reason(stored, event_id, version) -> str | None:
+    """Compare an event with the stored (version, event id) of its entry.
+
+    Only a redelivery (same event id) or a strictly older version is
+    dropped: ``at`` has one-second resolution, so a new event with the
+    stored version is a separate edit (or a delete) in the same second.
+    """
+    if stored is None:
+        return None
+    stored_version, stored_event_id = stored
+    if event_id is not None and event_id == stored_event_id:
+        return DUPLICATE
+    if version is None or stored_version is None:
+        return None
+    if version < stored_version:
+        return STALE
+    return None
+
+
+class _EntityNames:
+    """Log argument naming an entry's project and tags when formatted."""
+
+    def __init__(self, user, project_id, tag_ids):
+        self.user = user
+        self.project_id = project_id
+        self.tag_ids = tag_ids
+
+    def __str__(self):
+        parts = []
+        if self.project_id:
+            project = TogglProject.objects.filter(
+                user=self.user, toggl_id=self.project_id
+            ).values_list("name", flat=True).first()
+            parts.append(f"project:{self.project_id}({project or '?'})")
+        if self.tag_ids:
+            tag_map = dict(
+                TogglTag.objects.filter(
+                    user=self.user, toggl_id__in=self.tag_ids
+                ).values_list("toggl_id", "name")
+            )
+            tag_strs = [f"{tid}({tag_map.get(tid, '?')})" for tid in self.tag_ids]
+            parts.append(f"tags:[{', '.join(tag_strs)}]")
+        return " ".join(parts)
+
+
+def handle_time_entry_event(user, payload: dict):
+    """Upsert the entry a webhook describes and queue its calendar sync.
+
+    Toggl delivers at least once and not necessarily in order. A
+    redelivery (event id already applied) or an event whose entry version
+    (``at``) is strictly older than the stored one is dropped before any
+    write or enqueue; one with the same ``at`` is applied (see _drop_reason).
+    """
+    inner_payload = payload.get("payload")
+    metadata = payload.get("metadata", {})
+
+    if not isinstance(inner_payload, dict):
+        logger.warning(f"Unknown webhook format or non-dict payload: {payload}")
+        return
+
+    entry = inner_payload
+    event_type = metadata.get("action", "").lower()
+    entry_id = entry.get("id")
+
+    if not entry_id:
+        logger.warning("Time entry missing ID")
+        return
+
+    if event_type not in ("created", "updated", "deleted"):
+        logger.warning(f"Unknown event type: {event_type}")
+        return
+
+    event_id = _event_id(payload)
+    version = _event_version(payload, entry)
+    entries = TogglTimeEntry.objects.filter(user=user, toggl_id=entry_id)
+    stored = entries.values_list("toggl_updated_at", "webhook_event_id").first()
+    reason = _drop_reason(stored, event_id, version)
+    if reason:
+        SyncMetric.incr(reason)
+        logger.info(
+            f"Dropped {'duplicate' if reason == DUPLICATE else 'stale'} {event_type} "
+            f"event {event_id} for entry {entry_id} (version {version})"
+        )
+        return
+
+    description = entry.get("description", "(no description)")
+    project_id = entry.get("project_id")
+    tag_ids = entry.get("tag_ids") or []
+
+    log_parts = [f"{event_type} entry {entry_id}"]
+    if description:
+        log_parts.append(f'"{description}"')
+    if project_id:
+        log_parts.append(f"project:{project_id}")
+    if tag_ids:
+        log_parts.append(f"tags:{tag_ids}")
+
+    logger.info(
+        f"Webhook from {user.username}: {' '.join(log_parts)}",
+        extra={
+            "toggl_entry_id": entry_id,
+            "toggl_project_id": project_id,
+            "toggl_tag_ids": tag_ids,
+            "webhook_action": event_type,
+        },
+    )
+    if project_id or tag_ids:
+        # Rendered, and its lookups run, only if a handler emits DEBUG
+        logger.debug(
+            "Webhook entry %s names: %s", entry_id, _EntityNames(user, project_id, tag_ids)
+        )
+
+    start_raw = entry.get("start")
+    stop_raw = entry.get("stop")
+    duration_raw = entry.get("duration")
+    logger.debug(
+        f"Webhook payload detail: entry={entry_id} "
+        f"start={start_raw} stop={stop_raw} duration={duration_raw}"
+    )
+
+    fields = {
+        "synced": False,
+        "toggl_updated_at": version,
+        "webhook_event_id": event_id,
+        # queryset updates skip auto_now; the sync's optimistic check needs it
+        "updated_at": timezone.now(),
+    }
+    if event_type == "deleted":
+        fields["pending_deletion"] = True
+    else:
+        fields.update({
+            "description": entry.get("description", ""),
+            "start_time": parse_datetime(entry.get("start")),
+            "end_time": parse_datetime(entry.get("stop")),
+            "project_id": entry.get("project_id"),
+            "tag_ids": entry.get("tag_ids", []),
+            "pending_deletion": False,
+        })
+
+    if stored is not None or event_type == "deleted":
+        if not _apply_if_newer(entries, version, event_id, fields):
+            SyncMetric.incr(STALE)
+            logger.info(f"Dropped stale {event_type} event {event_id} for entry {entry_id}")
+            return
+    else:
+        webhook_created_at = parse_datetime(payload.get("created_at"))
+        if webhook_created_at:
+            fields["created_at"] = webhook_created_at
+        try:
+            with transaction.atomic():
+                TogglTimeEntry.objects.create(user=user, toggl_id=entry_id, **fields)
+        except IntegrityError:
+            # A concurrent delivery created it first
+            fields.pop("created_at", None)
+            if not _apply_if_newer(entries, version, event_id, fields):
+                SyncMetric.incr(STALE)
+                return
+
+    request_entry_sync(user.id, entry_id)
+
+
+def _apply_if_newer(entries, version, event_id, fields) -> bool:
+    """Update the entry unless a newer version or this event was stored meanwhile.
+
+    Deletes of unknown entries count as applied, as before.
+    """
+    guarded = entries
+    if version is not None:
+        guarded = guarded.filter(
+            Q(toggl_updated_at__isnull=True) | Q(toggl_updated_at__lte=version)
+        )
+    if event_id is not None:
+        guarded = guarded.exclude(webhook_event_id=event_id)
+    return bool(guarded.update(**fields)) or not entries.exists()
+
+
+def _queue_inbox_drain():
+    async_task("sync.tasks.drain_webhook_inbox", task_name="drain_webhook_inbox")
+
+
+_inbox_waker = Waker(_queue_inbox_drain, "WEBHOOK_INBOX_WAKE_INTERVAL")
+
+
+def wake_inbox_consumer(force: bool = False):
+    """Queue an inbox drain, at most once per WEBHOOK_INBOX_WAKE_INTERVAL.
+
+    Under load most webhook requests skip the enqueue; a drain picks up
+    everything appended since the previous one, and a suppressed wake-up
+    queues one more drain at the end of the interval.
+    """
+    _inbox_waker.wake(force=force)